@@ -3,19 +3,69 @@ This module creates a database connection for other scripts to use.
 
 The connection is configured in the private.cnf function. See public.cnf for an
 example configuration.
+
+Connections taken with getConnection are given back with release and kept open for
+the next getConnection of the same process, so that scripts which query the
+database often, such as nsdb.py, don't connect to the server each time. A kept
+connection is pinged when it is taken again and reconnected if the server dropped
+it.
+
+The scripts connect to the MySQL server unless the NSDB_DATABASE environment
+variable is set to sqlite:PATH, in which case they use the embedded SQLite database
+at PATH through sqliteDatabase. The SQLite connection takes the same queries, so a
+whole pipeline can be run on one machine, or tested, without a server.
 """
+import os
+import sqlite3
+from typing import Tuple
 
 import mysql.connector as sql
 
+import sqliteDatabase
+
+# number of idle connections each process keeps
+poolSize = 4
+
+# idle connections of the process poolProcess
+idleConnections = []
+poolProcess = None
+
+# errors of a kept connection after which it is closed
+connectionErrors = (sql.Error, sqlite3.Error, OSError)
+
+
+def getBackend() -> Tuple[str, str]:
+    """Returns the database set by the NSDB_DATABASE environment variable, mysql or
+    sqlite, and the path of a SQLite database"""
+    backend, _, path = os.environ.get("NSDB_DATABASE", "mysql").partition(":")
+
+    if backend == "sqlite":
+        return backend, path or "../nsdb.sqlite"
+    if backend == "mysql":
+        return backend, ""
 
-def connect():
-    """Connect to MySQL database using password stored in options file
+    raise ValueError("Unknown database %s, expected mysql or sqlite:PATH" % backend)
+
+
+def connect(localInfile: bool = False, autocommit: bool = True):
+    """Connect to MySQL database using password stored in options file, or to the
+    SQLite database set by NSDB_DATABASE
+
+    Parameters
+    ----------
+    localInfile: bool - allow LOAD DATA LOCAL INFILE, which the server must allow too
+    autocommit: bool - commit each statement, otherwise the caller commits
 
     Returns
     -------
     database: MySQLConnection - connection to the MySQL DB
     cursor: MySQLCursor - cursor allowing CRUD actions on the DB connections
     """
+    backend, path = getBackend()
+    if backend == "sqlite":
+        database = sqliteDatabase.connect(path, autocommit=autocommit)
+        return database, database.cursor()
+
     try:
         database = sql.connect(
             host="wikiactors.cs.virginia.edu",
@@ -23,7 +73,8 @@ def connect():
             username="wikiactors",
             option_files="private.cnf",
             option_groups="wikiactors",
-            autocommit="true",
+            autocommit=autocommit,
+            allow_local_infile=localInfile,
         )
 
         cursor = database.cursor()
@@ -40,5 +91,56 @@ def connect():
         return database, cursor
 
 
+def getConnection(autocommit: bool = True):
+    """Returns a kept connection if there is one, otherwise connects
+
+    Parameters
+    ----------
+    autocommit: bool - commit each statement, otherwise the caller commits
+
+    Returns
+    -------
+    database: MySQLConnection - connection to the MySQL DB
+    cursor: MySQLCursor - cursor allowing CRUD actions on the DB connections
+    """
+    global poolProcess
+
+    if poolProcess != os.getpid():
+        # a process started by fork can't use the connections of its parent
+        idleConnections.clear()
+        poolProcess = os.getpid()
+
+    while idleConnections:
+        database = idleConnections.pop()
+        try:
+            database.ping(reconnect=True, attempts=2, delay=1)
+        except connectionErrors:
+            continue
+
+        database.autocommit = autocommit
+        return database, database.cursor()
+
+    return connect(autocommit=autocommit)
+
+
+def release(database, cursor=None):
+    """Keeps a connection from getConnection open for the next one, closing it if
+    enough are kept. Uncommitted changes are rolled back."""
+    try:
+        if cursor is not None:
+            cursor.close()
+
+        if database.in_transaction:
+            database.rollback()
+    except connectionErrors:
+        database.close()
+        return
+
+    if poolProcess == os.getpid() and len(idleConnections) < poolSize:
+        idleConnections.append(database)
+    else:
+        database.close()
+
+
 if __name__ == "__main__":
     connect()
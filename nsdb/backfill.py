@@ -0,0 +1,271 @@
+"""
+This script fills in columns of the edit table from the added and deleted text of
+each edit, so that features added after a dump was parsed don't need it to be
+parsed again.
+
+The features are those registered in features.py that only need the text of the
+diff. Missing columns are added to the edit table with the definition of their
+feature. Edits are read in ranges of ids, their features are computed by a pool of
+processes and each range is written to a staging table that is joined with the
+edit table in one UPDATE.
+
+The last id of each finished range is recorded in the backfill table, so an
+interrupted run resumes with the range after it.
+
+This tool uses a MySQL database that is configured in the Database() module.
+"""
+import argparse
+import multiprocessing
+import time
+from collections import deque
+from typing import List, Tuple
+
+from tqdm import tqdm
+
+import Database
+import features
+
+
+def selectBackfillFeatures(names: List[str]) -> List[features.Feature]:
+    """Returns the registered features with the given names or columns, which must
+    not need the comment of an edit as it is not stored"""
+    selected = features.selectFeatures(names)
+
+    stored = [feature.name for feature in selected if "comment" in feature.inputs]
+    if stored:
+        raise ValueError(
+            "Features computed from comments can't be backfilled: %s"
+            % ", ".join(stored)
+        )
+
+    return selected
+
+
+def addColumns(cursor, selected: List[features.Feature]):
+    """Adds the columns of the features that the edit table doesn't have yet"""
+    query = """SELECT column_name FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = 'edit';"""
+    cursor.execute(query)
+    existing = {column.lower() for column, in cursor.fetchall()}
+
+    for feature in selected:
+        if feature.column in existing:
+            continue
+
+        if not feature.definition:
+            raise ValueError("No definition for column %s" % feature.column)
+
+        print("Adding column %s" % feature.column)
+        cursor.execute(
+            "ALTER TABLE edit ADD COLUMN %s %s;" % (feature.column, feature.definition)
+        )
+
+
+def createStagingTable(cursor, selected: List[features.Feature]):
+    """Creates the temporary table that the values of a range are written to"""
+    columns = ", ".join(
+        "%s %s" % (feature.column, feature.definition or "text") for feature in selected
+    )
+
+    cursor.execute("DROP TEMPORARY TABLE IF EXISTS backfill_staging;")
+    cursor.execute("""CREATE TEMPORARY TABLE backfill_staging (
+            id int unsigned NOT NULL, %s, PRIMARY KEY (id)
+        );""" % columns)
+
+
+def getCheckpoint(cursor, job: str) -> int:
+    """Returns the last id of the edits the job has finished, 0 if it hasn't
+    started"""
+    query = """CREATE TABLE IF NOT EXISTS backfill (
+            job varchar(255) NOT NULL,
+            last_id int unsigned NOT NULL DEFAULT '0',
+            updated timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP
+                ON UPDATE CURRENT_TIMESTAMP,
+            PRIMARY KEY (job)
+        );"""
+    cursor.execute(query)
+
+    cursor.execute("SELECT last_id FROM backfill WHERE job = %s;", (job,))
+    row = cursor.fetchone()
+
+    return row[0] if row else 0
+
+
+def setCheckpoint(cursor, job: str, lastId: int):
+    """Records that the job has finished the edits up to lastId"""
+    query = """INSERT INTO backfill (job, last_id) VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE last_id = %s;"""
+    cursor.execute(query, (job, lastId, lastId))
+
+
+def computeRows(
+    rows: List[Tuple[int, str, str, int]], selected: List[features.Feature]
+) -> List[tuple]:
+    """Returns the id of each edit with the values of the selected features, which
+    are NULL for blanked edits"""
+    values = []
+    for editId, added, deleted, blanking in rows:
+        if blanking:
+            values.append((editId,) + (None,) * len(selected))
+        else:
+            text = features.EditText(added or "", deleted or "")
+            values.append((editId,) + features.computeFeatures(selected, text))
+
+    return values
+
+
+def writeRange(
+    cursor, selected: List[features.Feature], values: List[tuple], job: str, last: int
+):
+    """Writes the values of a range of edits through the staging table and records
+    the range as finished"""
+    columns = [feature.column for feature in selected]
+
+    cursor.execute("DELETE FROM backfill_staging;")
+
+    if values:
+        query = "INSERT INTO backfill_staging (id, %s) VALUES (%s);" % (
+            ", ".join(columns),
+            ", ".join(["%s"] * (len(columns) + 1)),
+        )
+        cursor.executemany(query, values)
+
+        query = """UPDATE edit
+            JOIN backfill_staging ON edit.id = backfill_staging.id
+            SET %s;""" % ", ".join(
+            "edit.%s = backfill_staging.%s" % (column, column) for column in columns
+        )
+        cursor.execute(query)
+
+    setCheckpoint(cursor, job, last)
+
+
+def backfill(
+    featureNames: List[str],
+    chunkSize: int = 10000,
+    workers: int = 1,
+    restart: bool = False,
+):
+    """Computes features of the edits that the backfill hasn't reached yet
+
+    Parameters
+    ----------
+    featureNames: List[str] - names or columns of the features to fill in
+    chunkSize: int - number of ids read, computed and written together
+    workers: int - number of processes computing features
+    restart: bool - start again from the first edit
+    """
+    selected = selectBackfillFeatures(featureNames)
+    job = ",".join(feature.column for feature in selected)
+
+    database, cursor = Database.connect()
+
+    addColumns(cursor, selected)
+    createStagingTable(cursor, selected)
+
+    start = 0 if restart else getCheckpoint(cursor, job)
+
+    cursor.execute("SELECT MAX(id) FROM edit;")
+    end = cursor.fetchone()[0] or 0
+
+    print("Backfilling %s for ids %d to %d" % (job, start + 1, end))
+
+    query = """SELECT id, added, deleted, blanking FROM edit
+        WHERE id > %s AND id <= %s;"""
+
+    pool = multiprocessing.Pool(workers)
+
+    # ranges being computed, at most two per worker so only those are held in memory
+    pending = deque()
+    computed = 0
+    startTime = time.time()
+
+    try:
+        with tqdm(total=end - start, unit=" ids", smoothing=0) as progress:
+            for first in range(start, end, chunkSize):
+                last = min(first + chunkSize, end)
+
+                cursor.execute(query, (first, last))
+                rows = cursor.fetchall()
+
+                result = pool.apply_async(computeRows, (rows, selected))
+                pending.append((result, first, last))
+
+                while len(pending) > 2 * workers or (pending and last == end):
+                    result, rangeFirst, rangeLast = pending.popleft()
+                    values = result.get()
+
+                    writeRange(cursor, selected, values, job, rangeLast)
+
+                    computed += len(values)
+                    progress.update(rangeLast - rangeFirst)
+    finally:
+        pool.terminate()
+        pool.join()
+
+        elapsed = time.time() - startTime
+        print(
+            "Backfilled %d edits in %.1f s, %.0f edits/s"
+            % (computed, elapsed, computed / elapsed if elapsed else 0)
+        )
+
+        cursor.close()
+        database.close()
+
+
+def defineArgParser():
+    """Creates parser for command line arguments"""
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+
+    parser.add_argument(
+        "-f",
+        "--features",
+        help="Features to fill in, by name or column",
+        choices=list(
+            dict.fromkeys(
+                [feature.name for feature in features.registry]
+                + [feature.column for feature in features.registry]
+            )
+        ),
+        metavar="FEATURE",
+        nargs="+",
+        required=True,
+    )
+
+    parser.add_argument(
+        "-c",
+        "--chunkSize",
+        help="Number of ids read, computed and written together [default: 10000]",
+        default=10000,
+        type=int,
+    )
+
+    parser.add_argument(
+        "-w",
+        "--workers",
+        help="Number of processes computing features [default: number of cores]",
+        default=multiprocessing.cpu_count(),
+        type=int,
+    )
+
+    parser.add_argument(
+        "--restart",
+        help="Start again from the first edit instead of the last checkpoint",
+        action="store_true",
+    )
+
+    return parser
+
+
+if __name__ == "__main__":
+    argParser = defineArgParser()
+    clArgs = argParser.parse_args()
+
+    backfill(
+        featureNames=clArgs.features,
+        chunkSize=clArgs.chunkSize,
+        workers=clArgs.workers,
+        restart=clArgs.restart,
+    )
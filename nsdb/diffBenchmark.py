@@ -0,0 +1,576 @@
+"""
+This script benchmarks the diff backends used by parse.py and checks that they give
+the same results as wdiff.
+
+Each backend replays the talk page histories in fixtures/, which were written by
+hand in the format of a dump and are not recorded from Wikipedia, along with a set
+of generated worst cases (a page of over a megabyte, blanking vandalism, revert wars,
+unicode heavy text and edits spread over many lines). The number of revisions and
+megabytes of revision text diffed per second is reported for each backend.
+
+The words added and deleted by each diff, and the features parse.getDiffFeatures
+derives from them, are compared against a reference backend: wdiff when it is
+installed and otherwise the plain word level diff. Every other backend is built on
+the same difflib matcher as the plain word level diff, so without wdiff the
+comparison only checks the window and hunk splitting and not the word diff itself.
+The diffs of the fixtures are therefore also compared against the reference stored
+in fixtures/reference.json, which --writeReference writes with wdiff or, when it
+isn't installed, with a minimal word diff from the longest common subsequence of
+the words, as wdiff gets from diff. The stored reference records which of the two
+wrote it. test_wordDiff.py checks the word diff against known diffs and the stored
+reference. A diff matches the reference when
+
+    * the multisets of added and deleted words each differ from the reference by
+      at most --wordTolerance of the words in the reference or by one word,
+      whichever is larger, as diff algorithms may align repeated words differently,
+      and
+    * every ratio is within --featureTolerance of the reference and every count is
+      within --featureTolerance of the reference count or within one of it,
+      whichever is larger, as moving a single word such as "([[User" from one side
+      of a signature to the other changes the counts by one. The added and deleted
+      text and their lengths follow from the words and are not compared again.
+
+The script exits with a non-zero status if any diff does not match.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+from glob import glob
+from typing import Callable, Dict, List, Tuple
+
+import mwxml
+
+import features
+import parse
+import wordDiff
+
+featureNames = [
+    feature.name for feature in features.splitFeatures(features.selectFeatures())[0]
+]
+
+
+def loadFixtures(fixturesDir: str) -> List[Tuple[str, List[str]]]:
+    """Returns the text of every revision of the pages in the dumps in fixturesDir
+
+    Blank revisions are skipped as parse.py does not diff them.
+    """
+    histories = []
+    for path in sorted(glob(os.path.join(fixturesDir, "*.xml"))):
+        dump = mwxml.Dump.from_file(open(path, encoding="utf-8"))
+        for page in dump:
+            texts = [revision.text for revision in page if revision.text]
+            histories.append((page.title, texts))
+
+    return histories
+
+
+def loadReference(path: str) -> Tuple[str, Dict[str, List[wordDiff.Diff]]]:
+    """Returns the backend that wrote the stored reference at path and the diffs of
+    each revision of the fixtures by page title"""
+    with open(path, encoding="utf-8") as file:
+        stored = json.load(file)
+
+    diffs = {
+        title: [
+            wordDiff.Diff(
+                diff["added"],
+                diff["deleted"],
+                diff["added"].split(),
+                diff["deleted"].split(),
+            )
+            for diff in pageDiffs
+        ]
+        for title, pageDiffs in stored["pages"].items()
+    }
+
+    return stored["backend"], diffs
+
+
+def writeReference(
+    path: str,
+    backendName: str,
+    histories: List[Tuple[str, List[str]]],
+    results: List[List[wordDiff.Diff]],
+):
+    """Stores the added and deleted text of the diffs of the fixtures at path"""
+    stored = {
+        "backend": backendName,
+        "pages": {
+            title: [{"added": diff.added, "deleted": diff.deleted} for diff in diffs]
+            for (title, _), diffs in zip(histories, results)
+        },
+    }
+
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(stored, file, ensure_ascii=False, indent=1)
+        file.write("\n")
+
+
+def randomWords(rng: random.Random, alphabet: str, count: int) -> str:
+    """Returns count random words made from the characters in alphabet"""
+    return " ".join(
+        "".join(rng.choice(alphabet) for _ in range(rng.randint(1, 10)))
+        for _ in range(count)
+    )
+
+
+def comment(rng: random.Random, alphabet: str, number: int) -> str:
+    """Returns a signed talk page comment"""
+    return "\n%s ~~[[User:Editor%d|Editor%d]] ([[User talk:Editor%d|talk]])\n" % (
+        randomWords(rng, alphabet, rng.randint(5, 80)),
+        number,
+        number,
+        number,
+    )
+
+
+def syntheticHistories(scale: float, seed: int) -> List[Tuple[str, List[str]]]:
+    """Returns histories that exercise the edge cases of the diff backends
+
+    Parameters
+    ----------
+    scale: float - Multiplies the size of every history
+    seed: int - Seed of the random number generator
+    """
+    rng = random.Random(seed)
+    latin = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJ0123456789'[]{}|:.,!?"
+    unicode = "東京都日本語の記事ノートпримерстатьяمقالةنقاشαβγδε😀🎉ß€"
+
+    histories = []
+
+    # a page of over a megabyte where most edits append a comment at the end, a
+    # few reply in the middle and one archives the first half
+    comments = [comment(rng, latin, i % 50) for i in range(int(4000 * scale))]
+    texts = ["".join(comments)]
+    for i in range(int(20 * scale)):
+        lines = texts[-1].split("\n")
+        if i % 10 == 5:
+            position = rng.randrange(len(lines))
+            lines.insert(position, comment(rng, latin, i))
+        elif i % 10 == 9:
+            for _ in range(20):
+                position = rng.randrange(len(lines))
+                lines[position] = randomWords(rng, latin, 10)
+        else:
+            lines.append(comment(rng, latin, i))
+        texts.append("\n".join(lines))
+    texts.append(texts[-1][len(texts[-1]) // 2 :])
+    histories.append(("Synthetic giant page", texts))
+
+    # blanking vandalism and its revert, parse.py skips the blank revisions
+    page = "".join(comment(rng, latin, i) for i in range(int(200 * scale)))
+    texts = []
+    for i in range(int(10 * scale)):
+        texts.append(page)
+        texts.append(randomWords(rng, latin, 3))
+        page += comment(rng, latin, i)
+    histories.append(("Synthetic blanking", texts))
+
+    # a revert war between two versions of the page
+    page = "".join(comment(rng, latin, i) for i in range(int(300 * scale)))
+    versions = [page + comment(rng, latin, 1), page + comment(rng, latin, 2)]
+    texts = [versions[i % 2] for i in range(int(30 * scale))]
+    histories.append(("Synthetic revert war", texts))
+
+    # text in several scripts with emoji, appended to and edited in place
+    texts = ["".join(comment(rng, unicode, i) for i in range(int(200 * scale)))]
+    for i in range(int(30 * scale)):
+        text = texts[-1]
+        position = rng.randrange(len(text))
+        texts.append(text[:position] + randomWords(rng, unicode, 5) + text[position:])
+    histories.append(("Synthetic unicode", texts))
+
+    return histories
+
+
+def wdiffBackend(tempDir: str) -> Callable[[str, str], wordDiff.Diff]:
+    """Returns a backend that runs wdiff on files in tempDir"""
+    oldFile = os.path.join(tempDir, "old.txt")
+    newFile = os.path.join(tempDir, "new.txt")
+
+    def diff(old: str, new: str) -> wordDiff.Diff:
+        with open(oldFile, "w") as file:
+            file.write(old)
+        with open(newFile, "w") as file:
+            file.write(new)
+
+        added, deleted = parse.runWdiff(oldFile, newFile)
+
+        return wordDiff.Diff(added, deleted, added.split(), deleted.split())
+
+    return diff
+
+
+def minimalDiff(old: str, new: str) -> wordDiff.Diff:
+    """Returns the diff with the fewest added and deleted words, which is what wdiff
+    gets from diff, from the longest common subsequence of the words of old and new
+
+    Takes time proportional to the product of the number of words between the
+    common prefix and suffix, so it is only used to store the reference of the
+    fixtures when wdiff is not installed.
+    """
+    oldWords = old.split()
+    newWords = new.split()
+
+    prefix = 0
+    while (
+        prefix < min(len(oldWords), len(newWords))
+        and oldWords[prefix] == newWords[prefix]
+    ):
+        prefix += 1
+    suffix = 0
+    while (
+        suffix < min(len(oldWords), len(newWords)) - prefix
+        and oldWords[-suffix - 1] == newWords[-suffix - 1]
+    ):
+        suffix += 1
+    oldWords = oldWords[prefix : len(oldWords) - suffix]
+    newWords = newWords[prefix : len(newWords) - suffix]
+
+    # lengths[i][j] is the length of the longest common subsequence of
+    # oldWords[i:] and newWords[j:]
+    lengths = [[0] * (len(newWords) + 1) for _ in range(len(oldWords) + 1)]
+    for i in reversed(range(len(oldWords))):
+        for j in reversed(range(len(newWords))):
+            if oldWords[i] == newWords[j]:
+                lengths[i][j] = lengths[i + 1][j + 1] + 1
+            else:
+                lengths[i][j] = max(lengths[i + 1][j], lengths[i][j + 1])
+
+    added = []
+    deleted = []
+    i = j = 0
+    while i < len(oldWords) and j < len(newWords):
+        if oldWords[i] == newWords[j]:
+            i += 1
+            j += 1
+        elif lengths[i + 1][j] >= lengths[i][j + 1]:
+            deleted.append(oldWords[i])
+            i += 1
+        else:
+            added.append(newWords[j])
+            j += 1
+    deleted += oldWords[i:]
+    added += newWords[j:]
+
+    return wordDiff.Diff(" ".join(added), " ".join(deleted), added, deleted)
+
+
+def defineBackends(tempDir: str) -> Dict[str, Callable[[str, str], wordDiff.Diff]]:
+    """Returns the available backends by name, wdiff first if it is installed"""
+    backends = {}
+    if shutil.which("wdiff"):
+        backends["wdiff"] = wdiffBackend(tempDir)
+
+    backends["difflib"] = lambda old, new: wordDiff.diffRevisions(
+        old, new, fastPath=False, hunkThreshold=0
+    )
+    backends["window"] = lambda old, new: wordDiff.diffRevisions(
+        old, new, hunkThreshold=0
+    )
+    backends["python"] = wordDiff.diffRevisions
+
+    return backends
+
+
+def runBackend(
+    diff: Callable[[str, str], wordDiff.Diff],
+    histories: List[Tuple[str, List[str]]],
+) -> Tuple[List[List[wordDiff.Diff]], int, int, float]:
+    """Diffs every revision against the previous one
+
+    Returns the diffs of each history, the number of revisions and bytes diffed and
+    the time taken.
+    """
+    results = []
+    revisions = 0
+    size = 0
+    elapsed = 0.0
+    for _, texts in histories:
+        diffs = []
+        old = ""
+        for text in texts:
+            start = time.perf_counter()
+            diffs.append(diff(old, text))
+            elapsed += time.perf_counter() - start
+
+            revisions += 1
+            size += len(text.encode("utf-8"))
+            old = text
+        results.append(diffs)
+
+    return results, revisions, size, elapsed
+
+
+def wordsMatch(words: List[str], reference: List[str], tolerance: float) -> bool:
+    """Checks that words differs from reference by at most tolerance of its words or
+    by one word"""
+    words = Counter(words)
+    reference = Counter(reference)
+    difference = sum(((words - reference) + (reference - words)).values())
+
+    return difference <= max(tolerance * sum(reference.values()), 1)
+
+
+def featuresMatch(values: tuple, reference: tuple, tolerance: float) -> List[str]:
+    """Returns the names of the features that are outside of tolerance"""
+    mismatched = []
+    for name, value, expected in zip(featureNames, values, reference):
+        if name in ("added", "deleted", "addedLength", "deletedLength"):
+            continue
+        slack = tolerance * max(abs(expected), 1)
+        if isinstance(expected, int) and not isinstance(expected, bool):
+            slack = max(slack, 1)
+        if abs(value - expected) > slack:
+            mismatched.append(name)
+
+    return mismatched
+
+
+def compare(
+    name: str,
+    results: List[List[wordDiff.Diff]],
+    reference: List[List[wordDiff.Diff]],
+    histories: List[Tuple[str, List[str]]],
+    wordTolerance: float,
+    featureTolerance: float,
+) -> int:
+    """Prints the diffs of a backend that do not match the reference and returns how
+    many there are"""
+    mismatches = 0
+    for (title, _), diffs, expectedDiffs in zip(histories, results, reference):
+        for index, (diff, expected) in enumerate(zip(diffs, expectedDiffs)):
+            problems = []
+            if not wordsMatch(diff.addedWords, expected.addedWords, wordTolerance):
+                problems.append("added words")
+            if not wordsMatch(diff.deletedWords, expected.deletedWords, wordTolerance):
+                problems.append("deleted words")
+            problems += featuresMatch(
+                parse.getDiffFeatures(diff),
+                parse.getDiffFeatures(expected),
+                featureTolerance,
+            )
+
+            if problems:
+                mismatches += 1
+                print(
+                    "  %s: %s revision %d differs in %s"
+                    % (name, title, index, ", ".join(problems))
+                )
+
+    return mismatches
+
+
+def main(
+    fixturesDir: str,
+    backendNames: List[str],
+    scale: float,
+    seed: int,
+    wordTolerance: float,
+    featureTolerance: float,
+    storeReference: bool = False,
+) -> int:
+    """Benchmarks the backends and returns the number of mismatched diffs
+
+    Parameters
+    ----------
+    fixturesDir: str - Directory of the hand written dumps and stored reference
+    backendNames: List[str] - Backends to run, all available ones if empty
+    scale: float - Multiplies the size of the generated histories
+    seed: int - Seed used to generate the histories
+    wordTolerance: float - Fraction of reference words a diff may differ by
+    featureTolerance: float - Relative difference allowed for each feature
+    storeReference: bool - Whether to store the diffs of the fixtures by wdiff, or
+        the minimal word diff if it isn't installed, instead of comparing the
+        backends against the stored ones
+    """
+    fixtures = loadFixtures(fixturesDir)
+    histories = fixtures + syntheticHistories(scale, seed)
+    print(
+        "%d histories, %d revisions, %.1f MB"
+        % (
+            len(histories),
+            sum(len(texts) for _, texts in histories),
+            sum(len(text.encode("utf-8")) for _, t in histories for text in t) / 1e6,
+        )
+    )
+
+    referencePath = os.path.join(fixturesDir, "reference.json")
+    storedName = None
+    storedHistories = []
+    storedDiffs = []
+    if not storeReference and os.path.exists(referencePath):
+        storedName, stored = loadReference(referencePath)
+        for title, texts in fixtures:
+            if len(stored.get(title, [])) == len(texts):
+                storedHistories.append((title, texts))
+                storedDiffs.append(stored[title])
+            else:
+                print(
+                    "The stored reference doesn't cover %s, store it again with"
+                    " --writeReference" % title
+                )
+        if storedName != "wdiff":
+            print(
+                "The stored reference was written by the %s word diff rather than"
+                " wdiff, store it again with --writeReference where wdiff is"
+                " installed" % storedName
+            )
+
+    with tempfile.TemporaryDirectory() as tempDir:
+        backends = defineBackends(tempDir)
+        unknown = set(backendNames) - set(backends)
+        if unknown:
+            print("Unavailable backends: %s" % ", ".join(sorted(unknown)))
+            return 1
+
+        if "wdiff" not in backends:
+            print(
+                "wdiff is not installed, using difflib as the reference. The other"
+                " backends use difflib too, so mismatches in the word diff itself"
+                " are only detected against the stored reference"
+            )
+        referenceName = next(iter(backends))
+
+        if storeReference:
+            storedName = "wdiff" if "wdiff" in backends else "minimal"
+            diff = backends.get("wdiff", minimalDiff)
+            writeReference(
+                referencePath, storedName, fixtures, runBackend(diff, fixtures)[0]
+            )
+            print(
+                "Stored the diffs of the fixtures by %s in %s"
+                % (storedName, referencePath)
+            )
+
+        reference = None
+        mismatches = 0
+        print("%-10s %12s %10s %10s" % ("backend", "revisions/s", "MB/s", "seconds"))
+        for name, diff in backends.items():
+            if backendNames and name not in backendNames and name != referenceName:
+                continue
+
+            results, revisions, size, elapsed = runBackend(diff, histories)
+            print(
+                "%-10s %12.1f %10.2f %10.2f"
+                % (name, revisions / elapsed, size / 1e6 / elapsed, elapsed)
+            )
+
+            if reference is None:
+                reference = results
+            else:
+                mismatches += compare(
+                    name,
+                    results,
+                    reference,
+                    histories,
+                    wordTolerance,
+                    featureTolerance,
+                )
+
+            if storedHistories:
+                storedResults, _, _, _ = runBackend(diff, storedHistories)
+                mismatches += compare(
+                    "%s against stored %s" % (name, storedName),
+                    storedResults,
+                    storedDiffs,
+                    storedHistories,
+                    wordTolerance,
+                    featureTolerance,
+                )
+
+    if storedHistories:
+        print(
+            "%d diffs do not match %s or the reference stored by %s"
+            % (mismatches, referenceName, storedName)
+        )
+    else:
+        print("%d diffs do not match %s" % (mismatches, referenceName))
+
+    return mismatches
+
+
+def defineArgParser():
+    """Creates parser for command line arguments"""
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+
+    parser.add_argument(
+        "-f",
+        "--fixturesDir",
+        help="Where the hand written dumps and the stored reference are"
+        " [default: fixtures/]",
+        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures"),
+        type=str,
+    )
+
+    parser.add_argument(
+        "-b",
+        "--backends",
+        help="Backends to run, the reference always runs [default: all available]",
+        default=[],
+        choices=["wdiff", "difflib", "window", "python"],
+        nargs="*",
+    )
+
+    parser.add_argument(
+        "--scale",
+        help="Multiplies the size of the generated histories [default: 1]",
+        default=1.0,
+        type=float,
+    )
+
+    parser.add_argument(
+        "--seed",
+        help="Seed for the generated histories [default: 0]",
+        default=0,
+        type=int,
+    )
+
+    parser.add_argument(
+        "--wordTolerance",
+        help="Fraction of added or deleted words a diff may differ by [default: 0.05]",
+        default=0.05,
+        type=float,
+    )
+
+    parser.add_argument(
+        "--featureTolerance",
+        help="Relative difference allowed for each feature [default: 0.05]",
+        default=0.05,
+        type=float,
+    )
+
+    parser.add_argument(
+        "--writeReference",
+        help="Store the diffs of the fixtures by wdiff, or the minimal word diff if"
+        " it isn't installed, in reference.json of --fixturesDir instead of"
+        " comparing against it",
+        action="store_true",
+    )
+
+    return parser
+
+
+if __name__ == "__main__":
+    argParser = defineArgParser()
+    clArgs = argParser.parse_args()
+
+    mismatches = main(
+        fixturesDir=clArgs.fixturesDir,
+        backendNames=clArgs.backends,
+        scale=clArgs.scale,
+        seed=clArgs.seed,
+        wordTolerance=clArgs.wordTolerance,
+        featureTolerance=clArgs.featureTolerance,
+        storeReference=clArgs.writeReference,
+    )
+
+    sys.exit(1 if mismatches else 0)
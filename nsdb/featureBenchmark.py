@@ -0,0 +1,421 @@
+"""
+This script benchmarks the functions that compute the features of an edit, without
+a database or a dump.
+
+Every feature of features.py is run on a fixed corpus of inserted texts and
+comments, generated from a seed: short replies, long pastes of prose, wikitable
+dumps and text in non-Latin scripts. For each feature the time per text (ns/op),
+the memory allocated per text (B/op) and the peak memory of a single text are
+reported for each backend:
+
+    * legacy - the functions of parse.py that computed the features before
+      features.py, where there is one
+    * registry - the function registered in features.py, on a new EditText so that
+      the intermediates it shares with other features are included
+    * numpy - featuresBatch.batchInsertionFeatures on the whole corpus, reported
+      once as the features of the inserted text are computed together
+
+Memory is measured with tracemalloc in a separate pass from the timings, as tracing
+slows every allocation down. CPython does not count allocations, so B/op is the
+memory that tracemalloc saw allocated at the peak of each call.
+
+Values of the registry that differ from the legacy functions are counted. Profanity
+only matches on word boundaries in features.py, so ins_vulgarity may differ.
+"""
+import argparse
+import random
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+import features
+import parse
+
+# the functions of parse.py that computed the features before features.py
+legacyFunctions = {
+    "insInternalLink": lambda text: len(features.internalLink.findall(text)),
+    "insExternalLink": lambda text: len(features.externalLink.findall(text)),
+    "insLongestInsertedWord": parse.longestWord,
+    "insLongestCharacterSequence": parse.longestCharSequence,
+    "insPronouns": parse.ratioPronouns,
+    "insCapitalization": parse.ratioCapitals,
+    "insDigits": parse.ratioDigits,
+    "insSpecialChars": parse.ratioSpecial,
+    "insVulgarity": parse.containsVulgarity,
+    "insWhitespace": parse.ratioWhitespace,
+    "commentPersonalLife": lambda comment: "personal life" in comment.lower(),
+    "commentCopyedit": lambda comment: "copyedit" in comment.lower(),
+    "commentLength": lambda comment: len(comment.lower()),
+    "commentSpecialChars": lambda comment: parse.ratioSpecial(comment.lower()),
+}
+
+latin = "abcdefghijklmnopqrstuvwxyz"
+scripts = [
+    "東京都日本語の記事ノート議論",
+    "примерстатьяобсуждение",
+    "مقالةنقاشمصدر",
+    "αβγδεζηθικλμ",
+    "हिन्दीलेखचर्चा",
+]
+
+
+def randomWords(rng: random.Random, alphabet: str, count: int) -> str:
+    """Returns count random words made from the characters in alphabet"""
+    return " ".join(
+        "".join(rng.choice(alphabet) for _ in range(rng.randint(1, 10)))
+        for _ in range(count)
+    )
+
+
+def shortReply(rng: random.Random) -> str:
+    """Returns a signed reply of a few words"""
+    words = randomWords(rng, latin, rng.randint(3, 30)).split()
+    for _ in range(rng.randint(0, 2)):
+        words.insert(rng.randrange(len(words)), rng.choice(["I", "my", "me"]))
+    if rng.random() < 0.5:
+        words[0] = words[0].capitalize()
+
+    number = rng.randint(1, 999)
+    return "\n:%s. ~~[[User:Editor%d|Editor%d]] ([[User talk:Editor%d|talk]])\n" % (
+        " ".join(words),
+        number,
+        number,
+        number,
+    )
+
+
+def longPaste(rng: random.Random) -> str:
+    """Returns several paragraphs of prose with links and references"""
+    paragraphs = []
+    for _ in range(rng.randint(5, 20)):
+        words = randomWords(rng, latin, rng.randint(50, 200)).split()
+        for _ in range(rng.randint(0, 5)):
+            words.insert(rng.randrange(len(words)), "[[%s]]" % words[-1])
+        for _ in range(rng.randint(0, 2)):
+            words.insert(
+                rng.randrange(len(words)),
+                " [http://example.org/%s source] " % words[0],
+            )
+        if rng.random() < 0.3:
+            words.insert(rng.randrange(len(words)), "!" * rng.randint(2, 20))
+        paragraphs.append(" ".join(words).capitalize() + ".")
+
+    return "\n\n".join(paragraphs)
+
+
+def wikitable(rng: random.Random) -> str:
+    """Returns a wikitable of numbers and short cells"""
+    columns = rng.randint(3, 10)
+    rows = ['{| class="wikitable sortable"']
+    rows.append("! " + " !! ".join(randomWords(rng, latin, 1) for _ in range(columns)))
+    for _ in range(rng.randint(10, 200)):
+        cells = [
+            (
+                str(rng.randint(0, 10**6))
+                if rng.random() < 0.6
+                else randomWords(rng, latin, 2)
+            )
+            for _ in range(columns)
+        ]
+        rows.append("|-\n| " + " || ".join(cells))
+    rows.append("|}")
+
+    return "\n".join(rows)
+
+
+def nonLatin(rng: random.Random) -> str:
+    """Returns a comment in a non-Latin script with a Latin signature"""
+    number = rng.randint(1, 999)
+    return "\n%s ~~[[User:Editor%d|Editor%d]]\n" % (
+        randomWords(rng, rng.choice(scripts), rng.randint(5, 100)),
+        number,
+        number,
+    )
+
+
+def editComment(rng: random.Random) -> str:
+    """Returns a revision comment"""
+    return rng.choice(
+        [
+            "/* %s */ reply" % randomWords(rng, latin, 3),
+            "copyedit",
+            "/* Personal life */ %s" % randomWords(rng, latin, 5),
+            "Undid revision %d by [[Special:Contributions/Editor|Editor]]"
+            % rng.randint(1, 10**9),
+            randomWords(rng, latin, rng.randint(1, 20)),
+            "/* %s */ new section" % randomWords(rng, rng.choice(scripts), 2),
+        ]
+    )
+
+
+generators = {
+    "replies": shortReply,
+    "pastes": longPaste,
+    "wikitables": wikitable,
+    "nonLatin": nonLatin,
+}
+
+
+def makeCorpus(
+    categories: List[str], texts: int, seed: int
+) -> Tuple[List[str], List[str]]:
+    """Returns the inserted texts of the given categories, texts of each, and as many
+    comments"""
+    rng = random.Random(seed)
+
+    inserted = []
+    for category in categories:
+        inserted += [generators[category](rng) for _ in range(texts)]
+
+    comments = [editComment(rng) for _ in inserted]
+
+    return inserted, comments
+
+
+def timeCalls(function: Callable, inputs: list, repeat: int) -> float:
+    """Returns the fastest time in ns of calling function on every input"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        for value in inputs:
+            function(value)
+        elapsed = time.perf_counter_ns() - start
+
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best
+
+
+def traceCalls(function: Callable, inputs: list) -> Tuple[float, int]:
+    """Returns the mean and the largest memory in bytes allocated at the peak of a
+    call of function on each input"""
+    total = 0
+    largest = 0
+
+    tracemalloc.start()
+    try:
+        for value in inputs:
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            function(value)
+            _, peak = tracemalloc.get_traced_memory()
+
+            total += peak - before
+            largest = max(largest, peak - before)
+    finally:
+        tracemalloc.stop()
+
+    return total / len(inputs), largest
+
+
+def defineBackends(
+    feature: features.Feature, inserted: List[str], comments: List[str]
+) -> Dict[str, Tuple[Callable, list]]:
+    """Returns the function computing a feature from one input and the inputs it is
+    called on by backend
+
+    The registry is given the words of each text along with it, as parse.py passes
+    the words of the diff, and each text is both added and deleted.
+    """
+    backends = {}
+
+    legacy = legacyFunctions.get(feature.name)
+    if legacy is not None:
+        backends["legacy"] = (
+            legacy,
+            comments if "comment" in feature.inputs else inserted,
+        )
+
+    if "comment" in feature.inputs:
+        backends["registry"] = (
+            lambda comment: feature.function(features.EditText(comment=comment)),
+            comments,
+        )
+    else:
+        backends["registry"] = (
+            lambda pair: feature.function(
+                features.EditText(pair[0], pair[0], pair[1], pair[1])
+            ),
+            [(text, text.split()) for text in inserted],
+        )
+
+    return backends
+
+
+def countMismatches(backends: Dict[str, Tuple[Callable, list]]) -> int:
+    """Returns the number of inputs that the registry and the legacy function
+    disagree on"""
+    legacy, legacyInputs = backends["legacy"]
+    registry, registryInputs = backends["registry"]
+
+    return sum(
+        legacy(legacyInput) != registry(registryInput)
+        for legacyInput, registryInput in zip(legacyInputs, registryInputs)
+    )
+
+
+def main(
+    categories: List[str], featureNames: List[str], texts: int, repeat: int, seed: int
+):
+    """Benchmarks the features on the corpus
+
+    Parameters
+    ----------
+    categories: List[str] - kinds of inserted text in the corpus
+    featureNames: List[str] - names or columns of the features, all if empty
+    texts: int - number of texts of each category
+    repeat: int - times each feature is timed, the fastest is reported
+    seed: int - seed of the corpus
+    """
+    inserted, comments = makeCorpus(categories, texts, seed)
+    print(
+        "%d inserted texts, %.2f MB, %d comments"
+        % (
+            len(inserted),
+            sum(len(text.encode("utf-8")) for text in inserted) / 1e6,
+            len(comments),
+        )
+    )
+
+    # the profanity matcher is built on first use
+    features.insVulgarity(features.EditText("warm up"))
+
+    print(
+        "%-28s %-9s %12s %10s %10s %11s"
+        % ("feature", "backend", "ns/op", "B/op", "peak KB", "mismatches")
+    )
+
+    for feature in features.selectFeatures(featureNames):
+        backends = defineBackends(feature, inserted, comments)
+
+        for name, (function, inputs) in backends.items():
+            elapsed = timeCalls(function, inputs, repeat)
+            allocated, peak = traceCalls(function, inputs)
+
+            mismatches = ""
+            if name == "registry" and "legacy" in backends:
+                mismatches = countMismatches(backends)
+
+            print(
+                "%-28s %-9s %12.0f %10.0f %10.1f %11s"
+                % (
+                    feature.name,
+                    name,
+                    elapsed / len(inputs),
+                    allocated,
+                    peak / 1024,
+                    mismatches,
+                )
+            )
+
+    # every feature of the inserted text at once, by each backend
+    print()
+    allBackends = {
+        "legacy": (
+            lambda text: [
+                legacyFunctions[feature.name](text)
+                for feature in features.insertionRegistry
+            ],
+            inserted,
+        ),
+        "registry": (
+            lambda pair: features.computeFeatures(
+                features.insertionRegistry, features.EditText(pair[0], "", pair[1])
+            ),
+            [(text, text.split()) for text in inserted],
+        ),
+    }
+    try:
+        # NumPy is optional, parse.py only needs it for --featureBatch
+        import featuresBatch
+
+        # the whole corpus is computed in one call
+        allBackends["numpy"] = (featuresBatch.batchInsertionFeatures, [inserted])
+    except ImportError:
+        print("NumPy is not installed, skipping the numpy backend")
+
+    for name, (function, inputs) in allBackends.items():
+        elapsed = timeCalls(function, inputs, repeat)
+        allocated, peak = traceCalls(function, inputs)
+
+        print(
+            "%-28s %-9s %12.0f %10.0f %10.1f"
+            % (
+                "all ins_* features",
+                name,
+                elapsed / len(inserted),
+                allocated * len(inputs) / len(inserted),
+                peak / 1024,
+            )
+        )
+
+
+def defineArgParser():
+    """Creates parser for command line arguments"""
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+
+    parser.add_argument(
+        "-c",
+        "--categories",
+        help="Kinds of inserted text in the corpus [default: all]",
+        default=list(generators),
+        choices=list(generators),
+        metavar="CATEGORY",
+        nargs="+",
+    )
+
+    parser.add_argument(
+        "-f",
+        "--features",
+        help="Features to benchmark, by name or column [default: all]",
+        default=[],
+        choices=list(
+            dict.fromkeys(
+                [feature.name for feature in features.registry]
+                + [feature.column for feature in features.registry]
+            )
+        ),
+        metavar="FEATURE",
+        nargs="*",
+    )
+
+    parser.add_argument(
+        "-t",
+        "--texts",
+        help="Number of texts of each category [default: 200]",
+        default=200,
+        type=int,
+    )
+
+    parser.add_argument(
+        "-r",
+        "--repeat",
+        help="Times each feature is timed, the fastest is reported [default: 5]",
+        default=5,
+        type=int,
+    )
+
+    parser.add_argument(
+        "--seed",
+        help="Seed for the corpus [default: 0]",
+        default=0,
+        type=int,
+    )
+
+    return parser
+
+
+if __name__ == "__main__":
+    argParser = defineArgParser()
+    clArgs = argParser.parse_args()
+
+    main(
+        categories=clArgs.categories,
+        featureNames=clArgs.features,
+        texts=clArgs.texts,
+        repeat=clArgs.repeat,
+        seed=clArgs.seed,
+    )
@@ -0,0 +1,456 @@
+"""
+This module computes the features of an edit from its text.
+
+Every column of the edit table that is computed from text is registered as a Feature
+with the inputs it needs, so a parse can compute only the features it is configured
+with. Intermediates shared between features, such as the class of every character
+of the inserted text, are computed when first needed and at most once per edit.
+
+The results are the same as those of the functions in parse.py, except that
+profanity is only matched on word boundaries by profanityMatcher.
+"""
+import re
+from functools import cached_property, wraps
+from typing import Callable, List, NamedTuple, Tuple
+
+import profanityMatcher
+
+internalLink = re.compile(r"\[\[.*?\]\]")
+externalLink = re.compile(r"[^\[]\[[^\[].*?[^\]]\][^\]]")
+pronouns = re.compile(r"(\sI\s|\sme\s|\smy\s|\smine\s|\smyself\s)")
+
+# the same substitutions as parse.cleanString
+symbols = re.compile(r'[$-/:?{}~!"^_`\[\]]')
+special = re.compile(r'[!-/:-?{-~!"^_`\[\]]')
+doubleSpaces = re.compile(r"\s\s+")
+
+UPPER = "U"
+LOWER = "L"
+DIGIT = "D"
+SPACE = "S"
+SYMBOL = "Y"  # removed by cleanString, all of these are also special characters
+SPECIAL = "P"
+OTHER = "O"
+
+# words are separated by whitespace and by the symbols removed by cleanString
+wordSeparators = str.maketrans(SPACE + SYMBOL, "  ")
+
+
+class CharacterClasses(dict):
+    """Translation table from a character to the letter of its class, filled in as
+    characters are first seen"""
+
+    def __missing__(self, codepoint: int) -> str:
+        char = chr(codepoint)
+        if "A" <= char <= "Z":
+            kind = UPPER
+        elif "a" <= char <= "z":
+            kind = LOWER
+        elif char.isdigit():
+            kind = DIGIT
+        elif char.isspace():
+            kind = SPACE
+        elif symbols.match(char):
+            kind = SYMBOL
+        elif special.match(char):
+            kind = SPECIAL
+        else:
+            kind = OTHER
+
+        self[codepoint] = kind
+        return kind
+
+
+characterClasses = CharacterClasses()
+
+# patterns matching a character repeated more than n times, by n
+repeats = {}
+
+
+class InsertionFeatures(NamedTuple):
+    """The ins_* columns of an edit"""
+
+    internalLink: int = 0
+    externalLink: int = 0
+    longestWord: int = 0
+    longestCharSequence: int = 0
+    capitalization: float = 0
+    digits: float = 0
+    specialChars: float = 0
+    whitespace: float = 0
+    pronouns: float = 0
+    vulgarity: bool = False
+
+
+def longestRepeat(string: str) -> int:
+    """Returns the length of the longest run of a repeated character in text"""
+    length = 0
+    while True:
+        pattern = repeats.get(length)
+        if pattern is None:
+            pattern = re.compile(r"(.)\1{%d}" % length, re.DOTALL)
+            repeats[length] = pattern
+
+        match = pattern.search(string)
+        if match is None:
+            return length
+
+        char = match.group(1)
+        end = match.end()
+        while end < len(string) and string[end] == char:
+            end += 1
+        length = end - match.start()
+
+
+class EditText:
+    """The text of an edit that its features are computed from
+
+    Parameters
+    ----------
+    added: str - text only in the new revision
+    deleted: str - text only in the old revision
+    addedWords: List[str] - tokens of the added text
+    deletedWords: List[str] - tokens of the deleted text
+    comment: str - comment of the revision
+    insertion: InsertionFeatures - features of the added text if they have already
+      been computed, for example by featuresBatch
+    """
+
+    def __init__(
+        self,
+        added: str = "",
+        deleted: str = "",
+        addedWords: List[str] = None,
+        deletedWords: List[str] = None,
+        comment: str = "",
+        insertion: InsertionFeatures = None,
+    ):
+        self.added = added
+        self.deleted = deleted
+        self.addedWords = addedWords if addedWords is not None else added.split()
+        self.deletedWords = (
+            deletedWords if deletedWords is not None else deleted.split()
+        )
+        self.comment = comment
+        self.insertion = insertion
+
+    @cached_property
+    def blank(self) -> bool:
+        """Whether the added text only has whitespace"""
+        return self.added.isspace()
+
+    @cached_property
+    def classes(self) -> str:
+        """The class of each character of the added text"""
+        return self.added.translate(characterClasses)
+
+    @cached_property
+    def cleaned(self) -> str:
+        """The added text after parse.cleanString"""
+        return doubleSpaces.sub(" ", symbols.sub(" ", self.added))
+
+    @cached_property
+    def lowerComment(self) -> str:
+        return self.comment.lower()
+
+
+class Feature(NamedTuple):
+    """A column of the edit table that is computed from the text of an edit
+
+    Parameters
+    ----------
+    name: str - name of the feature
+    column: str - column of the edit table it fills
+    inputs: Tuple[str] - the text it is computed from, "added", "deleted", "tokens"
+      or "comment"
+    function: Callable[[EditText], object] - computes the feature
+    missing: object - value of the column when an input does not exist, a blank
+      revision has no diff and not every revision has a comment
+    insertion: str - field of InsertionFeatures that holds the feature
+    definition: str - SQL definition of the column, for columns that are added to
+      existing databases by backfill.py
+    """
+
+    name: str
+    column: str
+    inputs: Tuple[str, ...]
+    function: Callable[[EditText], object]
+    missing: object = "NULL"
+    insertion: str = None
+    definition: str = None
+
+
+def insertion(blank=0):
+    """Wraps a feature of the added text so that it is 0 when nothing was added and
+    blank when only whitespace was added"""
+
+    def decorator(function):
+        @wraps(function)
+        def feature(text: EditText):
+            if not text.added:
+                return 0
+            if text.blank:
+                return blank
+
+            return function(text)
+
+        return feature
+
+    return decorator
+
+
+def added(text: EditText) -> str:
+    return text.added[:65535]
+
+
+def deleted(text: EditText) -> str:
+    return text.deleted[:65535]
+
+
+def addedLength(text: EditText) -> int:
+    return len(text.added)
+
+
+def deletedLength(text: EditText) -> int:
+    return len(text.deleted)
+
+
+@insertion()
+def insInternalLink(text: EditText) -> int:
+    return len(internalLink.findall(text.added))
+
+
+@insertion()
+def insExternalLink(text: EditText) -> int:
+    return len(externalLink.findall(text.added))
+
+
+@insertion()
+def insLongestInsertedWord(text: EditText) -> int:
+    words = text.classes.translate(wordSeparators).split()
+    return max(map(len, words)) if words else 0
+
+
+@insertion()
+def insLongestCharacterSequence(text: EditText) -> int:
+    # parse.longestCharSequence never counts the last run of the cleaned text
+    cleaned = text.cleaned
+    return longestRepeat(cleaned.rstrip(cleaned[-1]))
+
+
+@insertion()
+def insPronouns(text: EditText) -> float:
+    return len(pronouns.findall(text.added)) / (text.added.count(" ") + 1)
+
+
+@insertion()
+def insCapitalization(text: EditText) -> float:
+    return text.classes.count(UPPER) / (text.classes.count(LOWER) + 1)
+
+
+@insertion()
+def insDigits(text: EditText) -> float:
+    return text.classes.count(DIGIT) / len(text.added)
+
+
+@insertion()
+def insSpecialChars(text: EditText) -> float:
+    classes = text.classes
+    return (classes.count(SYMBOL) + classes.count(SPECIAL)) / len(text.added)
+
+
+@insertion()
+def insVulgarity(text: EditText) -> bool:
+    return profanityMatcher.containsProfanity(text.added)
+
+
+@insertion(blank=1)
+def insWhitespace(text: EditText) -> float:
+    return text.classes.count(SPACE) / len(text.added)
+
+
+def delWords(text: EditText) -> int:
+    return len(text.deletedWords)
+
+
+def averageLength(words: List[str]) -> float:
+    """Returns the average length of words, 0 if there are none"""
+    if not words:
+        return 0
+
+    return round(sum(map(len, words)) / len(words), 2)
+
+
+@insertion()
+def insAvgWordLength(text: EditText) -> float:
+    return averageLength(text.addedWords)
+
+
+def delAvgWordLength(text: EditText) -> float:
+    return averageLength(text.deletedWords)
+
+
+def commentPersonalLife(text: EditText) -> bool:
+    return "personal life" in text.lowerComment
+
+
+def commentCopyedit(text: EditText) -> bool:
+    return "copyedit" in text.lowerComment
+
+
+def commentLength(text: EditText) -> int:
+    # the length after lowercasing, as parse.py counted it, which differs from the
+    # comment for a few characters such as "İ"
+    return len(text.lowerComment)
+
+
+def commentSpecialChars(text: EditText) -> float:
+    return len(special.findall(text.lowerComment)) / len(text.lowerComment)
+
+
+# in the order of the columns of the edit table
+registry = [
+    Feature("added", "added", ("added",), added),
+    Feature("deleted", "deleted", ("deleted",), deleted),
+    Feature("addedLength", "added_length", ("added",), addedLength, 0),
+    Feature("deletedLength", "deleted_length", ("deleted",), deletedLength, 0),
+    Feature(
+        "insInternalLink",
+        "ins_internal_link",
+        ("added",),
+        insInternalLink,
+        insertion="internalLink",
+    ),
+    Feature(
+        "insExternalLink",
+        "ins_external_link",
+        ("added",),
+        insExternalLink,
+        insertion="externalLink",
+    ),
+    Feature(
+        "insLongestInsertedWord",
+        "ins_longest_inserted_word",
+        ("added",),
+        insLongestInsertedWord,
+        insertion="longestWord",
+    ),
+    Feature(
+        "insLongestCharacterSequence",
+        "ins_longest_character_sequence",
+        ("added",),
+        insLongestCharacterSequence,
+        insertion="longestCharSequence",
+    ),
+    Feature(
+        "insPronouns", "ins_pronouns", ("added",), insPronouns, insertion="pronouns"
+    ),
+    Feature(
+        "insCapitalization",
+        "ins_capitalization",
+        ("added",),
+        insCapitalization,
+        insertion="capitalization",
+    ),
+    Feature("insDigits", "ins_digits", ("added",), insDigits, insertion="digits"),
+    Feature(
+        "insSpecialChars",
+        "ins_special_chars",
+        ("added",),
+        insSpecialChars,
+        insertion="specialChars",
+    ),
+    Feature(
+        "insVulgarity",
+        "ins_vulgarity",
+        ("added",),
+        insVulgarity,
+        insertion="vulgarity",
+    ),
+    Feature(
+        "insWhitespace",
+        "ins_whitespace",
+        ("added",),
+        insWhitespace,
+        insertion="whitespace",
+    ),
+    Feature("delWords", "del_words", ("tokens",), delWords, 0),
+    Feature(
+        "insAvgWordLength",
+        "ins_avg_word_length",
+        ("tokens",),
+        insAvgWordLength,
+        definition="decimal(7, 2) DEFAULT NULL",
+    ),
+    Feature(
+        "delAvgWordLength",
+        "del_avg_word_length",
+        ("tokens",),
+        delAvgWordLength,
+        definition="decimal(7, 2) DEFAULT NULL",
+    ),
+    Feature(
+        "commentPersonalLife",
+        "comment_personal_life",
+        ("comment",),
+        commentPersonalLife,
+    ),
+    Feature("commentCopyedit", "comment_copyedit", ("comment",), commentCopyedit),
+    Feature("commentLength", "comment_length", ("comment",), commentLength),
+    Feature(
+        "commentSpecialChars",
+        "comment_special_chars",
+        ("comment",),
+        commentSpecialChars,
+    ),
+]
+
+# the features computed by insertionFeatures, in the order of InsertionFeatures
+insertionRegistry = [
+    next(feature for feature in registry if feature.insertion == field)
+    for field in InsertionFeatures._fields
+]
+
+
+def selectFeatures(names: List[str] = None) -> List[Feature]:
+    """Returns the registered features with the given names or columns in the order
+    of the registry, all of them if names is empty"""
+    if not names:
+        return list(registry)
+
+    unknown = set(names) - {feature.name for feature in registry}
+    unknown -= {feature.column for feature in registry}
+    if unknown:
+        raise ValueError("Unknown features: %s" % ", ".join(sorted(unknown)))
+
+    return [
+        feature
+        for feature in registry
+        if feature.name in names or feature.column in names
+    ]
+
+
+def splitFeatures(selected: List[Feature]) -> Tuple[List[Feature], List[Feature]]:
+    """Splits features into those computed from the diff of an edit and those
+    computed from its comment"""
+    diffFeatures = [feature for feature in selected if "comment" not in feature.inputs]
+    commentFeatures = [feature for feature in selected if "comment" in feature.inputs]
+
+    return diffFeatures, commentFeatures
+
+
+def computeFeatures(selected: List[Feature], text: EditText) -> tuple:
+    """Returns the value of each of the selected features of an edit"""
+    values = []
+    for feature in selected:
+        if text.insertion is not None and feature.insertion:
+            values.append(getattr(text.insertion, feature.insertion))
+        else:
+            values.append(feature.function(text))
+
+    return tuple(values)
+
+
+def insertionFeatures(string: str) -> InsertionFeatures:
+    """Returns the features of the text added by an edit"""
+    return InsertionFeatures(*computeFeatures(insertionRegistry, EditText(string)))
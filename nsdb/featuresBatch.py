@@ -0,0 +1,181 @@
+"""
+This module computes the features of the text inserted by many edits at once.
+
+The inserted texts are joined into one array of codepoints and the character
+counts, ratios and run lengths of every text are computed with NumPy reductions over
+its segment of the array. Links, pronouns and profanity are still matched per text.
+The results are the same as those of features.insertionFeatures.
+"""
+
+from typing import List
+
+import numpy as np
+
+import features
+import profanityMatcher
+
+# the class of each ASCII character, other characters are classified as they appear
+asciiClasses = np.array(
+    [ord(features.characterClasses[codepoint]) for codepoint in range(128)],
+    dtype=np.uint8,
+)
+
+UPPER = ord(features.UPPER)
+LOWER = ord(features.LOWER)
+DIGIT = ord(features.DIGIT)
+SPACE = ord(features.SPACE)
+SYMBOL = ord(features.SYMBOL)
+SPECIAL = ord(features.SPECIAL)
+
+
+def classify(codepoints: np.ndarray) -> np.ndarray:
+    """Returns the class of each codepoint, as the ord() of its letter in features"""
+    ascii = codepoints < 128
+    classes = np.empty(len(codepoints), dtype=np.uint8)
+    classes[ascii] = asciiClasses[codepoints[ascii]]
+
+    if not ascii.all():
+        others, inverse = np.unique(codepoints[~ascii], return_inverse=True)
+        otherClasses = np.array(
+            [ord(features.characterClasses[int(c)]) for c in others], dtype=np.uint8
+        )
+        classes[~ascii] = otherClasses[inverse]
+
+    return classes
+
+
+def segmentCounts(mask: np.ndarray, starts: np.ndarray) -> List[int]:
+    """Returns the number of true values in each segment of mask"""
+    return np.add.reduceat(mask.astype(np.int64), starts).tolist()
+
+
+def runStarts(values: np.ndarray, segmentStarts: np.ndarray) -> np.ndarray:
+    """Returns where each run of equal values begins, runs end at segment starts"""
+    starts = np.ones(len(values), dtype=bool)
+    starts[1:] = values[1:] != values[:-1]
+    starts[segmentStarts] = True
+
+    return np.flatnonzero(starts)
+
+
+def longestWords(
+    classes: np.ndarray, starts: np.ndarray, segments: np.ndarray, count: int
+) -> List[int]:
+    """Returns the length of the longest word in each segment, words are separated
+    by whitespace and by the symbols removed by parse.cleanString"""
+    inWord = (classes != SPACE) & (classes != SYMBOL)
+
+    runs = runStarts(inWord, starts)
+    lengths = np.diff(np.append(runs, len(classes)))
+
+    words = inWord[runs]
+    longest = np.zeros(count, dtype=np.int64)
+    np.maximum.at(longest, segments[runs[words]], lengths[words])
+
+    return longest.tolist()
+
+
+def longestCharSequences(
+    codepoints: np.ndarray,
+    classes: np.ndarray,
+    starts: np.ndarray,
+    segments: np.ndarray,
+    count: int,
+) -> List[int]:
+    """Returns parse.longestCharSequence of each segment
+
+    The text is cleaned as by parse.cleanString: symbols become spaces and runs of
+    two or more whitespace characters become a single space. The last run of each
+    cleaned segment is not counted.
+    """
+    separator = (classes == SPACE) | (classes == SYMBOL)
+
+    # the first character of each run of separators stands in for the whole run
+    runs = runStarts(separator, starts)
+    lengths = np.diff(np.append(runs, len(classes)))
+    separatorRuns = runs[separator[runs]]
+    separatorLengths = lengths[separator[runs]]
+
+    cleaned = codepoints.copy()
+    keep = ~separator
+    keep[separatorRuns] = True
+
+    replaced = (separatorLengths > 1) | (classes[separatorRuns] == SYMBOL)
+    cleaned[separatorRuns[replaced]] = ord(" ")
+
+    cleaned = cleaned[keep]
+    cleanedSegments = segments[keep]
+    cleanedStarts = np.flatnonzero(np.diff(cleanedSegments, prepend=-1))
+
+    runs = runStarts(cleaned, cleanedStarts)
+    lengths = np.diff(np.append(runs, len(cleaned)))
+    runSegments = cleanedSegments[runs]
+
+    last = np.ones(len(runs), dtype=bool)
+    last[:-1] = runSegments[1:] != runSegments[:-1]
+
+    longest = np.zeros(count, dtype=np.int64)
+    np.maximum.at(longest, runSegments[~last], lengths[~last])
+
+    return longest.tolist()
+
+
+def batchInsertionFeatures(strings: List[str]) -> List[features.InsertionFeatures]:
+    """Returns the features of the text added by each of many edits
+
+    Parameters
+    ----------
+    strings: List[str] - the text added by each edit
+
+    Returns
+    -------
+    features: List[features.InsertionFeatures] - in the same order as strings
+    """
+    results = [None] * len(strings)
+
+    texts = []
+    indexes = []
+    for index, string in enumerate(strings):
+        if string and not string.isspace():
+            texts.append(string)
+            indexes.append(index)
+        else:
+            results[index] = features.insertionFeatures(string)
+
+    if not texts:
+        return results
+
+    codepoints = np.frombuffer("".join(texts).encode("utf-32-le"), dtype=np.uint32)
+    lengths = [len(text) for text in texts]
+    starts = np.cumsum([0] + lengths[:-1])
+    segments = np.repeat(np.arange(len(texts)), lengths)
+
+    classes = classify(codepoints)
+
+    upper = segmentCounts(classes == UPPER, starts)
+    lower = segmentCounts(classes == LOWER, starts)
+    digits = segmentCounts(classes == DIGIT, starts)
+    special = segmentCounts((classes == SYMBOL) | (classes == SPECIAL), starts)
+    whitespace = segmentCounts(classes == SPACE, starts)
+
+    longestWord = longestWords(classes, starts, segments, len(texts))
+    longestCharSequence = longestCharSequences(
+        codepoints, classes, starts, segments, len(texts)
+    )
+
+    for i, (index, text) in enumerate(zip(indexes, texts)):
+        length = lengths[i]
+        results[index] = features.InsertionFeatures(
+            internalLink=len(features.internalLink.findall(text)),
+            externalLink=len(features.externalLink.findall(text)),
+            longestWord=longestWord[i],
+            longestCharSequence=longestCharSequence[i],
+            capitalization=upper[i] / (lower[i] + 1),
+            digits=digits[i] / length,
+            specialChars=special[i] / length,
+            whitespace=whitespace[i] / length,
+            pronouns=len(features.pronouns.findall(text)) / (text.count(" ") + 1),
+            vulgarity=profanityMatcher.containsProfanity(text),
+        )
+
+    return results
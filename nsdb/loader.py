@@ -0,0 +1,353 @@
+"""
+This script loads the rows that parse.py wrote to staging files with --stagingDir
+into the database.
+
+Each partition that parse.py has finished is loaded in one transaction. Its files
+are read into temporary tables with LOAD DATA LOCAL INFILE, or with inserts of many
+rows if the server doesn't allow it, and merged into the database with one
+statement per table:
+
+    * the user counts are summed by user and upserted
+    * pages are inserted, or their number of edits is updated
+    * edits are inserted with the id of their user, found by username or IP address
+    * the edits in reverted.tsv are marked as reverted
+
+A partition is marked as loaded once its transaction is committed, so running the
+loader again only loads the partitions that weren't.
+
+This tool uses a MySQL database that is configured in the Database() module.
+"""
+import argparse
+import os
+import re
+import time
+from datetime import datetime
+from typing import Iterator, List
+
+import mysql.connector as sql
+from tqdm import tqdm
+
+import Database
+
+# the errors of a server or connector that don't allow LOAD DATA LOCAL INFILE
+localInfileErrors = {1148, 2068, 3948}
+
+escapeSequence = re.compile(r"\\(.)")
+tsvUnescapes = {"t": "\t", "n": "\n", "r": "\r", "0": "\0", "Z": "\x1a"}
+
+stagingTables = """
+    CREATE TEMPORARY TABLE user_staging (
+        user_id int DEFAULT NULL,
+        username varchar(255) binary DEFAULT NULL,
+        ip_address varbinary(255) DEFAULT NULL,
+        namespaces varchar(255) NOT NULL DEFAULT '',
+        number_of_edits int unsigned NOT NULL DEFAULT '0',
+        reverted_edits int unsigned NOT NULL DEFAULT '0',
+        talkpage_number_of_edits int unsigned NOT NULL DEFAULT '0',
+        talkpage_reverted_edits int unsigned NOT NULL DEFAULT '0'
+    );
+    CREATE TEMPORARY TABLE page_staging LIKE page;
+    CREATE TEMPORARY TABLE edit_staging LIKE edit;
+    ALTER TABLE edit_staging
+        MODIFY user_table_id int unsigned DEFAULT NULL,
+        ADD COLUMN username varchar(255) binary DEFAULT NULL,
+        ADD COLUMN ip_address varbinary(255) DEFAULT NULL;
+    CREATE TEMPORARY TABLE reverted_staging (
+        edit_id int NOT NULL,
+        KEY editid_idx (edit_id)
+    );"""
+
+
+def unescape(field: str):
+    """Returns the value of a field of a staging file, None for NULL"""
+    if field == "\\N":
+        return None
+
+    return escapeSequence.sub(lambda match: tsvUnescapes.get(match[1], match[1]), field)
+
+
+def readHeader(path: str) -> List[str]:
+    """Returns the columns of a staging file, none if it is empty"""
+    with open(path, encoding="utf-8", newline="") as file:
+        header = file.readline().rstrip("\n")
+
+    return header.split("\t") if header else []
+
+
+def readRows(path: str) -> Iterator[tuple]:
+    """Yields the rows of a staging file after its header"""
+    with open(path, encoding="utf-8", newline="") as file:
+        file.readline()
+        for line in file:
+            yield tuple(map(unescape, line.rstrip("\n").split("\t")))
+
+
+def loadFile(cursor, path: str, table: str, bulkLoad: bool, batchSize: int) -> int:
+    """Loads a staging file into a staging table and returns the number of rows
+
+    The file is loaded with LOAD DATA LOCAL INFILE if bulkLoad, otherwise its rows
+    are inserted batchSize at a time.
+    """
+    columns = readHeader(path)
+    if not columns:
+        return 0
+
+    if bulkLoad:
+        query = """LOAD DATA LOCAL INFILE %%s INTO TABLE %s
+            CHARACTER SET utf8mb4
+            FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\'
+            LINES TERMINATED BY '\\n'
+            IGNORE 1 LINES (%s);""" % (table, ", ".join(columns))
+        cursor.execute(query, (os.path.abspath(path),))
+
+        return cursor.rowcount
+
+    query = "INSERT INTO %s (%s) VALUES (%s);" % (
+        table,
+        ", ".join(columns),
+        ", ".join(["%s"] * len(columns)),
+    )
+
+    loaded = 0
+    rows = []
+    for row in readRows(path):
+        rows.append(row)
+        if len(rows) == batchSize:
+            cursor.executemany(query, rows)
+            loaded += len(rows)
+            rows = []
+
+    if rows:
+        cursor.executemany(query, rows)
+        loaded += len(rows)
+
+    return loaded
+
+
+def mergeUsers(cursor):
+    """Sums the counts of each user and adds them to the user table"""
+    query = """INSERT INTO user
+            (user_id, username, ip_address, namespaces, number_of_edits,
+                reverted_edits, talkpage_number_of_edits, talkpage_reverted_edits)
+        SELECT * FROM (
+            SELECT
+                MAX(user_id),
+                username,
+                ip_address,
+                COALESCE(GROUP_CONCAT(NULLIF(namespaces, '')), ''),
+                SUM(number_of_edits),
+                SUM(reverted_edits),
+                SUM(talkpage_number_of_edits),
+                SUM(talkpage_reverted_edits)
+            FROM user_staging
+            GROUP BY username, ip_address
+            ORDER BY username, ip_address
+        ) AS deltas
+        ON DUPLICATE KEY
+        UPDATE
+            namespaces =
+                CONCAT_WS(',', user.namespaces, NULLIF(VALUES(namespaces), '')),
+            number_of_edits = user.number_of_edits + VALUES(number_of_edits),
+            reverted_edits = user.reverted_edits + VALUES(reverted_edits),
+            talkpage_number_of_edits =
+                user.talkpage_number_of_edits + VALUES(talkpage_number_of_edits),
+            talkpage_reverted_edits =
+                user.talkpage_reverted_edits + VALUES(talkpage_reverted_edits);"""
+    cursor.execute(query)
+
+
+def mergePages(cursor):
+    """Adds the pages to the page table, updating the number of edits of pages that
+    are already in it"""
+    query = """INSERT INTO page (page_id, namespace, title, file_name, number_of_edits)
+        SELECT page_id, namespace, title, file_name, number_of_edits
+        FROM page_staging
+        ON DUPLICATE KEY
+        UPDATE number_of_edits = VALUES(number_of_edits);"""
+    cursor.execute(query)
+
+
+def mergeEdits(cursor, columns: List[str]):
+    """Inserts the edits with the id of their user, in the order they were parsed"""
+    columns = [column for column in columns if column not in ("username", "ip_address")]
+
+    query = """INSERT INTO edit (%s, user_table_id)
+        SELECT %s, COALESCE(registered.id, anonymous.id)
+        FROM edit_staging AS staged
+        LEFT JOIN user AS registered ON registered.username = staged.username
+        LEFT JOIN user AS anonymous ON anonymous.ip_address = staged.ip_address
+        ORDER BY staged.id;""" % (
+        ", ".join(columns),
+        ", ".join("staged." + column for column in columns),
+    )
+    cursor.execute(query)
+
+
+def markReverted(cursor):
+    query = """UPDATE edit
+        JOIN reverted_staging ON edit.edit_id = reverted_staging.edit_id
+        SET edit.reverted = True;"""
+    cursor.execute(query)
+
+
+def loadPartition(
+    database, cursor, directory: str, partitionName: str, bulkLoad: bool, batchSize: int
+) -> dict:
+    """Loads the staging files of a partition in one transaction and returns the
+    number of rows of each file"""
+    for table in ("user", "page", "edit", "reverted"):
+        cursor.execute("DELETE FROM %s_staging;" % table)
+
+    database.start_transaction()
+    try:
+        loaded = {}
+        for table in ("user", "page", "edit", "reverted"):
+            path = os.path.join(directory, table + ".tsv")
+            loaded[table] = loadFile(
+                cursor, path, table + "_staging", bulkLoad, batchSize
+            )
+
+        # users and pages first, edits reference both
+        mergeUsers(cursor)
+        mergePages(cursor)
+        if loaded["edit"]:
+            mergeEdits(cursor, readHeader(os.path.join(directory, "edit.tsv")))
+        markReverted(cursor)
+
+        currentTime = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        query = """UPDATE partition
+            SET status = "done", end_time_1 = %s
+            WHERE file_name = %s;"""
+        cursor.execute(query, (currentTime, partitionName))
+
+        database.commit()
+    except Exception:
+        database.rollback()
+        raise
+
+    return loaded
+
+
+def findPartitions(stagingDir: str) -> List[str]:
+    """Returns the partitions in stagingDir that parse.py has finished, marked by a
+    file named done, and that haven't been loaded, marked by a file named loaded"""
+    return sorted(
+        name
+        for name in os.listdir(stagingDir)
+        if os.path.exists(os.path.join(stagingDir, name, "done"))
+        and not os.path.exists(os.path.join(stagingDir, name, "loaded"))
+    )
+
+
+def load(stagingDir: str = "../staging/", keep: bool = False, batchSize: int = 1000):
+    """Loads every partition in stagingDir that parse.py has finished and that
+    hasn't been loaded
+
+    Parameters
+    ----------
+    stagingDir: str - directory that parse.py wrote the staging files to
+    keep: bool - keep the staging files of a partition once it is loaded
+    batchSize: int - number of rows inserted together if the server doesn't allow
+      LOAD DATA LOCAL INFILE
+    """
+    partitions = findPartitions(stagingDir)
+
+    if not partitions:
+        print("No partitions to load in %s" % stagingDir)
+        return
+
+    # a connection of its own rather than a kept one from Database.getConnection,
+    # as those don't allow LOAD DATA LOCAL INFILE and the temporary staging tables
+    # would stay on the connection after it is released
+    database, cursor = Database.connect(localInfile=True)
+
+    for query in stagingTables.split(";")[:-1]:
+        cursor.execute(query + ";")
+
+    bulkLoad = True
+    totals = dict.fromkeys(("user", "page", "edit", "reverted"), 0)
+    startTime = time.time()
+
+    try:
+        for partitionName in tqdm(partitions, unit=" partitions"):
+            directory = os.path.join(stagingDir, partitionName)
+
+            try:
+                loaded = loadPartition(
+                    database, cursor, directory, partitionName, bulkLoad, batchSize
+                )
+            except sql.Error as err:
+                if not bulkLoad or err.errno not in localInfileErrors:
+                    raise
+
+                print("LOAD DATA LOCAL INFILE is not allowed, inserting rows instead")
+                bulkLoad = False
+                loaded = loadPartition(
+                    database, cursor, directory, partitionName, bulkLoad, batchSize
+                )
+
+            open(os.path.join(directory, "loaded"), "w").close()
+
+            if not keep:
+                for table in loaded:
+                    os.remove(os.path.join(directory, table + ".tsv"))
+
+            for table, rows in loaded.items():
+                totals[table] += rows
+    finally:
+        elapsed = time.time() - startTime
+        print(
+            "Loaded %d edits, %d pages, %d user counts and %d reverted edits "
+            "in %.1f s, %.0f edits/s"
+            % (
+                totals["edit"],
+                totals["page"],
+                totals["user"],
+                totals["reverted"],
+                elapsed,
+                totals["edit"] / elapsed if elapsed else 0,
+            )
+        )
+
+        cursor.close()
+        database.close()
+
+
+def defineArgParser():
+    """Creates parser for command line arguments"""
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+
+    parser.add_argument(
+        "-s",
+        "--stagingDir",
+        help="Directory that parse.py wrote the staging files to "
+        "[default: ../staging/]",
+        default="../staging/",
+        type=str,
+    )
+
+    parser.add_argument(
+        "-b",
+        "--batchSize",
+        help="Number of rows inserted together if the server doesn't allow "
+        "LOAD DATA LOCAL INFILE [default: 1000]",
+        default=1000,
+        type=int,
+    )
+
+    parser.add_argument(
+        "--keep",
+        help="Keep the staging files of partitions once they are loaded",
+        action="store_true",
+    )
+
+    return parser
+
+
+if __name__ == "__main__":
+    argParser = defineArgParser()
+    clArgs = argParser.parse_args()
+
+    load(stagingDir=clArgs.stagingDir, keep=clArgs.keep, batchSize=clArgs.batchSize)
@@ -42,6 +42,15 @@ def parseError(error):
         outFile.write(traceback.format_exc() + "\n\n")
 
 
+def parseProcess(*args):
+    """Runs parse.multiprocess in a process of its own, logging its errors as
+    parseError does for the pool"""
+    try:
+        parse.multiprocess(*args)
+    except Exception as error:
+        parseError(error)
+
+
 def splitError(error):
     """Logs errors from split processes to a file"""
     currenttime = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -278,7 +287,7 @@ def splitFile(
 ):
     """Split a dump into a number of partitions"""
     if not dryRun:
-        database, cursor = Database.connect()
+        database, cursor = Database.getConnection()
 
         split(
             fileName=fileName,
@@ -289,8 +298,7 @@ def splitFile(
             number=numPartitions,
         )
 
-        cursor.close()
-        database.close()
+        Database.release(database, cursor)
     else:
         split(
             fileName=fileName,
@@ -319,7 +327,7 @@ def checkDiskSpace(dataDir: str) -> int:
 def outstandingJobs() -> int:
     """Returns number of jobs with status 'todo' or 'failed'"""
     query = "SELECT count(*) FROM partition WHERE status = 'todo';"
-    database, cursor = Database.connect()
+    database, cursor = Database.getConnection()
     try:
         cursor.execute(query)
     except BrokenPipeError:
@@ -330,8 +338,7 @@ def outstandingJobs() -> int:
     else:
         numJobs = cursor.fetchone()[0]
 
-        cursor.close()
-        database.close()
+        Database.release(database, cursor)
 
     return numJobs
 
@@ -339,7 +346,7 @@ def outstandingJobs() -> int:
 def jobsDone() -> bool:
     """Returns True if all jobs are done"""
     query = "SELECT count(*) FROM partition WHERE status = 'running' OR status = 'todo'"
-    database, cursor = Database.connect()
+    database, cursor = Database.getConnection()
     try:
         cursor.execute(query)
     except BrokenPipeError:
@@ -348,8 +355,7 @@ def jobsDone() -> bool:
     else:
         numJobs = cursor.fetchone()[0]
 
-        cursor.close()
-        database.close()
+        Database.release(database, cursor)
 
     return numJobs == 0
 
@@ -362,22 +368,23 @@ def markLongRunningJobsAsError():
                SET status = 'failed', error = 'Timed out' 
                WHERE status = 'running'
                AND TIMESTAMPDIFF(MINUTE,start_time_1,CONVERT_TZ(NOW(),'+00:00','-4:00')) > 15;"""
-    database, cursor = Database.connect()
+    database, cursor = Database.getConnection()
     try:
-        # unsure why multi has to be true here but it does ¯\_(ツ)_/¯
-        cursor.execute(query, multi=True)
+        # a single statement, with multi=True its results were left unread on the
+        # connection, which is kept for the next caller once it is released
+        cursor.execute(query)
+        database.commit()
     except BrokenPipeError:
         database.close()
         return
 
-    cursor.close()
-    database.close()
+    Database.release(database, cursor)
 
 
 def removeDoneJobs(partitionsDir: str):
     """Remove partitions that are completed"""
     query = "SELECT file_name FROM partition WHERE status = 'done'"
-    database, cursor = Database.connect()
+    database, cursor = Database.getConnection()
     try:
         cursor.execute(query)
     except BrokenPipeError:
@@ -394,15 +401,14 @@ def removeDoneJobs(partitionsDir: str):
             except FileNotFoundError:
                 pass
 
-    cursor.close()
-    database.close()
+    Database.release(database, cursor)
 
 
 def restartJobs():
     """NOT IMPLEMENTED - Restart jobs labelled failed, mark them as restarted"""
     return
     query = "SELECT file_name FROM partition WHERE status = 'failed'"
-    database, cursor = Database.connect()
+    database, cursor = Database.getConnection()
     try:
         cursor.execute(query)
     except BrokenPipeError:
@@ -424,8 +430,7 @@ def restartJobs():
             WHERE file_name = %s;"""
         cursor.execute(query, (currenttime, file))
 
-    cursor.close()
-    database.close()
+    Database.release(database, cursor)
 
 
 def main(
@@ -439,6 +444,7 @@ def main(
     freeCores: int = 0,
     dryRun: bool = False,
     test: bool = True,
+    diffWorkers: int = 1,
 ):
     """Download a list of dumps if it doesn't exist. If there are no dumps,
     download one and split it, then process the dump on multiple threads
@@ -458,7 +464,11 @@ def main(
     maxSpace: int - maximum number of gigabytes that you would like the program to use.
         At minimum this should be 50gB.
     freeCores: int - the number of cores you don't want to be used. For best results
-        set this to zero."""
+        set this to zero.
+    diffWorkers: int - the number of processes computing diffs for each parse
+        process. Above 1 the parse processes aren't in a pool, as the processes of
+        a pool can't start processes of their own, and there are diffWorkers times
+        fewer of them."""
 
     if test:
         listOfDumps = "../test-dumps.txt"  # not stored in data dir as it stores state
@@ -487,17 +497,26 @@ def main(
         numParseCores = max(ceil((cores - 1) * 0.75), 1)
         numSplitCores = max(round(numParseCores / 3), 1)
 
+    if diffWorkers > 1:
+        numParseCores = max(numParseCores // diffWorkers, 1)
+
     numPartitions = 8 * numParseCores
 
-    parser = multiprocessing.Pool(numParseCores)
-    splitter = multiprocessing.Pool(numSplitCores)
+    parseArgs = (partitionsDir, namespaces, queue, parallelID, dryRun, diffWorkers)
+    parseProcesses = []
 
-    for _ in range(numParseCores):
-        parser.apply_async(
-            parse.multiprocess,
-            (partitionsDir, namespaces, queue, parallelID, dryRun),
-            error_callback=parseError,
-        )
+    if diffWorkers > 1:
+        for _ in range(numParseCores):
+            process = multiprocessing.Process(target=parseProcess, args=parseArgs)
+            process.start()
+            parseProcesses.append(process)
+    else:
+        parser = multiprocessing.Pool(numParseCores)
+
+        for _ in range(numParseCores):
+            parser.apply_async(parse.multiprocess, parseArgs, error_callback=parseError)
+
+    splitter = multiprocessing.Pool(numSplitCores)
 
     dump = createDumpsFile(listOfDumps, wiki, dump, test)
 
@@ -554,7 +573,10 @@ def main(
 
         time.sleep(5)
 
-    # clean up Pool
+    # clean up Pool, the parse processes that aren't in it wait for partitions forever
+    for process in parseProcesses:
+        process.terminate()
+
     print("=== EXIT ===")
 
 
@@ -664,6 +686,14 @@ def defineArgParser():
         type=checkPositive,
     )
 
+    parser.add_argument(
+        "--diffWorkers",
+        help="""Number of processes computing diffs for each parse process, which
+                are then diffWorkers times fewer [default: 1]""",
+        default=1,
+        type=checkPositive,
+    )
+
     return parser
 
 
@@ -683,4 +713,5 @@ if __name__ == "__main__":
         freeCores=clArgs.freeCores,
         dryRun=clArgs.dryrun,
         test=clArgs.test,
+        diffWorkers=clArgs.diffWorkers,
     )
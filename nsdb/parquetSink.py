@@ -0,0 +1,358 @@
+"""
+This module writes the edits of a partition to Parquet files instead of the edit
+table, for analytics that scan a few columns of every edit, such as the averages of
+plot.py, without reading the text of the edits.
+
+parse.py writes the files of a partition with --parquetDir to parquetDir/partition:
+
+    * edit.parquet - the columns of the edit table that aren't text, typed, with the
+      username or IP address of the user of each edit instead of user_table_id,
+      dictionary encoded
+    * text.parquet - the edit_id and the added and deleted text of the edits, in the
+      order of edit.parquet
+    * page.parquet - the pages of the partition and their number of edits
+    * user.parquet - the counts of the users of the partition
+
+Edits are written in row groups of rowGroupRows edits. The files are written to a
+temporary directory that is renamed once the partition has been parsed, after which
+the partition is appended to manifest.jsonl, so readers only see partitions that
+are complete. A partition that is parsed again replaces the one before, which is
+moved aside until then and restored by the next parse if this one stops first. Edits that are reverted once their row group has been written are
+marked by rewriting edit.parquet, one row group at a time, before it is renamed.
+
+pyarrow 14 or later is only needed for --parquetDir.
+"""
+import json
+import os
+import shutil
+from datetime import datetime
+from typing import Dict, List
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+import writer
+
+# user keys repeat across the edits of a partition
+userKey = pa.dictionary(pa.int32(), pa.string())
+
+# types of the columns of edit.parquet and text.parquet, the types of other columns
+# are inferred from the first row group
+columnTypes = {
+    "edit_date": pa.timestamp("s"),
+    "edit_id": pa.int64(),
+    "page_id": pa.int64(),
+    "blanking": pa.bool_(),
+    "username": userKey,
+    "ip_address": userKey,
+    "added": pa.string(),
+    "deleted": pa.string(),
+    "added_length": pa.int32(),
+    "deleted_length": pa.int32(),
+    "ins_internal_link": pa.int32(),
+    "ins_external_link": pa.int32(),
+    "ins_longest_inserted_word": pa.int32(),
+    "ins_longest_character_sequence": pa.int32(),
+    "ins_pronouns": pa.float64(),
+    "ins_capitalization": pa.float64(),
+    "ins_digits": pa.float64(),
+    "ins_special_chars": pa.float64(),
+    "ins_vulgarity": pa.bool_(),
+    "ins_whitespace": pa.float64(),
+    "del_words": pa.int32(),
+    "ins_avg_word_length": pa.float64(),
+    "del_avg_word_length": pa.float64(),
+    "comment_personal_life": pa.bool_(),
+    "comment_copyedit": pa.bool_(),
+    "comment_length": pa.int32(),
+    "comment_special_chars": pa.float64(),
+    "reverted": pa.bool_(),
+}
+
+textColumns = ("added", "deleted")
+
+pageSchema = pa.schema(
+    [
+        ("page_id", pa.int64()),
+        ("namespace", pa.int16()),
+        ("title", pa.string()),
+        ("file_name", pa.string()),
+        ("number_of_edits", pa.int32()),
+    ]
+)
+
+userSchema = pa.schema(
+    [
+        ("user_id", pa.int64()),
+        ("username", pa.string()),
+        ("ip_address", pa.string()),
+        ("namespaces", pa.string()),
+        ("number_of_edits", pa.int32()),
+        ("reverted_edits", pa.int32()),
+        ("talkpage_number_of_edits", pa.int32()),
+        ("talkpage_reverted_edits", pa.int32()),
+    ]
+)
+
+
+def toArray(column: str, values: list) -> pa.Array:
+    """Returns the values of a column as an array of its type, "NULL" as null"""
+    values = [
+        None if isinstance(value, str) and value == "NULL" else value
+        for value in values
+    ]
+
+    # features of the added text are 0 rather than False when nothing was added
+    if columnTypes.get(column) == pa.bool_():
+        values = [None if value is None else bool(value) for value in values]
+
+    return pa.array(values, type=columnTypes.get(column))
+
+
+def readManifest(parquetDir: str) -> Dict[str, dict]:
+    """Returns the partitions that have been written by their name, the last time
+    a partition appears if it was parsed again"""
+    path = os.path.join(parquetDir, "manifest.jsonl")
+    if not os.path.exists(path):
+        return {}
+
+    partitions = {}
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            partition = json.loads(line)
+            partitions[partition["partition"]] = partition
+
+    return partitions
+
+
+def readTable(parquetDir: str, table: str = "edit", columns: List[str] = None):
+    """Returns a table of every partition in the manifest, reading only the given
+    columns
+
+    Parameters
+    ----------
+    parquetDir: str - directory that parse.py wrote the Parquet files to
+    table: str - "edit", "text", "page" or "user"
+    columns: List[str] - columns to read, all of them if None
+    """
+    tables = []
+    for partition in readManifest(parquetDir):
+        path = os.path.join(parquetDir, partition, table + ".parquet")
+        if os.path.exists(path):
+            tables.append(pq.read_table(path, columns=columns))
+
+    return pa.concat_tables(tables, promote_options="default") if tables else None
+
+
+class ParquetBuffer(writer.EditBuffer):
+    """Writes the rows of a partition to Parquet files in parquetDir/partition
+    instead of inserting them
+
+    Parameters
+    ----------
+    parquetDir: str - directory of the Parquet files of every partition
+    partitionName: str - file name of the partition
+    maxRows: int - number of edits held before they are added to the row group
+    maxBytes: int - size of the edits held before they are added to the row group
+    rowGroupRows: int - number of edits in each row group
+    """
+
+    def __init__(
+        self,
+        parquetDir: str,
+        partitionName: str,
+        maxRows: int = 1000,
+        maxBytes: int = 1 << 20,
+        rowGroupRows: int = 65536,
+    ):
+        super().__init__(None, maxRows, maxBytes)
+
+        self.parquetDir = parquetDir
+        self.partitionName = partitionName
+        self.rowGroupRows = rowGroupRows
+
+        self.directory = os.path.join(parquetDir, partitionName)
+        self.temporary = os.path.join(parquetDir, "." + partitionName + ".tmp")
+        self.previous = os.path.join(parquetDir, "." + partitionName + ".old")
+        if os.path.exists(self.temporary):
+            shutil.rmtree(self.temporary)
+        os.makedirs(self.temporary)
+
+        # a partition moved aside by a parse that stopped before publishing the new
+        # one is still the published partition
+        if os.path.exists(self.previous):
+            if os.path.exists(self.directory):
+                shutil.rmtree(self.previous)
+            else:
+                os.replace(self.previous, self.directory)
+
+        self.editColumns = None
+        self.writers = {}
+        self.schemas = {}
+
+        # edits of the row group being filled
+        self.group = []
+        self.rowGroups = 0
+
+        # edits marked as reverted after they were added to a row group, and whether
+        # one of them may have been written already
+        self.lateReverted = set()
+        self.rewrite = False
+
+        # pages waiting for their number of edits, by title and namespace
+        self.pages = {}
+        self.pageRows = []
+
+    def flush(self):
+        """Adds the held edits to the row group, writing it once it is full
+
+        The counts of users are kept until the partition is finished, so that each
+        user has one row in user.parquet.
+        """
+        if not self.rows:
+            return
+
+        index = self.columns.index("user_table_id")
+        columns = self.columns[:index] + self.columns[index + 1 :]
+        columns += ("reverted", "username", "ip_address")
+        if self.editColumns is None:
+            self.editColumns = columns
+        elif columns != self.editColumns:
+            raise ValueError(
+                "The columns of the edits of page %s differ from the earlier edits"
+                % self.page
+            )
+
+        for row in self.rows:
+            column, name = row[index]
+            user = (name, None) if column == "username" else (None, name)
+            reverted = (self.isReverted(row),)
+            self.group.append(row[:index] + row[index + 1 :] + reverted + user)
+
+        self.flushes += 1
+        self.flushedRows += len(self.rows)
+
+        self.clear()
+
+        if len(self.group) >= self.rowGroupRows:
+            self.writeRowGroup()
+
+    def writeRowGroup(self):
+        """Writes the edits of the row group to edit.parquet and their text to
+        text.parquet"""
+        values = dict(zip(self.editColumns, zip(*self.group)))
+        values["reverted"] = [
+            reverted or editId in self.lateReverted
+            for reverted, editId in zip(values["reverted"], values["edit_id"])
+        ]
+
+        text = [column for column in self.editColumns if column in textColumns]
+        tables = {
+            "edit": [
+                column for column in self.editColumns if column not in textColumns
+            ],
+            "text": ["edit_id"] + text if text else [],
+        }
+
+        for table, columns in tables.items():
+            if not columns:
+                continue
+
+            arrays = [toArray(column, values[column]) for column in columns]
+            rowGroup = pa.Table.from_arrays(arrays, names=columns)
+
+            if table not in self.writers:
+                self.schemas[table] = rowGroup.schema
+                self.writers[table] = pq.ParquetWriter(
+                    os.path.join(self.temporary, table + ".parquet"),
+                    rowGroup.schema,
+                    compression="zstd",
+                )
+
+            self.writers[table].write_table(rowGroup.cast(self.schemas[table]))
+
+        self.rowGroups += 1
+        self.group = []
+
+    def addPage(self, pageId: int, namespace: int, title: str, fileName: str):
+        self.pages[(title, str(namespace))] = (pageId, namespace, title, fileName)
+
+    def setPageEdits(self, edits: int, title: str, namespace: str):
+        self.flush()
+
+        page = self.pages.pop((title, str(namespace)))
+        self.pageRows.append(page + (edits,))
+
+    def updateReverted(self, editId: int):
+        self.lateReverted.add(editId)
+        self.rewrite = self.rewrite or self.rowGroups > 0
+
+    def rewriteReverted(self):
+        """Marks the edits in lateReverted as reverted in the row groups that were
+        written before they were reverted"""
+        path = os.path.join(self.temporary, "edit.parquet")
+        source = pq.ParquetFile(path)
+        reverted = pa.array(sorted(self.lateReverted), type=pa.int64())
+
+        with pq.ParquetWriter(
+            path + ".reverted", source.schema_arrow, compression="zstd"
+        ) as output:
+            for i in range(source.num_row_groups):
+                rowGroup = source.read_row_group(i)
+                column = pc.or_(
+                    rowGroup["reverted"],
+                    pc.is_in(rowGroup["edit_id"], value_set=reverted),
+                )
+                rowGroup = rowGroup.set_column(
+                    rowGroup.schema.get_field_index("reverted"), "reverted", column
+                )
+                output.write_table(rowGroup)
+
+        source.close()
+        os.replace(path + ".reverted", path)
+
+    def finish(self):
+        """Writes the rest of the partition, renames its directory and adds it to
+        the manifest"""
+        self.flush()
+        if self.group:
+            self.writeRowGroup()
+
+        for parquetWriter in self.writers.values():
+            parquetWriter.close()
+
+        if self.rewrite and "edit" in self.writers:
+            self.rewriteReverted()
+
+        pages = pa.Table.from_pylist(
+            [dict(zip(pageSchema.names, row)) for row in self.pageRows], pageSchema
+        )
+        pq.write_table(pages, os.path.join(self.temporary, "page.parquet"))
+
+        counts = self.users.takeCounts()
+        users = pa.Table.from_pylist(
+            [dict(zip(userSchema.names, row)) for row in counts], userSchema
+        )
+        pq.write_table(users, os.path.join(self.temporary, "user.parquet"))
+
+        # the partition published by an earlier parse is moved aside rather than
+        # deleted, so that it is kept if the parse stops before the new one replaces
+        # it, and deleted once the new one is in the manifest
+        if os.path.exists(self.directory):
+            os.replace(self.directory, self.previous)
+        os.replace(self.temporary, self.directory)
+
+        partition = {
+            "partition": self.partitionName,
+            "edits": self.flushedRows,
+            "rowGroups": self.rowGroups,
+            "pages": len(self.pageRows),
+            "users": len(counts),
+            "finished": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        with open(os.path.join(self.parquetDir, "manifest.jsonl"), "a") as file:
+            file.write(json.dumps(partition) + "\n")
+
+        if os.path.exists(self.previous):
+            shutil.rmtree(self.previous)
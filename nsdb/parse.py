@@ -5,11 +5,15 @@ and extract features to a database table.
 This tool uses a MySQL database that is configured in the Database() module.
 """
 import argparse
+import multiprocessing
 import os
 import re
 import subprocess
 import sys
+import time
 import traceback
+from collections import Counter, deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
 from datetime import datetime
 from sys import argv
 from typing import List, Tuple
@@ -20,45 +24,48 @@ import tqdm
 from profanity import profanity
 
 import Database
+import features
+import profanityMatcher
+import wordDiff
+import writer
 
 
 def multiprocess(
-    partitionsDir: str, namespaces: List[int], queue, jobId: str, dryRun: bool = False
+    partitionsDir: str,
+    namespaces: List[int],
+    queue,
+    jobId: str,
+    dryRun: bool = False,
+    diffWorkers: int = 1,
 ):
-    """Wrapper around process to call parse in a multiprocessing pool"""
+    """Wrapper around process to call parse in a multiprocessing pool, or in a
+    process that isn't a daemon when diffWorkers is above 1"""
     while True:
         partitionName = queue.get()
 
         parseId = str(jobId) + "_" + str(partitionName)
-        parse(partitionsDir, namespaces, parseId, dryRun, partitionName)
+        parse(
+            partitionName=partitionName,
+            partitionsDir=partitionsDir,
+            namespaces=namespaces,
+            parallel=parseId,
+            dryRun=dryRun,
+            diffWorkers=diffWorkers,
+        )
 
     print("EXIT", flush=True)
 
 
-class fileCursor:
-    testFile = "../test-output.txt"
-    lastrowid = -1
-
-    def __init__(self, partitionName):
-        self.testFile = "../test-output-" + partitionName + ".txt"
-
-    def execute(self, *args):
-        parameters = tuple(map(lambda x: '"' + str(x) + '"', args[1]))
-        output = args[0] % parameters
-        output = " ".join(output.split())
-        with open(self.testFile, "a+") as file:
-            file.write(output + "\n")
-
-
 def markAsNotFound(fileName):
     query = """update partition 
         set status = 'failed', error = 'Not found' 
         where file_name = %s;"""
 
-    database, cursor = Database.connect()
+    # a connection of its own, as the transaction of the parse is rolled back when
+    # the error is raised
+    database, cursor = Database.getConnection()
     cursor.execute(query, (fileName,))
-    cursor.close()
-    database.close()
+    Database.release(database, cursor)
 
 
 def getDump(partitionsDir: str, cursor=0, partitionName: str = ""):
@@ -110,19 +117,79 @@ def getDump(partitionsDir: str, cursor=0, partitionName: str = ""):
     return dump, fileName
 
 
+def checkEditColumns(
+    cursor, selected: List[features.Feature], featureNames: List[str] = None
+) -> List[features.Feature]:
+    """Returns the selected features whose column the edit table has, as databases
+    created before a feature was added don't
+
+    A missing column is left out with a warning, unless its feature was asked for by
+    featureNames, in which case an error is raised.
+
+    Parameters
+    ----------
+    cursor: MySQLCursor - cursor allowing CRUD actions on the DB connections
+    selected: List[features.Feature] - features the parse computes
+    featureNames: List[str] - names or columns of the features asked for, None if
+      the default features were selected
+    """
+    missing = []
+    for feature in selected:
+        # the other columns are in every version of the schema
+        if not feature.definition:
+            continue
+
+        try:
+            cursor.execute("SELECT %s FROM edit LIMIT 0;" % feature.column)
+            cursor.fetchall()
+        except Database.connectionErrors:
+            missing.append(feature)
+
+    asked = [
+        feature.column
+        for feature in missing
+        if featureNames
+        and (feature.name in featureNames or feature.column in featureNames)
+    ]
+    if asked:
+        raise ValueError(
+            "The edit table has no column %s, add it with backfill.py -f %s or "
+            "leave it out of --features" % (", ".join(asked), " ".join(asked))
+        )
+
+    if missing:
+        columns = [feature.column for feature in missing]
+        print(
+            "The edit table has no column %s, which isn't computed. Add it with "
+            "backfill.py -f %s" % (", ".join(columns), " ".join(columns)),
+            flush=True,
+        )
+
+    return [feature for feature in selected if feature not in missing]
+
+
 def parseNonTargetNamespace(
-    page, title: str, namespace: str, cursor, parallel: str = ""
+    page,
+    title: str,
+    namespace: str,
+    cursor,
+    parallel: str = "",
+    editBuffer: writer.EditBuffer = None,
 ):
     """Counts the number of edits each user makes and inserts them to the database.
 
-        Parameters
-        ----------
-        page: mwtypes.Page
-        title: str - Title of the page
-        namespace: str - Namespace of the page
-        cursor: MySQLCursor - cursor allowing CRUD actions on the DB connections
-        parallel: str - id of process, hides progress bars if present
+    Parameters
+    ----------
+    page: mwtypes.Page
+    title: str - Title of the page
+    namespace: str - Namespace of the page
+    cursor: MySQLCursor - cursor allowing CRUD actions on the DB connections
+    parallel: str - id of process, hides progress bars if present
+    editBuffer: writer.EditBuffer - the counts of the users are added to it
     """
+    if editBuffer is None:
+        editBuffer = writer.EditBuffer(cursor, maxRows=1)
+
     userDict = {}
 
     undidRevision = re.compile(r"^Undid revision (\d+) by.*?\|(.*?)\]")
@@ -190,59 +257,26 @@ def parseNonTargetNamespace(
         revertedCount = value[1]
         userId = value[2]
 
-        if userId > -1:
-            query = """INSERT INTO user 
-            (user_id, username, namespaces, number_of_edits, reverted_edits)
-            VALUES (%s, %s, %s, %s, %s) ON DUPLICATE KEY
-            UPDATE
-                namespaces = CONCAT_WS(',', namespaces, %s),
-                number_of_edits = number_of_edits + %s,
-                reverted_edits = reverted_edits + %s;"""
-
-            cursor.execute(
-                query,
-                (
-                    userId,
-                    key,
-                    namespace,
-                    editCount,
-                    revertedCount,
-                    namespace,
-                    editCount,
-                    revertedCount,
-                ),
-            )
-        else:
-            query = """INSERT INTO user 
-            (ip_address, namespaces, number_of_edits, reverted_edits)
-            VALUES (%s, %s, %s, %s) ON DUPLICATE KEY
-            UPDATE
-                namespaces = CONCAT_WS(',', namespaces, %s),
-                number_of_edits = number_of_edits + %s,
-                reverted_edits = reverted_edits + %s;"""
-
-            cursor.execute(
-                query,
-                (
-                    key,
-                    namespace,
-                    editCount,
-                    revertedCount,
-                    namespace,
-                    editCount,
-                    revertedCount,
-                ),
-            )
+        editBuffer.users.addCounts(userId, key, namespace, editCount, revertedCount)
 
-    query = """UPDATE page
-                SET number_of_edits = %s 
-                WHERE title=%s
-                AND namespace = %s;"""
-    cursor.execute(query, (pageEdits, title, namespace))
+    editBuffer.setPageEdits(pageEdits, title, namespace)
 
 
 def parseTargetNamespace(
-    page, title: str, namespace: str, cursor, parallel: str, partitionsDir
+    page,
+    title: str,
+    namespace: str,
+    cursor,
+    parallel: str,
+    partitionsDir,
+    diffEngine: str = "python",
+    diffCache: wordDiff.DiffCache = None,
+    diffStats: Counter = None,
+    diffPool: Executor = None,
+    maxPending: int = 0,
+    featureBatch: int = 0,
+    selected: List[features.Feature] = None,
+    editBuffer: writer.EditBuffer = None,
 ):
     """Extracts features from each revision of a page into a database
 
@@ -257,13 +291,48 @@ def parseTargetNamespace(
     cursor: MySQLCursor - cursor allowing CRUD actions on the DB connections
     parallel: str - id name of parallel slurm process, present if called from parallel,
       hides progress bars
+    diffEngine: str - "python" to diff in process or "wdiff" to call out to wdiff
+    diffCache: wordDiff.DiffCache - diffs shared between pages of a partition, keyed by
+      the hashes of the two revisions
+    diffStats: Counter - counts how the diffs of a partition were computed
+    diffPool: Executor - if given, diffs and their features are computed by the pool
+      while revisions are written in order by this process
+    maxPending: int - number of revisions that can be read ahead of the last one
+      written while their diffs are computed
+    featureBatch: int - if given and diffPool isn't, the features of this many
+      revisions are computed together with NumPy before they are written
+    selected: List[features.Feature] - features to compute, all of them if None
+    editBuffer: writer.EditBuffer - edits waiting to be inserted, flushed at the end
+      of the page. If None each edit is inserted on its own
     """
     blankText = re.compile(r"^\s+$")
-    internalLink = re.compile(r"\[\[.*?\]\]")
-    externalLink = re.compile(r"[^\[]\[[^\[].*?[^\]]\][^\]]")
     undidRevision = re.compile(r"^Undid revision (\d+) by.*?\|(.*?)\]")
 
-    oldText = ""
+    diffState = wordDiff.DiffState(diffStats)
+    previousSha1 = None
+
+    if diffCache is None:
+        diffCache = wordDiff.DiffCache(0)
+
+    if diffStats is None:
+        diffStats = Counter()
+
+    usePool = diffPool is not None and diffEngine != "wdiff"
+
+    if selected is None:
+        selected = features.selectFeatures()
+
+    if editBuffer is None:
+        editBuffer = writer.EditBuffer(cursor, maxRows=1)
+
+    diffSelected, commentSelected = features.splitFeatures(selected)
+
+    batchFeatures = featureBatch > 0 and not usePool
+    if batchFeatures:
+        maxPending = featureBatch - 1
+
+    # diffs put in diffCache until their features are computed with the batch
+    batchCached = []
 
     detector = mwreverts.Detector()
 
@@ -271,6 +340,9 @@ def parseTargetNamespace(
 
     editIdToUserId = {}
 
+    # revisions waiting to be written, with their features or the future of them
+    pending = deque()
+
     ## Extract page features from each revision
     for revision in tqdm.tqdm(
         page, desc=title, unit=" edits", smoothing=0, disable=parallel
@@ -280,187 +352,294 @@ def parseTargetNamespace(
 
         pageEdits = pageEdits + 1
 
-        # Check if not None as there is a user 0, Larry Sanger
-        if revision.user.id is not None:
-            userId = revision.user.id
-            username = revision.user.text
+        submitted = False
 
-            editIdToUserId[revision.id] = userId
+        # if revision has text and the text isn't whitespace
+        if revision.text and not blankText.search(revision.text):
+            # edit wars and reverts flip between the same revisions, so the diff
+            # between two revisions is looked up by their hashes first
+            key = (previousSha1, revision.sha1)
+            cacheable = bool(diffSelected) and diffEngine != "wdiff" and None not in key
+
+            diffFeatures = diffCache.get(key) if cacheable else None
+
+            if not diffSelected:
+                # no feature needs the diff
+                diffState.advance(revision.text)
+                diffFeatures = ()
+            elif diffFeatures is None:
+                if usePool:
+                    diffFeatures = diffPool.submit(
+                        diffWorker, diffState.text, revision.text, diffSelected
+                    )
+                    submitted = True
+
+                    diffState.advance(revision.text)
+                else:
+                    diff = getDiff(
+                        diffState, revision.text, parallel, partitionsDir, diffEngine
+                    )
+                    if batchFeatures:
+                        # replaced by its features once the batch is full
+                        diffFeatures = diff
+                    else:
+                        diffFeatures = getDiffFeatures(diff, diffSelected)
+
+                if cacheable:
+                    diffCache.put(key, diffFeatures)
 
-            query = """INSERT INTO user (user_id, username, namespaces, talkpage_number_of_edits)
-                VALUES (%s, %s, %s, 1) ON DUPLICATE KEY
-                UPDATE
-                    namespaces = CONCAT_WS(',', namespaces, %s),
-                    talkpage_number_of_edits = talkpage_number_of_edits + 1;"""
-            cursor.execute(query, (userId, username, namespace, namespace))
+                    if batchFeatures:
+                        batchCached.append((key, diffFeatures))
+            else:
+                diffState.advance(revision.text)
+
+            previousSha1 = revision.sha1
         else:
-            ipAddress = revision.user.text
+            diffFeatures = None
+
+        pending.append((revision, diffFeatures, submitted))
+
+        if batchFeatures and len(pending) > maxPending:
+            getPendingFeatures(pending, diffSelected, diffCache, batchCached)
+            keep = 0
+        else:
+            keep = maxPending
+
+        while len(pending) > keep:
+            writeRevision(
+                *pending.popleft(),
+                namespace,
+                cursor,
+                detector,
+                undidRevision,
+                editIdToUserId,
+                diffStats,
+                diffSelected,
+                commentSelected,
+                editBuffer,
+            )
 
-            query = """INSERT INTO user (ip_address, namespaces, talkpage_number_of_edits)
-                VALUES (%s, %s, 1) ON DUPLICATE KEY
-                UPDATE
-                    namespaces = CONCAT_WS(',', namespaces, %s),
-                    talkpage_number_of_edits = talkpage_number_of_edits + 1;"""
-            cursor.execute(query, (ipAddress, namespace, namespace))
+    if batchFeatures:
+        getPendingFeatures(pending, diffSelected, diffCache, batchCached)
+
+    while pending:
+        writeRevision(
+            *pending.popleft(),
+            namespace,
+            cursor,
+            detector,
+            undidRevision,
+            editIdToUserId,
+            diffStats,
+            diffSelected,
+            commentSelected,
+            editBuffer,
+        )
 
-        userTableId = cursor.lastrowid
+    editBuffer.setPageEdits(pageEdits, title, namespace)
+
+
+def writeRevision(
+    revision,
+    diffFeatures,
+    submitted: bool,
+    namespace: str,
+    cursor,
+    detector,
+    undidRevision,
+    editIdToUserId,
+    diffStats: Counter,
+    diffSelected: List[features.Feature],
+    commentSelected: List[features.Feature],
+    editBuffer: writer.EditBuffer,
+):
+    """Adds the user and edit of a revision into the database and checks whether
+    it reverts an earlier edit. Must be called for the revisions of a page in order.
 
-        editDate = datetime.strptime(str(revision.timestamp), "%Y-%m-%dT%H:%M:%SZ")
+    Parameters
+    ----------
+    revision: mwtypes.Revision
+    diffFeatures: tuple - from getDiffFeatures, or a future of them from diffWorker, None
+      if the revision is blank
+    submitted: bool - whether this revision submitted the future, so its diff is only
+      counted once when the future is shared through the diff cache
+    diffSelected: List[features.Feature] - features computed from the diff, in the
+      order of diffFeatures
+    commentSelected: List[features.Feature] - features computed from the comment
+    editBuffer: writer.EditBuffer - the edit and the counts of its user are added to
+      it instead of inserted
+    """
+    if isinstance(diffFeatures, Future):
+        diffFeatures, stats = diffFeatures.result()
 
-        editId = revision.id
-        pageId = revision.page.id
+        if submitted:
+            diffStats.update(stats)
 
-        # if revision has text and the text isn't whitespace
-        if revision.text and not blankText.search(revision.text):
-            blanking = False
-            (added, deleted) = getDiff(oldText, revision.text, parallel, partitionsDir)
-            blankAddition = blankText.search(added)
+    # Check if not None as there is a user 0, Larry Sanger
+    if revision.user.id is not None:
+        editIdToUserId[revision.id] = revision.user.id
 
-            addedLength = len(added)
-            deletedLength = len(deleted)
+    # replaced by the id of the user when the edit is inserted
+    userTableId = editBuffer.users.addEdit(
+        revision.user.id, revision.user.text, namespace
+    )
 
-            if added and not blankAddition:
-                insInternalLink = len(internalLink.findall(added))
-                insExternalLink = len(externalLink.findall(added))
+    editDate = datetime.strptime(str(revision.timestamp), "%Y-%m-%dT%H:%M:%SZ")
 
-                insLongestInsertedWord = longestWord(added)
-                insLongestCharacterSequence = longestCharSequence(added)
+    editId = revision.id
+    pageId = revision.page.id
 
-                insCapitalization = ratioCapitals(added)
-                insDigits = ratioDigits(added)
-                insSpecialChars = ratioSpecial(added)
-                insWhitespace = ratioWhitespace(added)
+    if diffFeatures is not None:
+        blanking = False
+    else:
+        blanking = True
 
-                insPronouns = ratioPronouns(added)
-                insVulgarity = containsVulgarity(added)
-            else:
-                insInternalLink = 0
-                insExternalLink = 0
+        diffFeatures = tuple(feature.missing for feature in diffSelected)
 
-                insLongestInsertedWord = 0
-                insLongestCharacterSequence = 0
+    if revision.comment:
+        commentFeatures = features.computeFeatures(
+            commentSelected, features.EditText(comment=revision.comment)
+        )
+    else:
+        commentFeatures = tuple(feature.missing for feature in commentSelected)
 
-                insCapitalization = 0
-                insDigits = 0
-                insSpecialChars = 0
-                if blankAddition:
-                    insWhitespace = 1
-                else:
-                    insWhitespace = 0
+    checkReverted(
+        detector, revision, cursor, undidRevision, True, editIdToUserId, editBuffer
+    )
 
-                insPronouns = 0
-                insVulgarity = 0
+    columns = ("edit_date", "edit_id", "page_id", "blanking", "user_table_id")
+    columns += tuple(feature.column for feature in diffSelected + commentSelected)
 
-            delWords = len(deleted.split(" "))
+    editTuple = (editDate, editId, pageId, blanking, userTableId)
+    editTuple += diffFeatures + commentFeatures
 
-            added = added[:65535]
-            deleted = deleted[:65535]
+    ## Insert page features into database
+    editBuffer.add(columns, editTuple, revision.page.title)
 
-            oldText = revision.text
-        else:
-            blanking = True
-
-            added = "NULL"
-            deleted = "NULL"
-
-            addedLength = 0
-            deletedLength = 0
-            delWords = 0
-
-            insInternalLink = "NULL"
-            insExternalLink = "NULL"
-            insLongestInsertedWord = "NULL"
-            insLongestCharacterSequence = "NULL"
-            insCapitalization = "NULL"
-            insDigits = "NULL"
-            insSpecialChars = "NULL"
-            insWhitespace = "NULL"
-            insPronouns = "NULL"
-            insVulgarity = "NULL"
-
-        if revision.comment:
-            comment = revision.comment.lower()
-            commentCopyedit = "copyedit" in comment
-            commentPersonalLife = "personal life" in comment
-            commentLength = len(comment)
-            commentSpecialChars = ratioSpecial(comment)
-        else:
-            commentCopyedit = "NULL"
-            commentPersonalLife = "NULL"
-            commentLength = "NULL"
-            commentSpecialChars = "NULL"
-
-        checkReverted(detector, revision, cursor, undidRevision, True, editIdToUserId)
-
-        query = """
-        INSERT INTO edit (added, deleted, added_length, deleted_length, edit_date, 
-            edit_id, page_id, ins_internal_link, ins_external_link, 
-            ins_longest_inserted_word, ins_longest_character_sequence, 
-            ins_pronouns, ins_capitalization, ins_digits, ins_special_chars, 
-            ins_vulgarity, ins_whitespace, del_words, comment_personal_life, 
-            comment_copyedit, comment_length, comment_special_chars, blanking, 
-            user_table_id
-        ) VALUES (
-            %s, %s, %s, %s, %s,
-            %s, %s, %s, %s,
-            %s, %s, 
-            %s, %s, %s, %s, 
-            %s, %s, %s, %s, 
-            %s, %s, %s, %s,
-            %s
-        );
-        """
-
-        editTuple = (
-            added,
-            deleted,
-            addedLength,
-            deletedLength,
-            editDate,
-            editId,
-            pageId,
-            insInternalLink,
-            insExternalLink,
-            insLongestInsertedWord,
-            insLongestCharacterSequence,
-            insPronouns,
-            insCapitalization,
-            insDigits,
-            insSpecialChars,
-            insVulgarity,
-            insWhitespace,
-            delWords,
-            commentPersonalLife,
-            commentCopyedit,
-            commentLength,
-            commentSpecialChars,
-            blanking,
-            userTableId,
-        )
 
-        ## Insert page features into database
-        cursor.execute(query, editTuple)
+def getDiffFeatures(
+    diff: wordDiff.Diff,
+    selected: List[features.Feature] = None,
+    insertion: features.InsertionFeatures = None,
+) -> tuple:
+    """Returns the columns of an edit that only depend on its diff
+
+    Parameters
+    ----------
+    diff: wordDiff.Diff
+    selected: List[features.Feature] - features to compute, all of those computed
+      from the diff if None
+    insertion: features.InsertionFeatures - features of the added text if they have
+      already been computed
+
+    Returns
+    -------
+    features: tuple - the value of each selected feature
+    """
+    if selected is None:
+        selected, _ = features.splitFeatures(features.selectFeatures())
+
+    text = features.EditText(
+        diff.added,
+        diff.deleted,
+        diff.addedWords,
+        diff.deletedWords,
+        insertion=insertion,
+    )
 
-    query = """UPDATE page
-                SET number_of_edits = %s 
-                WHERE title=%s
-                AND namespace = %s;"""
-    cursor.execute(query, (pageEdits, title, namespace))
+    return features.computeFeatures(selected, text)
 
 
-def getDiff(old: str, new: str, parallel: str, partitionsDir) -> Tuple[str, str]:
-    """Returns the diff between two edits using wdiff
+def getPendingFeatures(
+    pending: deque,
+    selected: List[features.Feature],
+    diffCache: wordDiff.DiffCache = None,
+    cached: list = None,
+):
+    """Replaces the diffs of the revisions waiting to be written with their
+    features, which are computed together
 
     Parameters
     ----------
-    old : str - old revision
+    pending: deque - revisions waiting to be written with their diff or features
+    selected: List[features.Feature] - features computed from the diff
+    diffCache: wordDiff.DiffCache - cache the diffs were put in
+    cached: list - keys and diffs put in diffCache since the last batch, which are
+      replaced by their features so that a hit doesn't compute them again
+    """
+    # NumPy is only needed when features are batched
+    import featuresBatch
+
+    # a diff from the cache can be pending more than once, by its id
+    diffs = {}
+    for _, diffFeatures, _ in pending:
+        if isinstance(diffFeatures, wordDiff.Diff):
+            diffs[id(diffFeatures)] = diffFeatures
+
+    insertions = featuresBatch.batchInsertionFeatures(
+        [diff.added for diff in diffs.values()]
+    )
+    computed = {
+        diffId: getDiffFeatures(diff, selected, insertion)
+        for (diffId, diff), insertion in zip(diffs.items(), insertions)
+    }
+
+    for i, (revision, diffFeatures, submitted) in enumerate(pending):
+        if isinstance(diffFeatures, wordDiff.Diff):
+            pending[i] = (revision, computed[id(diffFeatures)], submitted)
+
+    if cached:
+        for key, diff in cached:
+            diffCache.put(key, computed[id(diff)])
+
+        cached.clear()
+
+
+def diffWorker(
+    old: str, new: str, selected: List[features.Feature]
+) -> Tuple[tuple, Counter]:
+    """Returns the features of the diff between two revisions and how the diff was
+    computed, run by the diff pool of a partition"""
+    stats = Counter()
+
+    return getDiffFeatures(wordDiff.diffRevisions(old, new, stats), selected), stats
+
+
+def getDiff(
+    diffState: wordDiff.DiffState,
+    new: str,
+    parallel: str,
+    partitionsDir,
+    diffEngine: str = "python",
+) -> wordDiff.Diff:
+    """Returns the diff between the previous revision of a page and a new one
+
+    Parameters
+    ----------
+    diffState : wordDiff.DiffState - holds the previous revision of the page
     new : str - new revision
+    parallel: str - id of the parallel process, 0 if not
+    diffEngine: str - "python" to diff in process or "wdiff" to call out to wdiff
 
     Returns
     -------
-    added: str - all the text that is exclusively in the new revision
-    deleted: str - all the text that is exclusively in the old revision
-    parallel: str - id of the parallel process, 0 if not
+    diff: wordDiff.Diff - the text exclusively in the new revision (added) and in the
+      old revision (deleted), along with the words they are made of
+    """
+    if diffEngine == "wdiff":
+        added, deleted = getWdiff(diffState.text, new, parallel, partitionsDir)
+        diffState.text = new
+
+        return wordDiff.Diff(added, deleted, added.split(), deleted.split())
+
+    return diffState.diff(new)
+
+
+def getWdiff(old: str, new: str, parallel: str, partitionsDir) -> Tuple[str, str]:
+    """Returns the diff between two edits using wdiff
+
+    The old revision is read from the file written by the previous call, so this
+    must be called for every revision of a page in order.
     """
     oldrevision = "revision/old" + parallel + ".txt"
     newrevision = "revision/new" + parallel + ".txt"
@@ -468,12 +647,22 @@ def getDiff(old: str, new: str, parallel: str, partitionsDir) -> Tuple[str, str]
     with open(newrevision, "w") as newFile:
         newFile.writelines(new)
 
+    added, deleted = runWdiff(oldrevision, newrevision)
+
+    os.rename(newrevision, oldrevision)
+    open(partitionsDir + "revision/new" + parallel + ".txt", "w").close()
+
+    return added, deleted
+
+
+def runWdiff(oldFile: str, newFile: str) -> Tuple[str, str]:
+    """Returns the words only in newFile and the words only in oldFile using wdiff"""
     lineSeperators = re.compile(
         r"======================================================================"
     )
 
     added = (
-        subprocess.run(["wdiff", "-13", oldrevision, newrevision], capture_output=True)
+        subprocess.run(["wdiff", "-13", oldFile, newFile], capture_output=True)
         .stdout.decode("utf-8")
         .strip()
     )
@@ -481,24 +670,29 @@ def getDiff(old: str, new: str, parallel: str, partitionsDir) -> Tuple[str, str]
     added = lineSeperators.sub("", added)
 
     deleted = (
-        subprocess.run(["wdiff", "-23", oldrevision, newrevision], capture_output=True)
+        subprocess.run(["wdiff", "-23", oldFile, newFile], capture_output=True)
         .stdout.decode("utf-8")
         .strip()
     )
 
     deleted = lineSeperators.sub("", deleted)
 
-    os.rename(newrevision, oldrevision)
-    open(partitionsDir + "revision/new" + parallel + ".txt", "w").close()
-
     return added, deleted
 
 
 def checkReverted(
-    detector, revision, cursor, undidRevision, target: bool, editIdToUserId
+    detector,
+    revision,
+    cursor,
+    undidRevision,
+    target: bool,
+    editIdToUserId,
+    editBuffer: writer.EditBuffer = None,
 ):
-    """Inserts reverted edits into the database for target namespace, otherwise 
-    returns the user that was reverted"""
+    """Inserts reverted edits into the database for target namespace, otherwise
+    returns the user that was reverted. For the target namespace the reverted edit
+    may still be in editBuffer, which marks it as reverted and counts the reverted
+    user."""
     reverted = detector.process(
         revision.sha1,
         [
@@ -526,24 +720,9 @@ def checkReverted(
                     userId = revert["userId"]
 
                 if target:
-                    query = """UPDATE edit
-                        SET reverted = True
-                        WHERE edit_id = %s;"""
-                    cursor.execute(query, (revisionId,))
-
-                    if userId != -1:
-                        query = """
-                        INSERT INTO user (user_id, username, talkpage_reverted_edits)
-                            VALUES (%s, %s, 1) ON DUPLICATE KEY
-                            UPDATE
-                                talkpage_reverted_edits = talkpage_reverted_edits + 1;"""
-                        cursor.execute(query, (userId, user))
-                    else:
-                        query = """INSERT INTO user (ip_address, talkpage_reverted_edits)
-                            VALUES (%s, 1) ON DUPLICATE KEY
-                            UPDATE
-                                talkpage_reverted_edits = talkpage_reverted_edits + 1;"""
-                        cursor.execute(query, (user,))
+                    editBuffer.markReverted(revisionId)
+
+                    editBuffer.users.addReverted(userId, user)
 
                 else:
                     user = {"user": user, "userId": userId}
@@ -562,25 +741,9 @@ def checkReverted(
                 userId = -1
 
             if target:
-                query = """UPDATE edit
-                        SET reverted = True
-                        WHERE edit_id = %s;"""
-                cursor.execute(query, (revisionId,))
-
-                if userId != -1:
-                    query = """INSERT INTO user
-                        (user_id, username, talkpage_reverted_edits)
-                        VALUES (%s, %s, 1) ON DUPLICATE KEY
-                        UPDATE
-                            talkpage_reverted_edits = talkpage_reverted_edits + 1;"""
-                    cursor.execute(query, (userId, user))
-                else:
-                    query = """INSERT INTO user
-                        (ip_address, talkpage_reverted_edits)
-                        VALUES (%s, 1) ON DUPLICATE KEY
-                        UPDATE
-                            talkpage_reverted_edits = talkpage_reverted_edits + 1;"""
-                    cursor.execute(query, (user,))
+                editBuffer.markReverted(revisionId)
+
+                editBuffer.users.addReverted(userId, user)
 
             else:
                 return [{"user": user, "userId": userId}]
@@ -673,7 +836,10 @@ def ratioPronouns(string: str) -> int:
 
 
 def containsVulgarity(string: str) -> bool:
-    """Returns whether text contains profanity based on a simple wordlist approach"""
+    """Returns whether text contains profanity based on a simple wordlist approach
+
+    Edits are checked by profanityMatcher instead, which only matches whole words.
+    """
     return profanity.contains_profanity(string)
 
 
@@ -683,6 +849,20 @@ def parse(
     namespaces: List[int] = [1],
     parallel: str = "",
     dryRun: bool = False,
+    diffEngine: str = "python",
+    diffCacheSize: int = 256,
+    diffWorkers: int = 1,
+    featureBatch: int = 0,
+    profanityWordlist: str = None,
+    featureNames: List[str] = None,
+    flushRows: int = 1000,
+    flushBytes: int = 1 << 20,
+    userCacheSize: int = 100000,
+    stagingDir: str = "",
+    transactions: str = "statement",
+    writerQueue: int = 16,
+    parquetDir: str = "",
+    rowGroupRows: int = 65536,
 ):
     """Selects the next dump from the database, extracts the features and
     imports them into several database tables.
@@ -696,25 +876,133 @@ def parse(
     partitionsDir: str - where the partitions are stored
     namespaces : list[int] - Wikipedia namespaces of interest.
     parallel: str - whether to parse with multiple cores
+    diffEngine: str - "python" to diff in process or "wdiff" to call out to wdiff
+    diffCacheSize: int - number of diffs to keep for reverted revisions, 0 to disable
+    diffWorkers: int - number of processes computing diffs and features while this
+      process writes to the database, 1 to do everything in this process
+    featureBatch: int - number of edits whose features are computed together with
+      NumPy, 0 to compute them one at a time
+    profanityWordlist: str - file with one profane word per line, the wordlist of
+      the profanity package if None
+    featureNames: List[str] - names or columns of the features to compute, all of
+      them if None
+    flushRows: int - number of edits inserted together, 1 to insert each edit on its
+      own
+    flushBytes: int - size of the edits at which they are inserted before flushRows
+      is reached
+    userCacheSize: int - number of user ids this process keeps between flushes, 0
+      to select the ids of every flush
+    stagingDir: str - directory to write the rows of the partition to for loader.py
+      instead of inserting them, which needs partitionName and no database
+    transactions: str - "statement" to commit each statement, "page" to commit
+      each page or a number of edits after which the page they are on is committed
+    writerQueue: int - number of writes waiting for the writer thread, 0 to write
+      on the parse thread
+    parquetDir: str - directory to write the edits of the partition to as Parquet
+      instead of inserting them, which needs partitionName and no database
+    rowGroupRows: int - number of edits in each row group of the Parquet files
     """
-    if not dryRun:
-        database, cursor = Database.connect()
+    if stagingDir and parquetDir:
+        raise ValueError("Rows can be staged or written as Parquet, not both")
+
+    # rows are written to files rather than to a database
+    fileOutput = stagingDir or parquetDir or dryRun
+
+    if fileOutput and not partitionName:
+        raise ValueError("Writing rows to files needs the name of a partition")
+
+    selected = features.selectFeatures(featureNames)
+
+    if fileOutput:
+        database = cursor = None
     else:
-        cursor = fileCursor(partitionName)
+        database, cursor = Database.getConnection(
+            autocommit=transactions == "statement"
+        )
 
-    if not os.path.exists(partitionsDir + "revision"):
-        os.mkdir(partitionsDir + "revision")
+        try:
+            selected = checkEditColumns(cursor, selected, featureNames)
+        except ValueError:
+            Database.release(database, cursor)
+            raise
 
-    open(partitionsDir + "revision/old" + parallel + ".txt", "w").close()
-    open(partitionsDir + "revision/new" + parallel + ".txt", "w").close()
+    useWdiff = diffEngine == "wdiff"
+
+    userCache = writer.getUserIdCache(userCacheSize)
+    userCacheHits, userCacheMisses = userCache.hits, userCache.misses
+
+    if stagingDir:
+        asyncWriter = None
+        editBuffer = writer.StagingBuffer(
+            stagingDir, partitionName, flushRows, flushBytes
+        )
+    elif parquetDir:
+        # pyarrow is only needed for Parquet
+        import parquetSink
+
+        asyncWriter = None
+        editBuffer = parquetSink.ParquetBuffer(
+            parquetDir, partitionName, flushRows, flushBytes, rowGroupRows
+        )
+    elif dryRun:
+        asyncWriter = None
+        editBuffer = writer.DryRunBuffer(
+            "../test-output-" + partitionName + ".jsonl", flushRows, flushBytes
+        )
+    else:
+        asyncWriter = writer.AsyncWriter(writerQueue) if writerQueue > 0 else None
+        editBuffer = writer.EditBuffer(
+            cursor,
+            flushRows,
+            flushBytes,
+            writer.UserCounts(cursor, userCache),
+            database,
+            transactions,
+            asyncWriter=asyncWriter,
+        )
+
+    profanityMatcher.setWordlist(profanityWordlist)
+    matcher = profanityMatcher.getMatcher()
+
+    diffCache = wordDiff.DiffCache(diffCacheSize)
+    diffStats = Counter()
+
+    if diffWorkers > 1 and multiprocessing.current_process().daemon:
+        # the diffs are pure Python, so threads wouldn't use more cores
+        print(
+            "Daemonic processes can't start diff workers, computing diffs on the "
+            "parse process",
+            flush=True,
+        )
+        diffWorkers = 1
+
+    if diffWorkers > 1 and not useWdiff:
+        diffPool = ProcessPoolExecutor(
+            diffWorkers,
+            initializer=profanityMatcher.setWordlist,
+            initargs=(profanityWordlist,),
+        )
+
+        maxPending = 4 * diffWorkers
+    else:
+        diffPool = None
+        maxPending = 0
+
+    if useWdiff:
+        if not os.path.exists(partitionsDir + "revision"):
+            os.mkdir(partitionsDir + "revision")
+
+        open(partitionsDir + "revision/old" + parallel + ".txt", "w").close()
+        open(partitionsDir + "revision/new" + parallel + ".txt", "w").close()
+
+    startTime = time.time()
 
     try:
-        if not dryRun:
+        if not fileOutput:
             dump, fileName = getDump(partitionsDir, cursor=cursor)
+            editBuffer.commitNow()
 
             if dump is None:
-                cursor.close()
-                database.close()
                 return
         else:
             dump, fileName = getDump(partitionsDir, partitionName=partitionName)
@@ -724,30 +1012,48 @@ def parse(
         # dump = mwxml.Dump.from_page_xml(open(fileName))
 
         for page in dump:
-            open(partitionsDir + "revision/old" + parallel + ".txt", "w").close()
-            open(partitionsDir + "revision/new" + parallel + ".txt", "w").close()
+            if useWdiff:
+                open(partitionsDir + "revision/old" + parallel + ".txt", "w").close()
+                open(partitionsDir + "revision/new" + parallel + ".txt", "w").close()
 
             namespace = page.namespace
             title = page.title
-            query = """INSERT IGNORE INTO page (page_id, namespace, title, file_name)
-                VALUES (%s, %s, %s, %s)"""
-            cursor.execute(query, (page.id, namespace, title, fileName))
+            editBuffer.addPage(page.id, namespace, title, fileName)
 
             if namespace not in namespaces:
-                parseNonTargetNamespace(page, title, str(namespace), cursor, parallel)
+                parseNonTargetNamespace(
+                    page, title, str(namespace), cursor, parallel, editBuffer
+                )
 
                 continue
 
             parseTargetNamespace(
-                page, title, str(namespace), cursor, parallel, partitionsDir
+                page,
+                title,
+                str(namespace),
+                cursor,
+                parallel,
+                partitionsDir,
+                diffEngine,
+                diffCache,
+                diffStats,
+                diffPool,
+                maxPending,
+                featureBatch,
+                selected,
+                editBuffer,
             )
 
-        ## Change status of dump
-        currentTime = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        query = """UPDATE partition
-            SET status = "done", end_time_1 = %s 
-            WHERE file_name = %s;"""
-        cursor.execute(query, (currentTime, fileName))
+        editBuffer.finish()
+
+        ## Change status of dump, loader.py changes it once staged rows are loaded
+        if not fileOutput:
+            currentTime = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            query = """UPDATE partition
+                SET status = "done", end_time_1 = %s 
+                WHERE file_name = %s;"""
+            cursor.execute(query, (currentTime, fileName))
+            editBuffer.commitNow()
 
     except OSError:
         err = str(sys.exc_info()[1])
@@ -772,23 +1078,112 @@ def parse(
             file.write(str(e) + "\n\n")
             file.write(traceback.format_exc() + "\n\n")
 
-        query = """UPDATE partition
-            SET
-                status = "failed",
-                end_time_1 = %s,
-                error = %s
-            WHERE
-                file_name = %s;"""
-        cursor.execute(query, (currentTime, err, fileName))
+        if not fileOutput:
+            editBuffer.rollback()
 
-        raise
+            query = """UPDATE partition
+                SET
+                    status = "failed",
+                    end_time_1 = %s,
+                    error = %s
+                WHERE
+                    file_name = %s;"""
+            cursor.execute(query, (currentTime, err, fileName))
+            editBuffer.commitNow()
 
-    os.remove(partitionsDir + "revision/old" + parallel + ".txt")
-    os.remove(partitionsDir + "revision/new" + parallel + ".txt")
+        raise
+    finally:
+        if diffPool is not None:
+            diffPool.shutdown()
+
+        if asyncWriter is not None:
+            asyncWriter.close()
+
+        if database is not None:
+            Database.release(database, cursor)
+
+    print(
+        "Diffs for %s: %d fast path, %d windowed, %d in hunks, %d full, "
+        "%d unchanged, %d cache hits, %d cache misses"
+        % (
+            fileName,
+            diffStats["fastPath"],
+            diffStats["window"],
+            diffStats["hunks"],
+            diffStats["full"],
+            diffStats["unchanged"],
+            diffCache.hits,
+            diffCache.misses,
+        ),
+        flush=True,
+    )
+    print(
+        "Edits for %s: %d %s in %d flushes, %d users %s in %d flushes"
+        % (
+            fileName,
+            editBuffer.flushedRows,
+            "written to files" if fileOutput else "inserted",
+            editBuffer.flushes,
+            editBuffer.users.flushedUsers,
+            "written to files" if fileOutput else "upserted",
+            editBuffer.users.flushes,
+        ),
+        flush=True,
+    )
+    elapsed = time.time() - startTime
+    print(
+        "Time for %s: %.2f s, %.0f edits/s"
+        % (fileName, elapsed, editBuffer.flushedRows / elapsed if elapsed else 0),
+        flush=True,
+    )
+    if dryRun and not stagingDir and not parquetDir:
+        print(
+            "Dry run for %s: %d rows written to %s"
+            % (fileName, editBuffer.records, editBuffer.path),
+            flush=True,
+        )
+    print(
+        "Reverts for %s: %d resolved in memory, %d resolved after their edits were "
+        "written" % (fileName, editBuffer.revertedInMemory, editBuffer.revertedUpdates),
+        flush=True,
+    )
+    print(
+        "Transactions for %s: %d committed, %d replayed"
+        % (fileName, editBuffer.commits, editBuffer.replays),
+        flush=True,
+    )
+    if asyncWriter is not None:
+        print(
+            "Writer for %s: %d writes, %.1f ms mean and %.1f ms max latency, "
+            "%d max queue depth, %.2f s waiting on a full queue"
+            % (
+                fileName,
+                asyncWriter.writes,
+                asyncWriter.writeSeconds * 1000 / max(asyncWriter.writes, 1),
+                asyncWriter.maxWriteSeconds * 1000,
+                asyncWriter.maxDepth,
+                asyncWriter.blockedSeconds,
+            ),
+            flush=True,
+        )
+    print(
+        "User ids for %s: %d cache hits, %d cache misses"
+        % (
+            fileName,
+            userCache.hits - userCacheHits,
+            userCache.misses - userCacheMisses,
+        ),
+        flush=True,
+    )
+    print(
+        "Profanity matcher for %s: %d words built in %.2f ms"
+        % (fileName, len(matcher.words), matcher.buildSeconds * 1000),
+        flush=True,
+    )
 
-    if not dryRun:
-        cursor.close()
-        database.close()
+    if useWdiff:
+        os.remove(partitionsDir + "revision/old" + parallel + ".txt")
+        os.remove(partitionsDir + "revision/new" + parallel + ".txt")
 
 
 def defineArgParser():
@@ -799,7 +1194,8 @@ def defineArgParser():
 
     parser.add_argument(
         "--dryrun",
-        help="Don't use a database, no partitions will be deleted",
+        help="Don't use a database, no partitions will be deleted. The rows that "
+        "would have been written are written to ../test-output-PARTITION.jsonl",
         action="store_true",
     )
 
@@ -836,6 +1232,131 @@ def defineArgParser():
         type=str,
     )
 
+    parser.add_argument(
+        "--diffCacheSize",
+        help="Number of diffs to keep for reverted revisions, 0 to disable [default: 256]",
+        default=256,
+        type=int,
+    )
+
+    parser.add_argument(
+        "--diffWorkers",
+        help="Number of processes computing diffs while edits are written [default: 1]",
+        default=1,
+        type=int,
+    )
+
+    parser.add_argument(
+        "--featureBatch",
+        help="Number of edits whose features are computed together with NumPy, "
+        "0 to compute them one at a time [default: 0]",
+        default=0,
+        type=int,
+    )
+
+    parser.add_argument(
+        "--profanityWordlist",
+        help="File with one profane word per line, for wikis in other languages "
+        "[default: the wordlist of the profanity package]",
+        default=None,
+        type=str,
+    )
+
+    parser.add_argument(
+        "--features",
+        help="Features to compute, by name or column [default: all of them that the "
+        "edit table has]",
+        choices=list(
+            dict.fromkeys(
+                [feature.name for feature in features.registry]
+                + [feature.column for feature in features.registry]
+            )
+        ),
+        default=None,
+        metavar="FEATURE",
+        nargs="+",
+    )
+
+    parser.add_argument(
+        "--flushRows",
+        help="Number of edits inserted with one query, 1 to insert each edit on its "
+        "own [default: 1000]",
+        default=1000,
+        type=int,
+    )
+
+    parser.add_argument(
+        "--flushBytes",
+        help="Size in bytes of the edits at which they are inserted before "
+        "flushRows is reached, below max_allowed_packet [default: 1048576]",
+        default=1 << 20,
+        type=int,
+    )
+
+    parser.add_argument(
+        "--userCacheSize",
+        help="Number of user ids each process keeps, 0 to look them up every time "
+        "edits are inserted [default: 100000]",
+        default=100000,
+        type=int,
+    )
+
+    def checkTransactions(value):
+        if value in ("statement", "page") or value.isdigit() and int(value) > 0:
+            return value
+        raise argparse.ArgumentTypeError(
+            "invalid transaction policy: '%s', use statement, page or a number of "
+            "edits" % value
+        )
+
+    parser.add_argument(
+        "--transactions",
+        help="Commit each statement, each page or pages once a number of edits "
+        "have been written [default: statement]",
+        default="statement",
+        type=checkTransactions,
+    )
+
+    parser.add_argument(
+        "--writerQueue",
+        help="Number of writes waiting for the writer thread, which writes to the "
+        "database while parsing goes on, 0 to write on the parse thread "
+        "[default: 16]",
+        default=16,
+        type=int,
+    )
+
+    parser.add_argument(
+        "--stagingDir",
+        help="Write the rows of the partition set by --partitionName to files in "
+        "this directory for loader.py instead of a database [default: '']",
+        default="",
+        type=str,
+    )
+
+    parser.add_argument(
+        "--parquetDir",
+        help="Write the edits of the partition set by --partitionName as Parquet "
+        "files in this directory instead of a database, which needs pyarrow "
+        "[default: '']",
+        default="",
+        type=str,
+    )
+
+    parser.add_argument(
+        "--rowGroupRows",
+        help="Number of edits in each row group of the Parquet files "
+        "[default: 65536]",
+        default=65536,
+        type=int,
+    )
+
+    parser.add_argument(
+        "--wdiff",
+        help="Use wdiff to compute diffs instead of the built-in word diff",
+        action="store_true",
+    )
+
     return parser
 
 
@@ -848,6 +1369,20 @@ if __name__ == "__main__":
         partitionName=clArgs.partitionName,
         partitionsDir=clArgs.partitionsDir,
         namespaces=clArgs.namespaces,
-        parallel=clArgs.parallel,
-        dryRun=clArgs.dryRun,
+        parallel=clArgs.parallelID,
+        dryRun=clArgs.dryrun,
+        diffEngine="wdiff" if clArgs.wdiff else "python",
+        diffCacheSize=clArgs.diffCacheSize,
+        diffWorkers=clArgs.diffWorkers,
+        featureBatch=clArgs.featureBatch,
+        profanityWordlist=clArgs.profanityWordlist,
+        featureNames=clArgs.features,
+        flushRows=clArgs.flushRows,
+        flushBytes=clArgs.flushBytes,
+        userCacheSize=clArgs.userCacheSize,
+        stagingDir=clArgs.stagingDir,
+        transactions=clArgs.transactions,
+        writerQueue=clArgs.writerQueue,
+        parquetDir=clArgs.parquetDir,
+        rowGroupRows=clArgs.rowGroupRows,
     )
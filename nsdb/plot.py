@@ -27,7 +27,7 @@ def partitionStatus(cursor, i, plotDir, dataDir, dryrun):
     plt.figure()
     figname = plotDir + str(i) + "-" + "partitionStatus"
 
-    query = """SELECT status, count(id) FROM wikiactors.partition
+    query = """SELECT status, count(id) FROM partition
     GROUP BY status ORDER BY count(id) desc;"""
 
     if not dryrun:
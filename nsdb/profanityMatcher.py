@@ -0,0 +1,249 @@
+"""
+This module finds profanity in text with an Aho-Corasick automaton.
+
+The automaton is built once from a wordlist, by default the one of the profanity
+package, and finds whether any word of it occurs in a text in a single pass. Unlike
+the profanity package, words only match on word boundaries, so "Scunthorpe" and
+"Essex" are not profane.
+
+Run this script to measure how long the automaton takes to build and how many texts
+per second it checks, compared with the profanity package.
+"""
+import argparse
+import os
+import random
+import time
+from typing import Iterator, List, Tuple
+
+from profanity import profanity
+
+
+class ProfanityMatcher:
+    """Multi-pattern matcher over a wordlist, matching is case insensitive
+
+    Parameters
+    ----------
+    words: List[str] - words or phrases to find
+    wordBoundaries: bool - only match words that aren't part of a longer word
+    """
+
+    def __init__(self, words: List[str], wordBoundaries: bool = True):
+        start = time.perf_counter()
+
+        self.words = sorted({word.strip().lower() for word in words if word.strip()})
+        self.wordBoundaries = wordBoundaries
+
+        # node 0 is the root, each node has its transitions, the node of the longest
+        # proper suffix of its path that is in the trie and the lengths of the words
+        # that end at it. Missing transitions go back to the root.
+        self.transitions = [{}]
+        self.fail = [0]
+        self.output = [()]
+
+        for word in self.words:
+            node = 0
+            for char in word:
+                following = self.transitions[node].get(char)
+                if following is None:
+                    following = len(self.transitions)
+                    self.transitions[node][char] = following
+                    self.transitions.append({})
+                    self.fail.append(0)
+                    self.output.append(())
+                node = following
+            self.output[node] = (len(word),)
+
+        # breadth first, so the failure node of a node is complete before its
+        # children. The transitions of each node are then completed with those of
+        # its failure node, so matching never has to follow failure links.
+        queue = list(self.transitions[0].values())
+        for node in queue:
+            fail = self.fail[node]
+            for char, child in self.transitions[node].items():
+                self.fail[child] = self.transitions[fail].get(char, 0)
+                self.output[child] += self.output[self.fail[child]]
+                queue.append(child)
+
+            for char, following in self.transitions[fail].items():
+                self.transitions[node].setdefault(char, following)
+
+        self.buildSeconds = time.perf_counter() - start
+
+    def matches(self, text: str) -> Iterator[Tuple[int, int]]:
+        """Yields the start and end of each occurrence of a word in text, in the
+        order they end"""
+        text = text.lower()
+        transitions = self.transitions
+        output = self.output
+
+        node = 0
+        for end, char in enumerate(text, 1):
+            node = transitions[node].get(char, 0)
+            if not output[node]:
+                continue
+
+            for length in output[node]:
+                start = end - length
+                if self.wordBoundaries and (
+                    isWordCharacter(text, start - 1) or isWordCharacter(text, end)
+                ):
+                    continue
+
+                yield start, end
+
+    def contains(self, text: str) -> bool:
+        """Returns whether text contains a word of the wordlist"""
+        for _ in self.matches(text):
+            return True
+
+        return False
+
+
+def isWordCharacter(text: str, index: int) -> bool:
+    """Returns whether there is a character at index of text that can be part of a
+    word"""
+    if index < 0 or index >= len(text):
+        return False
+
+    char = text[index]
+    return char.isalnum() or char == "_"
+
+
+def loadWordlist(path: str) -> List[str]:
+    """Returns the words of a file with one word or phrase per line"""
+    with open(path, encoding="utf-8") as file:
+        return [line.strip() for line in file if line.strip()]
+
+
+# the matcher of this process, built when it is first used
+matcher = None
+wordlistPath = None
+
+
+def setWordlist(path: str = None):
+    """Sets the wordlist used by getMatcher, the profanity package's if None"""
+    global matcher, wordlistPath
+
+    if path != wordlistPath:
+        matcher = None
+        wordlistPath = path
+
+
+def getMatcher() -> ProfanityMatcher:
+    """Returns the matcher of this process, building it the first time"""
+    global matcher
+
+    if matcher is None:
+        if wordlistPath:
+            words = loadWordlist(wordlistPath)
+        else:
+            words = profanity.get_words()
+
+        matcher = ProfanityMatcher(words)
+
+    return matcher
+
+
+def containsProfanity(text: str) -> bool:
+    """Returns whether text contains a word of the wordlist of this process"""
+    return getMatcher().contains(text)
+
+
+def benchmark(wordlist: str, texts: int, length: int, seed: int):
+    """Prints how long the matcher takes to build and how many texts per second it
+    and the profanity package check
+
+    Parameters
+    ----------
+    wordlist: str - path of a wordlist, the profanity package's if empty
+    texts: int - number of random texts to check
+    length: int - number of words in each text
+    seed: int - seed of the random texts
+    """
+    words = loadWordlist(wordlist) if wordlist else profanity.get_words()
+
+    matcher = ProfanityMatcher(words)
+    print(
+        "Built matcher of %d words, %d nodes in %.2f ms"
+        % (len(matcher.words), len(matcher.transitions), matcher.buildSeconds * 1000)
+    )
+
+    # most talk page comments are clean, so most texts are scanned to the end
+    rng = random.Random(seed)
+    vocabulary = ["the", "article", "source", "I", "think", "please", "[[Link]]"]
+    vocabulary += ["Essex", "Scunthorpe", "analysis", "Dickens", "cocktail"]
+    corpus = []
+    for _ in range(texts):
+        text = [rng.choice(vocabulary) for _ in range(length)]
+        if rng.random() < 0.1:
+            text[rng.randrange(length)] = rng.choice(matcher.words)
+        corpus.append(" ".join(text))
+
+    for name, contains in [
+        ("matcher", matcher.contains),
+        ("profanity package", profanity.contains_profanity),
+    ]:
+        start = time.perf_counter()
+        found = sum(contains(text) for text in corpus)
+        elapsed = time.perf_counter() - start
+
+        print(
+            "%s: %.0f texts/s, %.2f MB/s, %d of %d profane"
+            % (
+                name,
+                texts / elapsed,
+                sum(map(len, corpus)) / 1e6 / elapsed,
+                found,
+                texts,
+            )
+        )
+
+
+def defineArgParser():
+    """Creates parser for command line arguments"""
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+
+    parser.add_argument(
+        "-w",
+        "--wordlist",
+        help="File with one word per line [default: the profanity package's]",
+        default="",
+        type=str,
+    )
+
+    parser.add_argument(
+        "-t",
+        "--texts",
+        help="Number of random texts to check [default: 2000]",
+        default=2000,
+        type=int,
+    )
+
+    parser.add_argument(
+        "-l",
+        "--length",
+        help="Number of words in each text [default: 100]",
+        default=100,
+        type=int,
+    )
+
+    parser.add_argument(
+        "--seed",
+        help="Seed for the random texts [default: 0]",
+        default=0,
+        type=int,
+    )
+
+    return parser
+
+
+if __name__ == "__main__":
+    argParser = defineArgParser()
+    clArgs = argParser.parse_args()
+
+    if clArgs.wordlist and not os.path.exists(clArgs.wordlist):
+        argParser.error("wordlist %s does not exist" % clArgs.wordlist)
+
+    benchmark(clArgs.wordlist, clArgs.texts, clArgs.length, clArgs.seed)
@@ -0,0 +1,339 @@
+"""
+This script fills in the added_sentiment and deleted_sentiment columns of the edit
+table, which parse.py leaves empty.
+
+Edits are read in order of their id a page at a time, the added and deleted text of
+each is scored by a pool of processes with a lexicon and the scores are written
+back with one UPDATE per page. Nothing is downloaded, the lexicon is built in or
+read from a file.
+
+Each score is between -1 and 1. The weights of the words of a text are summed, a
+word following a negation such as "not" counts against its weight, and the sum is
+normalised by x / sqrt(x^2 + 15) as in VADER.
+
+Scores are written in order of id, so an interrupted run resumes after the last
+edit that has a score.
+
+This tool uses a MySQL database that is configured in the Database() module.
+"""
+import argparse
+import multiprocessing
+import re
+import time
+from collections import deque
+from math import sqrt
+from typing import Dict, Iterator, List, Tuple
+
+from tqdm import tqdm
+
+import Database
+
+# a small lexicon of words common on talk pages, weighted from -3 to 3 as in AFINN
+lexicon = {
+    "agree": 1,
+    "appreciate": 2,
+    "appreciated": 2,
+    "awesome": 3,
+    "best": 3,
+    "better": 2,
+    "brilliant": 3,
+    "clear": 1,
+    "constructive": 2,
+    "correct": 1,
+    "excellent": 3,
+    "fair": 2,
+    "fine": 2,
+    "glad": 3,
+    "good": 3,
+    "great": 3,
+    "happy": 3,
+    "help": 2,
+    "helpful": 2,
+    "improve": 2,
+    "improved": 2,
+    "interesting": 2,
+    "like": 2,
+    "love": 3,
+    "nice": 3,
+    "please": 1,
+    "reliable": 2,
+    "support": 2,
+    "thank": 2,
+    "thanks": 2,
+    "useful": 2,
+    "welcome": 2,
+    "wonderful": 3,
+    "abuse": -3,
+    "absurd": -3,
+    "annoying": -2,
+    "attack": -1,
+    "awful": -3,
+    "bad": -3,
+    "biased": -2,
+    "block": -1,
+    "blocked": -2,
+    "boring": -3,
+    "crap": -3,
+    "disagree": -2,
+    "disruptive": -2,
+    "dumb": -3,
+    "error": -2,
+    "fail": -2,
+    "false": -1,
+    "garbage": -3,
+    "hate": -3,
+    "idiot": -3,
+    "ignorant": -2,
+    "incorrect": -2,
+    "lie": -2,
+    "liar": -3,
+    "misleading": -3,
+    "nonsense": -2,
+    "pathetic": -2,
+    "poor": -2,
+    "problem": -2,
+    "ridiculous": -3,
+    "rude": -2,
+    "shame": -2,
+    "spam": -2,
+    "stupid": -2,
+    "terrible": -3,
+    "troll": -2,
+    "ugly": -3,
+    "useless": -2,
+    "vandal": -3,
+    "vandalism": -3,
+    "worst": -3,
+    "wrong": -2,
+}
+
+negations = {"not", "no", "never", "isn't", "doesn't", "don't", "can't", "won't"}
+
+# VADER scales the weight of a negated word by -0.74
+negationScale = -0.74
+
+words = re.compile(r"[a-z']+")
+
+# scores are stored as decimal(4, 4)
+maxScore = 0.9999
+
+
+def loadLexicon(path: str) -> Dict[str, float]:
+    """Returns the weights of a lexicon file with a word and its weight on each line
+    separated by a tab, as in AFINN"""
+    weights = {}
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            if not line.strip() or line.startswith("#"):
+                continue
+
+            word, weight = line.rstrip("\n").rsplit("\t", 1)
+            weights[word.lower()] = float(weight)
+
+    return weights
+
+
+def score(text: str, weights: Dict[str, float]) -> float:
+    """Returns the sentiment of text between -1 and 1"""
+    if not text:
+        return 0
+
+    total = 0
+    negated = False
+    for word in words.findall(text.lower()):
+        weight = weights.get(word)
+        if weight is not None:
+            total += weight * negationScale if negated else weight
+
+        negated = word in negations
+
+    if not total:
+        return 0
+
+    normalised = total / sqrt(total * total + 15)
+
+    return round(max(-maxScore, min(maxScore, normalised)), 4)
+
+
+def initWorker(lexiconPath: str):
+    """Loads the lexicon of a worker process"""
+    global lexicon
+
+    if lexiconPath:
+        lexicon = loadLexicon(lexiconPath)
+
+
+def scoreRows(rows: List[Tuple[int, str, str]]) -> List[Tuple[int, float, float]]:
+    """Returns the id, added sentiment and deleted sentiment of each edit"""
+    return [
+        (editId, score(added, lexicon), score(deleted, lexicon))
+        for editId, added, deleted in rows
+    ]
+
+
+def readEdits(cursor, start: int, batchSize: int) -> Iterator[list]:
+    """Yields the id, added and deleted text of the edits after start in pages of
+    batchSize, in order of id"""
+    query = """SELECT id, added, deleted FROM edit
+        WHERE id > %s
+        ORDER BY id
+        LIMIT %s;"""
+
+    while True:
+        cursor.execute(query, (start, batchSize))
+        rows = cursor.fetchall()
+        if not rows:
+            return
+
+        yield rows
+
+        start = rows[-1][0]
+
+
+def writeScores(cursor, scores: List[Tuple[int, float, float]]):
+    """Updates the sentiment of many edits with one query"""
+    cases = " ".join(["WHEN %s THEN %s"] * len(scores))
+    query = """UPDATE edit
+        SET
+            added_sentiment = CASE id %s END,
+            deleted_sentiment = CASE id %s END
+        WHERE id IN (%s);""" % (
+        cases,
+        cases,
+        ", ".join(["%s"] * len(scores)),
+    )
+
+    parameters = []
+    for editId, addedSentiment, _ in scores:
+        parameters += [editId, addedSentiment]
+    for editId, _, deletedSentiment in scores:
+        parameters += [editId, deletedSentiment]
+    parameters += [editId for editId, _, _ in scores]
+
+    cursor.execute(query, parameters)
+
+
+def lastScored(cursor) -> int:
+    """Returns the id of the last edit that has a sentiment, 0 if there are none"""
+    query = """SELECT MAX(id) FROM edit
+        WHERE added_sentiment IS NOT NULL OR deleted_sentiment IS NOT NULL;"""
+    cursor.execute(query)
+    last = cursor.fetchone()[0]
+
+    return last or 0
+
+
+def backfill(
+    batchSize: int = 1000,
+    workers: int = 1,
+    lexiconPath: str = "",
+    start: int = None,
+):
+    """Scores the edits that don't have a sentiment yet
+
+    Parameters
+    ----------
+    batchSize: int - number of edits read, scored and updated together
+    workers: int - number of processes scoring edits
+    lexiconPath: str - lexicon file to use instead of the built-in lexicon
+    start: int - id after which to start, by default after the last scored edit
+    """
+    database, cursor = Database.connect()
+
+    if start is None:
+        start = lastScored(cursor)
+
+    print("Scoring edits after id %d" % start)
+
+    pool = multiprocessing.Pool(
+        workers, initializer=initWorker, initargs=(lexiconPath,)
+    )
+
+    # batches being scored, at most two per worker so only those are held in memory
+    pending = deque()
+    scored = 0
+    startTime = time.time()
+
+    try:
+        with tqdm(unit=" edits", smoothing=0) as progress:
+            for rows in readEdits(cursor, start, batchSize):
+                pending.append(pool.apply_async(scoreRows, (rows,)))
+
+                while len(pending) > 2 * workers:
+                    scores = pending.popleft().get()
+                    writeScores(cursor, scores)
+                    scored += len(scores)
+                    progress.update(len(scores))
+
+            while pending:
+                scores = pending.popleft().get()
+                writeScores(cursor, scores)
+                scored += len(scores)
+                progress.update(len(scores))
+    finally:
+        pool.terminate()
+        pool.join()
+
+        elapsed = time.time() - startTime
+        print(
+            "Scored %d edits in %.1f s, %.0f edits/s"
+            % (scored, elapsed, scored / elapsed if elapsed else 0)
+        )
+
+        cursor.close()
+        database.close()
+
+
+def defineArgParser():
+    """Creates parser for command line arguments"""
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+
+    parser.add_argument(
+        "-b",
+        "--batchSize",
+        help="Number of edits read, scored and updated together [default: 1000]",
+        default=1000,
+        type=int,
+    )
+
+    parser.add_argument(
+        "-w",
+        "--workers",
+        help="Number of processes scoring edits [default: number of cores]",
+        default=multiprocessing.cpu_count(),
+        type=int,
+    )
+
+    parser.add_argument(
+        "-l",
+        "--lexicon",
+        help="File with a word and its weight separated by a tab on each line "
+        "[default: the built-in lexicon]",
+        default="",
+        type=str,
+    )
+
+    parser.add_argument(
+        "-s",
+        "--start",
+        help="Id after which to start, 0 to score every edit again. A run started "
+        "with this has to be resumed with it [default: after the last scored edit]",
+        default=None,
+        type=int,
+    )
+
+    return parser
+
+
+if __name__ == "__main__":
+    argParser = defineArgParser()
+    clArgs = argParser.parse_args()
+
+    backfill(
+        batchSize=clArgs.batchSize,
+        workers=clArgs.workers,
+        lexiconPath=clArgs.lexicon,
+        start=clArgs.start,
+    )
@@ -0,0 +1,386 @@
+"""
+This module connects to an embedded SQLite database, so that the scripts can be run
+on a single machine without a MySQL server.
+
+The connection and its cursors take the queries that the scripts send to MySQL.
+Before a query is run its MySQL syntax is rewritten for SQLite:
+
+    * %s placeholders become ?
+    * INSERT IGNORE becomes INSERT OR IGNORE
+    * ON DUPLICATE KEY UPDATE becomes ON CONFLICT DO UPDATE SET, and VALUES(column)
+      becomes excluded.column
+    * CAST(column AS date) becomes DATE(column)
+    * the unit of TIMESTAMPDIFF is quoted
+
+The MySQL functions that the scripts use and SQLite doesn't have, such as CONCAT,
+STD, YEAR and SUBSTRING_INDEX, are defined on each connection. The namespaces of a
+user are kept without duplicates in the order of the SET of the MySQL schema by a
+trigger that calls NAMESPACE_SET, so the database can only be written to through
+this module.
+
+A new database is created with sql/schema-sqlite.sql. It is opened in WAL mode, so
+that reading doesn't block the writer, and with pragmas for bulk inserts. Processes
+that write at the same time wait for each other for up to busyTimeout seconds.
+
+loader.py, backfill.py and importUserLists.py use statements of MySQL that can't be
+rewritten, such as LOAD DATA and UPDATE with a JOIN, and need a MySQL server, as do
+namespacesEditedByTopFiveHundred and namespacesEditedByUserGroups of plot.py, which
+read the values of the namespaces SET from information_schema with session
+variables.
+"""
+import os
+import re
+import sqlite3
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+schemaPath = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "sql", "schema-sqlite.sql"
+)
+
+# seconds a connection waits for another process to finish writing
+busyTimeout = 60
+
+pragmas = {
+    "journal_mode": "WAL",
+    # with WAL a commit is only synced at checkpoints
+    "synchronous": "NORMAL",
+    "foreign_keys": "ON",
+    # 256 MB of cache and memory mapped pages, temporary tables in memory
+    "cache_size": -262144,
+    "mmap_size": 268435456,
+    "temp_store": "MEMORY",
+}
+
+# the values of the namespaces SET of the user table, in order
+namespaceOrder = (
+    "0,1,2,3,4,5,6,7,8,9,10,11,12,13,14,15,-1,-2,100,101,118,119,710,711,828,829,"
+    "108,109,446,447,2300,2301,2302,2303"
+).split(",")
+
+placeholder = re.compile(r"%([s%])")
+rewrites = [
+    (re.compile(r"\bINSERT\s+IGNORE\b", re.I), "INSERT OR IGNORE"),
+    (
+        re.compile(r"\bON\s+DUPLICATE\s+KEY\s+UPDATE\b", re.I),
+        "ON CONFLICT DO UPDATE SET",
+    ),
+    (re.compile(r"\bVALUES\((\w+)\)", re.I), r"excluded.\1"),
+    (re.compile(r"\bCAST\(\s*([\w.]+)\s+AS\s+DATE\s*\)", re.I), r"DATE(\1)"),
+    (re.compile(r"\bTIMESTAMPDIFF\(\s*(\w+)\s*,", re.I), r"TIMESTAMPDIFF('\1',"),
+]
+
+timeUnits = {
+    "MICROSECOND": 1e-6,
+    "SECOND": 1,
+    "MINUTE": 60,
+    "HOUR": 3600,
+    "DAY": 86400,
+    "WEEK": 604800,
+}
+
+
+@lru_cache(maxsize=256)
+def translate(query: str, placeholders: bool = True) -> str:
+    """Returns a MySQL query rewritten for SQLite
+
+    Parameters
+    ----------
+    query: str - query for MySQL
+    placeholders: bool - whether the query is run with parameters, MySQL only
+      replaces %s when it is
+    """
+    if placeholders:
+        query = placeholder.sub(lambda match: "?" if match[1] == "s" else "%", query)
+
+    for pattern, replacement in rewrites:
+        query = pattern.sub(replacement, query)
+
+    return query
+
+
+def toDatetime(value) -> datetime:
+    """Returns a datetime stored by SQLite as text, None if it isn't one"""
+    if value is None or isinstance(value, datetime):
+        return value
+
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+def convertDatetime(value: bytes):
+    """Returns a datetime column as a datetime, as MySQL does"""
+    converted = toDatetime(value.decode())
+    return converted if converted is not None else value.decode()
+
+
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(" "))
+sqlite3.register_converter("DATETIME", convertDatetime)
+sqlite3.register_converter("TIMESTAMP", convertDatetime)
+
+
+def concat(*values):
+    if any(value is None for value in values):
+        return None
+
+    return "".join(str(value) for value in values)
+
+
+def concatWs(separator, *values):
+    if separator is None:
+        return None
+
+    return str(separator).join(str(value) for value in values if value is not None)
+
+
+def substringIndex(string, delimiter, count):
+    if string is None or delimiter is None or count is None:
+        return None
+
+    parts = str(string).split(str(delimiter))
+    if count > 0:
+        return str(delimiter).join(parts[:count])
+    if count < 0:
+        return str(delimiter).join(parts[count:])
+
+    return ""
+
+
+def findInSet(needle, values):
+    if needle is None or values is None:
+        return None
+
+    values = str(values).split(",") if values else []
+    return values.index(str(needle)) + 1 if str(needle) in values else 0
+
+
+def year(value):
+    value = toDatetime(value)
+    return value.year if value is not None else None
+
+
+def month(value):
+    value = toDatetime(value)
+    return value.month if value is not None else None
+
+
+def now() -> str:
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def parseOffset(offset: str) -> timedelta:
+    """Returns a time zone offset such as +00:00 or -4:00"""
+    sign = -1 if offset.startswith("-") else 1
+    hours, _, minutes = offset.lstrip("+-").partition(":")
+
+    return sign * timedelta(hours=int(hours), minutes=int(minutes or 0))
+
+
+def convertTz(value, fromZone, toZone):
+    value = toDatetime(value)
+    if value is None or fromZone is None or toZone is None:
+        return None
+
+    value += parseOffset(toZone) - parseOffset(fromZone)
+    return value.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def timestampDiff(unit, start, end):
+    start, end = toDatetime(start), toDatetime(end)
+    if start is None or end is None:
+        return None
+
+    unit = unit.upper()
+    if unit in ("MONTH", "QUARTER", "YEAR"):
+        months = (end.year - start.year) * 12 + end.month - start.month
+        # a month is only complete once the day and time of start are reached
+        endDay, startDay = (end.day, end.time()), (start.day, start.time())
+        if months > 0 and endDay < startDay:
+            months -= 1
+        elif months < 0 and endDay > startDay:
+            months += 1
+
+        return int(months / {"MONTH": 1, "QUARTER": 3, "YEAR": 12}[unit])
+
+    return int((end - start).total_seconds() / timeUnits[unit])
+
+
+def toNumber(value) -> float:
+    """Returns a value as a number the way MySQL does in a numeric context, text
+    that isn't a number such as the "NULL" that parse.py writes for missing
+    features as 0"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def namespaceSet(value):
+    """Returns namespaces as a MySQL SET would keep them, without duplicates and in
+    the order of the definition of the SET"""
+    if not value:
+        return value
+
+    namespaces = set(value.split(","))
+    return ",".join(
+        namespace for namespace in namespaceOrder if namespace in namespaces
+    )
+
+
+class Std:
+    """Population standard deviation, the STD aggregate of MySQL"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.squares = 0.0
+
+    def step(self, value):
+        if value is None:
+            return
+
+        value = toNumber(value)
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.squares += delta * (value - self.mean)
+
+    def finalize(self):
+        if not self.count:
+            return None
+
+        return (self.squares / self.count) ** 0.5
+
+
+class Cursor:
+    """Cursor of a Connection that runs MySQL queries"""
+
+    def __init__(self, cursor: sqlite3.Cursor):
+        self.cursor = cursor
+
+    def execute(self, query: str, params=None, multi: bool = False):
+        """Runs a query, several separated by semicolons if multi"""
+        if multi:
+            self.cursor.executescript(translate(query, params is not None))
+            return iter(())
+
+        if params is None:
+            self.cursor.execute(translate(query, False))
+        else:
+            self.cursor.execute(translate(query), params)
+
+    def executemany(self, query: str, rows):
+        self.cursor.executemany(translate(query), rows)
+
+    def fetchone(self):
+        return self.cursor.fetchone()
+
+    def fetchmany(self, size: int = 1):
+        return self.cursor.fetchmany(size)
+
+    def fetchall(self):
+        return self.cursor.fetchall()
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    @property
+    def rowcount(self) -> int:
+        return self.cursor.rowcount
+
+    @property
+    def lastrowid(self) -> int:
+        return self.cursor.lastrowid
+
+    def close(self):
+        self.cursor.close()
+
+
+class Connection:
+    """Connection to a SQLite database with the methods of a MySQLConnection that
+    the scripts use
+
+    Parameters
+    ----------
+    path: str - path of the database file, which is created if it doesn't exist
+    autocommit: bool - commit each statement, otherwise the caller commits
+    """
+
+    def __init__(self, path: str, autocommit: bool = True):
+        self.path = path
+        self.connection = sqlite3.connect(
+            path,
+            timeout=busyTimeout,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            # an AsyncWriter writes on its own thread, one thread at a time
+            check_same_thread=False,
+            isolation_level=None,
+        )
+
+        for name, value in pragmas.items():
+            self.connection.execute("PRAGMA %s = %s;" % (name, value))
+
+        self.connection.create_function("CONCAT", -1, concat)
+        self.connection.create_function("CONCAT_WS", -1, concatWs)
+        self.connection.create_function("SUBSTRING_INDEX", 3, substringIndex)
+        self.connection.create_function("FIND_IN_SET", 2, findInSet)
+        self.connection.create_function("YEAR", 1, year)
+        self.connection.create_function("MONTH", 1, month)
+        self.connection.create_function("NOW", 0, now)
+        self.connection.create_function("CONVERT_TZ", 3, convertTz)
+        self.connection.create_function("TIMESTAMPDIFF", 3, timestampDiff)
+        self.connection.create_function(
+            "NAMESPACE_SET", 1, namespaceSet, deterministic=True
+        )
+        self.connection.create_aggregate("STD", 1, Std)
+
+        exists = self.connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'edit';"
+        ).fetchone()
+        if not exists:
+            with open(schemaPath) as file:
+                self.connection.executescript(file.read())
+
+        self.autocommit = autocommit
+
+    @property
+    def autocommit(self) -> bool:
+        return self.connection.isolation_level is None
+
+    @autocommit.setter
+    def autocommit(self, value: bool):
+        # transactions begin by waiting for the write lock, a transaction that has
+        # read first can fail to take it once another process has written
+        self.connection.isolation_level = None if value else "IMMEDIATE"
+
+    @property
+    def in_transaction(self) -> bool:
+        return self.connection.in_transaction
+
+    def cursor(self) -> Cursor:
+        return Cursor(self.connection.cursor())
+
+    def start_transaction(self):
+        if not self.connection.in_transaction:
+            self.connection.execute("BEGIN IMMEDIATE;")
+
+    def commit(self):
+        self.connection.commit()
+
+    def rollback(self):
+        self.connection.rollback()
+
+    def ping(self, reconnect: bool = False, attempts: int = 1, delay: int = 0):
+        """Checks the connection, which is never dropped by a server"""
+        self.connection.execute("SELECT 1;")
+
+    def close(self):
+        self.connection.close()
+
+
+def connect(path: str, autocommit: bool = True) -> Connection:
+    """Opens a SQLite database, creating it with sql/schema-sqlite.sql if it doesn't
+    have the tables of the schema"""
+    return Connection(path, autocommit)
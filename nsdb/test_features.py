@@ -0,0 +1,122 @@
+"""
+Tests of the features of features.py and featuresBatch.py against the functions of
+parse.py that computed them before, run with pytest from nsdb/.
+
+Profanity only matches whole words in features.py, so ins_vulgarity is left out, see
+test_profanityMatcher.py.
+"""
+import pytest
+
+import featureBenchmark
+import features
+import featuresBatch
+
+# texts where the classes of characters, the cleaning of parse.cleanString or
+# lowercasing are easy to get wrong
+edgeCases = [
+    "a",
+    "A",
+    "1",
+    "!",
+    "aa",
+    "x  y",
+    "Hello world",
+    " I think my edit is mine ",
+    "I me my",
+    "[[Link]] and [[Other|link]] [http://example.org a source]",
+    "!!!!!!!!!!",
+    "aaaa bbbbb",
+    "aaa!!!aaa",
+    "trailing run zzzz",
+    "Ünïcödé and ÀÉÎ",
+    "東京都日本語の記事",
+    "примерстатьяобсуждение",
+    "١٢٣ ٤٥٦ digits",
+    "tab\tand\nnewline\r\n",
+    " non-breaking space",
+    "İstanbul",
+    "ǅungla ß",
+    "under_score and hy-phen",
+    "'''bold''' ''italic'' {{template|x=1}}",
+    "~~[[User:Editor|Editor]] ([[User talk:Editor|talk]])",
+]
+
+# comments whose length changes when they are lowercased
+changingComments = ["İ", "İstanbul", "/* İzmir */ reply", "ΑΣ İİ!"]
+
+insertionNames = [
+    feature.name
+    for feature in features.insertionRegistry
+    if feature.name != "insVulgarity"
+]
+
+
+def legacyInsertion(name: str, string: str):
+    """Returns the value parse.py stored for an insertion feature of string, which was
+    0 when nothing was added and also when only whitespace was, except for
+    ins_whitespace which was 1"""
+    if not string:
+        return 0
+    if string.isspace():
+        return 1 if name == "insWhitespace" else 0
+
+    return featureBenchmark.legacyFunctions[name](string)
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    inserted, comments = featureBenchmark.makeCorpus(
+        list(featureBenchmark.generators), 25, 0
+    )
+    return inserted + edgeCases + ["", " ", "\n\n"], comments + edgeCases
+
+
+@pytest.mark.parametrize("name", insertionNames)
+def testRegistryMatchesLegacy(corpus, name):
+    """Each feature of the added text is the value that parse.py computed"""
+    feature = features.selectFeatures([name])[0]
+
+    for string in corpus[0]:
+        assert feature.function(features.EditText(string)) == legacyInsertion(
+            name, string
+        ), string
+
+
+def testBatchMatchesLegacy(corpus):
+    """The features of the added text that featuresBatch computes together are the
+    values that parse.py computed"""
+    inserted = corpus[0]
+
+    for string, batch in zip(inserted, featuresBatch.batchInsertionFeatures(inserted)):
+        for feature in features.insertionRegistry:
+            if feature.name in insertionNames:
+                expected = legacyInsertion(feature.name, string)
+                assert getattr(batch, feature.insertion) == expected, (
+                    feature.name,
+                    string,
+                )
+
+
+@pytest.mark.parametrize(
+    "name",
+    ["commentPersonalLife", "commentCopyedit", "commentLength", "commentSpecialChars"],
+)
+def testCommentFeaturesMatchLegacy(corpus, name):
+    """The features of the comment are those of the lowercased comment, as parse.py
+    computed them"""
+    feature = features.selectFeatures([name])[0]
+    legacy = featureBenchmark.legacyFunctions[name]
+
+    for comment in corpus[1] + changingComments:
+        assert feature.function(features.EditText(comment=comment)) == legacy(
+            comment
+        ), comment
+
+
+def testLengthOfLowercasedComment():
+    """A comment that grows when it is lowercased is counted at its lowercased
+    length"""
+    text = features.EditText(comment="İ!")
+
+    assert features.commentLength(text) == 3
+    assert features.commentSpecialChars(text) == 1 / 3
@@ -0,0 +1,191 @@
+"""
+Tests of the staging files that writer.StagingBuffer writes and loader.py reads, run
+with pytest from nsdb/.
+
+Merging the staging tables needs a MySQL server, so the loading of a partition is
+checked with a cursor that records the rows it is given.
+"""
+import os
+
+import mysql.connector as sql
+import pytest
+
+import Database
+import loader
+import writer
+
+columns = ("edit_id", "edit_date", "page_id", "user_table_id", "added")
+
+# text with every character that LOAD DATA escapes, and the escape of NULL
+awkwardText = "a\tb\nc\\d\re\0f\x1ag \\N h\\"
+
+
+class RecordingCursor:
+    """Cursor that records the rows inserted into each table and refuses LOAD DATA
+    LOCAL INFILE, as a server that doesn't allow it does"""
+
+    def __init__(self):
+        self.rows = {}
+        self.batches = []
+        self.queries = []
+
+    def execute(self, query, params=None):
+        if "LOAD DATA" in query:
+            raise sql.Error(msg="LOAD DATA LOCAL INFILE is disabled", errno=1148)
+
+        self.queries.append(query)
+
+    def executemany(self, query, rows):
+        table = query.split()[2]
+        self.rows.setdefault(table, []).extend(rows)
+        self.batches.append(len(rows))
+
+    def close(self):
+        pass
+
+
+class RecordingDatabase:
+    """Connection that counts its commits and rollbacks"""
+
+    def __init__(self):
+        self.commits = 0
+        self.rollbacks = 0
+
+    def start_transaction(self):
+        pass
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        pass
+
+
+def stagePartition(stagingDir: str, partitionName: str) -> writer.StagingBuffer:
+    """Writes the staging files of a partition with a page of three edits, the first
+    of which is reverted after it is written"""
+    buffer = writer.StagingBuffer(stagingDir, partitionName, maxRows=2)
+    buffer.addPage(1, 1, "Talk:Test\tpage", partitionName)
+
+    for editId, name, userId in [
+        (1, "Editor", 7),
+        (2, "10.0.0.1", None),
+        (3, "Editor", 7),
+    ]:
+        key = buffer.users.addEdit(userId, name, "1")
+        text = awkwardText if editId == 2 else "Hello"
+        buffer.add(columns, (editId, "2020-01-01 00:00:00", 1, key, text), "Talk:Test")
+    buffer.markReverted(1)
+    buffer.setPageEdits(3, "Talk:Test\tpage", "1")
+    buffer.finish()
+
+    return buffer
+
+
+@pytest.mark.parametrize(
+    "value, field",
+    [
+        (None, "\\N"),
+        ("\\N", "\\\\N"),
+        (True, "1"),
+        (False, "0"),
+        (0.1, "0.1"),
+        (12, "12"),
+        ("", ""),
+        (awkwardText, "a\\tb\\nc\\\\d\\re\\0f\\Zg \\\\N h\\\\"),
+    ],
+)
+def testTsvValues(value, field):
+    """Values are escaped as LOAD DATA reads them, and loader.py reads them back"""
+    assert writer.tsvValue(value) == field
+    assert "\t" not in field and "\n" not in field
+
+    if value is None or isinstance(value, str):
+        assert loader.unescape(field) == value
+    else:
+        assert loader.unescape(field) == field
+
+
+def testStagingFilesRoundTrip(tmp_path):
+    """The rows of each staging file are read back as they were written, with the
+    user of each edit by username or IP address"""
+    stagePartition(str(tmp_path), "part1.xml")
+    directory = tmp_path / "part1.xml"
+
+    assert os.path.exists(directory / "done")
+    assert loader.readHeader(str(directory / "edit.tsv")) == [
+        "edit_id",
+        "edit_date",
+        "page_id",
+        "added",
+        "reverted",
+        "username",
+        "ip_address",
+    ]
+    assert list(loader.readRows(str(directory / "edit.tsv"))) == [
+        ("1", "2020-01-01 00:00:00", "1", "Hello", "0", "Editor", None),
+        ("2", "2020-01-01 00:00:00", "1", awkwardText, "0", None, "10.0.0.1"),
+        ("3", "2020-01-01 00:00:00", "1", "Hello", "0", "Editor", None),
+    ]
+    assert list(loader.readRows(str(directory / "page.tsv"))) == [
+        ("1", "1", "Talk:Test\tpage", "part1.xml", "3")
+    ]
+    assert list(loader.readRows(str(directory / "reverted.tsv"))) == [("1",)]
+
+    # the counts of the users of each flush, which loader.py sums
+    assert list(loader.readRows(str(directory / "user.tsv"))) == [
+        (None, None, "10.0.0.1", "1", "0", "0", "1", "0"),
+        ("7", "Editor", None, "1", "0", "0", "1", "0"),
+        ("7", "Editor", None, "1", "0", "0", "1", "0"),
+    ]
+
+
+def testMarkers(tmp_path):
+    """Only finished partitions that haven't been loaded are loaded, a partition
+    that is parsed again isn't finished until it is written and a loaded partition
+    can't be written again"""
+    stagingDir = str(tmp_path)
+    for name in ("done.xml", "loaded.xml", "parsing.xml"):
+        stagePartition(stagingDir, name)
+    open(os.path.join(stagingDir, "loaded.xml", "loaded"), "w").close()
+
+    buffer = writer.StagingBuffer(stagingDir, "parsing.xml")
+    assert loader.findPartitions(stagingDir) == ["done.xml"]
+
+    buffer.finish()
+    assert loader.findPartitions(stagingDir) == ["done.xml", "parsing.xml"]
+
+    with pytest.raises(FileExistsError):
+        writer.StagingBuffer(stagingDir, "loaded.xml")
+
+
+def testExecutemanyFallback(tmp_path, monkeypatch, capsys):
+    """When the server doesn't allow LOAD DATA LOCAL INFILE the partition is rolled
+    back and its rows are inserted in batches instead, then it is marked as
+    loaded"""
+    stagingDir = str(tmp_path)
+    stagePartition(stagingDir, "part1.xml")
+    directory = tmp_path / "part1.xml"
+    expected = {
+        table + "_staging": list(loader.readRows(str(directory / (table + ".tsv"))))
+        for table in ("user", "page", "edit", "reverted")
+    }
+
+    database = RecordingDatabase()
+    cursor = RecordingCursor()
+    monkeypatch.setattr(Database, "connect", lambda **kwargs: (database, cursor))
+
+    loader.load(stagingDir, batchSize=2)
+
+    assert "inserting rows instead" in capsys.readouterr().out
+    assert cursor.rows == expected
+    assert max(cursor.batches) == 2
+    assert (database.rollbacks, database.commits) == (1, 1)
+    assert os.path.exists(directory / "loaded")
+    assert not any(name.endswith(".tsv") for name in os.listdir(directory))
+
+    loader.load(stagingDir)
+    assert "No partitions to load" in capsys.readouterr().out
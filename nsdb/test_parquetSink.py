@@ -0,0 +1,153 @@
+"""
+Tests of the Parquet files of parquetSink.py, run with pytest from nsdb/.
+"""
+import os
+from datetime import datetime
+
+import pyarrow.parquet as pq
+import pytest
+
+import parquetSink
+
+columns = (
+    "edit_id",
+    "edit_date",
+    "page_id",
+    "user_table_id",
+    "added",
+    "ins_vulgarity",
+    "ins_digits",
+)
+
+
+def writePartition(
+    parquetDir: str, partitionName: str, edits: int, revertLate: int = None
+) -> parquetSink.ParquetBuffer:
+    """Writes a partition of a page of edits by two users, in row groups of two
+    edits, where the last edit reverts the one before it and the last edit also
+    reverts revertLate once its row group has been written"""
+    buffer = parquetSink.ParquetBuffer(
+        parquetDir, partitionName, maxRows=1, rowGroupRows=2
+    )
+    buffer.addPage(1, 1, "Talk:Test", partitionName)
+
+    for editId in range(1, edits + 1):
+        name = "Editor" if editId % 2 else "10.0.0.1"
+        key = buffer.users.addEdit(7 if editId % 2 else None, name, "1")
+        row = (
+            editId,
+            datetime(2020, 1, editId),
+            1,
+            key,
+            "Hello %d" % editId,
+            0,
+            "NULL" if editId == 1 else 0.5,
+        )
+        buffer.add(columns, row, "Talk:Test")
+
+    buffer.markReverted(edits - 1)
+    if revertLate is not None:
+        buffer.markReverted(revertLate)
+    buffer.setPageEdits(edits, "Talk:Test", "1")
+    buffer.finish()
+
+    return buffer
+
+
+def testReadTableRoundTrip(tmp_path):
+    """The edits, their text, the page and the users of a partition are read back
+    with the types of their columns"""
+    parquetDir = str(tmp_path)
+    writePartition(parquetDir, "part1.xml", 5)
+
+    edits = parquetSink.readTable(parquetDir).to_pylist()
+    assert [edit["edit_id"] for edit in edits] == [1, 2, 3, 4, 5]
+    assert edits[0]["edit_date"] == datetime(2020, 1, 1)
+    assert [edit["username"] for edit in edits] == ["Editor", None] * 2 + ["Editor"]
+    assert [edit["ip_address"] for edit in edits] == [None, "10.0.0.1"] * 2 + [None]
+    assert [edit["ins_digits"] for edit in edits] == [None, 0.5, 0.5, 0.5, 0.5]
+    assert [edit["ins_vulgarity"] for edit in edits] == [False] * 5
+    assert [edit["reverted"] for edit in edits] == [False] * 3 + [True, False]
+    assert "added" not in edits[0]
+
+    text = parquetSink.readTable(parquetDir, "text").to_pylist()
+    assert text[2] == {"edit_id": 3, "added": "Hello 3"}
+
+    assert parquetSink.readTable(parquetDir, "page").to_pylist() == [
+        {
+            "page_id": 1,
+            "namespace": 1,
+            "title": "Talk:Test",
+            "file_name": "part1.xml",
+            "number_of_edits": 5,
+        }
+    ]
+    users = parquetSink.readTable(parquetDir, "user", ["username", "ip_address"])
+    assert users.to_pylist() == [
+        {"username": None, "ip_address": "10.0.0.1"},
+        {"username": "Editor", "ip_address": None},
+    ]
+
+    assert parquetSink.readManifest(parquetDir)["part1.xml"]["rowGroups"] == 3
+    assert parquetSink.readTable(parquetDir, columns=["edit_id"]).num_columns == 1
+
+
+def testRewriteReverted(tmp_path):
+    """An edit reverted after its row group was written is marked as reverted by
+    rewriting edit.parquet, which keeps its row groups"""
+    parquetDir = str(tmp_path)
+    buffer = writePartition(parquetDir, "part1.xml", 5, revertLate=1)
+
+    assert buffer.rewrite
+    edits = parquetSink.readTable(parquetDir, columns=["edit_id", "reverted"])
+    assert edits.to_pylist() == [
+        {"edit_id": 1, "reverted": True},
+        {"edit_id": 2, "reverted": False},
+        {"edit_id": 3, "reverted": False},
+        {"edit_id": 4, "reverted": True},
+        {"edit_id": 5, "reverted": False},
+    ]
+
+    path = os.path.join(parquetDir, "part1.xml", "edit.parquet")
+    assert pq.ParquetFile(path).num_row_groups == 3
+    assert not os.path.exists(path + ".reverted")
+
+
+def testPartitionParsedAgainReplacesIt(tmp_path):
+    """A partition that is parsed again replaces the one before and is read once"""
+    parquetDir = str(tmp_path)
+    writePartition(parquetDir, "part1.xml", 3)
+    writePartition(parquetDir, "part1.xml", 5)
+    writePartition(parquetDir, "part2.xml", 2)
+
+    edits = parquetSink.readTable(parquetDir, columns=["edit_id"])
+    assert edits.column("edit_id").to_pylist() == [1, 2, 3, 4, 5, 1, 2]
+    assert sorted(os.listdir(parquetDir)) == [
+        "manifest.jsonl",
+        "part1.xml",
+        "part2.xml",
+    ]
+
+
+def testStoppedPublishKeepsPartition(tmp_path, monkeypatch):
+    """A parse that stops while the new partition replaces the old one leaves the
+    old one, which the next parse of the partition restores"""
+    parquetDir = str(tmp_path)
+    writePartition(parquetDir, "part1.xml", 3)
+
+    replace = os.replace
+
+    def stopBeforePublishing(source, destination):
+        if source.endswith(".tmp"):
+            raise KeyboardInterrupt
+        replace(source, destination)
+
+    monkeypatch.setattr(os, "replace", stopBeforePublishing)
+    with pytest.raises(KeyboardInterrupt):
+        writePartition(parquetDir, "part1.xml", 5)
+    monkeypatch.setattr(os, "replace", replace)
+
+    parquetSink.ParquetBuffer(parquetDir, "part1.xml")
+
+    edits = parquetSink.readTable(parquetDir, columns=["edit_id"])
+    assert edits.column("edit_id").to_pylist() == [1, 2, 3]
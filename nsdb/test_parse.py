@@ -0,0 +1,117 @@
+"""
+Tests of the parsing of the pages of a partition by parse.py, run with pytest from
+nsdb/.
+"""
+import io
+from collections import Counter
+
+import mwxml
+import pytest
+
+import features
+import parse
+import sqliteDatabase
+import wordDiff
+import writer
+
+dump = """<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.10/" version="0.10">
+  <siteinfo>
+    <namespaces><namespace key="1" case="first-letter">Talk</namespace></namespaces>
+  </siteinfo>
+  <page>
+    <title>Talk:Revert war</title>
+    <ns>1</ns>
+    <id>1</id>
+%s
+  </page>
+</mediawiki>
+"""
+
+revision = """    <revision>
+      <id>%d</id>
+      <timestamp>2010-01-0%dT00:00:00Z</timestamp>
+      <contributor><username>Editor%d</username><id>%d</id></contributor>
+      <comment>reply</comment>
+      <text xml:space="preserve">%s</text>
+      <sha1>%s</sha1>
+    </revision>"""
+
+versions = {
+    "a": "The source is reliable. ~~~~",
+    "b": "The source is reliable. ~~~~\n:It is a blog, '''not''' a reliable source.",
+}
+
+# a revert war, where the diffs of the last two revisions are those of the two before
+history = "abab" + "a"
+
+
+def parseRevertWar(path: str, diffCache: wordDiff.DiffCache, featureBatch: int):
+    """Parses the revert war into the database at path and returns the diff stats
+    and the rows of the edit table"""
+    revisions = [
+        revision % (i, i, i % 2, i % 2, versions[sha1], sha1 * 31)
+        for i, sha1 in enumerate(history, 1)
+    ]
+    page = next(iter(mwxml.Dump.from_file(io.StringIO(dump % "\n".join(revisions)))))
+
+    database = sqliteDatabase.connect(path)
+    cursor = database.cursor()
+    editBuffer = writer.EditBuffer(cursor)
+    editBuffer.addPage(page.id, 1, page.title, "test.xml")
+
+    diffStats = Counter()
+    parse.parseTargetNamespace(
+        page,
+        page.title,
+        "1",
+        cursor,
+        "test",
+        "",
+        diffCache=diffCache,
+        diffStats=diffStats,
+        featureBatch=featureBatch,
+        editBuffer=editBuffer,
+    )
+    editBuffer.finish()
+
+    columns = [feature.column for feature in features.selectFeatures()]
+    cursor.execute(
+        "SELECT edit_id, reverted, %s FROM edit ORDER BY edit_id;" % ", ".join(columns)
+    )
+    rows = cursor.fetchall()
+    database.close()
+
+    return diffStats, rows
+
+
+@pytest.mark.parametrize("featureBatch", [0, 2, 10])
+def testRevertedDiffsAreCached(tmp_path, featureBatch):
+    """The diffs that a revert war repeats are taken from the cache, which holds
+    their features once they are computed, also while they are still waiting in a
+    batch, and the edits are the same as without the cache"""
+    diffCache = wordDiff.DiffCache(16)
+    diffStats, rows = parseRevertWar(
+        str(tmp_path / "cached.sqlite"), diffCache, featureBatch
+    )
+    uncachedStats, uncachedRows = parseRevertWar(
+        str(tmp_path / "uncached.sqlite"), wordDiff.DiffCache(0), 0
+    )
+
+    # the first revision has no previous hash, so it isn't looked up
+    assert (diffCache.hits, diffCache.misses) == (2, 2)
+    assert sum(diffStats.values()) == 3
+    assert sum(uncachedStats.values()) == 5
+    assert all(isinstance(value, tuple) for value in diffCache.entries.values())
+
+    assert rows == uncachedRows
+    assert [row[1] for row in rows] == [0, 1, 1, 1, 0]
+
+
+def testEvictedDiffIsComputedAgain(tmp_path):
+    """A cache of one diff evicts the diff of one side of the revert war with the
+    other, so every diff is computed"""
+    diffCache = wordDiff.DiffCache(1)
+    diffStats, _ = parseRevertWar(str(tmp_path / "nsdb.sqlite"), diffCache, 2)
+
+    assert (diffCache.hits, diffCache.misses) == (0, 4)
+    assert sum(diffStats.values()) == 5
@@ -0,0 +1,109 @@
+"""
+Tests of the profanity matcher of profanityMatcher.py against the legacy
+parse.containsVulgarity, which uses the profanity package, run with pytest from nsdb/.
+
+The legacy check finds the words of the wordlist anywhere in a text, while the
+matcher only finds them as whole words, so the two intentionally differ on words
+inside longer words.
+"""
+import random
+import re
+
+import pytest
+from profanity import profanity
+
+import parse
+import profanityMatcher
+
+
+@pytest.fixture
+def matcher():
+    return profanityMatcher.ProfanityMatcher(profanity.get_words())
+
+
+@pytest.mark.parametrize(
+    "text, legacy, matched",
+    [
+        # words inside longer words are only found by the legacy check
+        ("The town of Scunthorpe", True, False),
+        ("Essex County", True, False),
+        ("a statistical analysis", True, False),
+        ("Charles Dickens", True, False),
+        ("a cocktail party", True, False),
+        # punctuation next to a word doesn't make it part of a longer word, but an
+        # underscore or digit does
+        ("What the fuck!", True, True),
+        ("(shit)", True, True),
+        ("it's fuck's sake", True, True),
+        ("[[User:Shit|talk]]", True, True),
+        ("shit_head", True, False),
+        ("fuck2", True, False),
+        # phrases and words that share a prefix with other words
+        ("Blow Job", True, True),
+        ("blow  job", False, False),
+        ("a blowjob.", True, True),
+        ("blowjobs", True, False),
+        ("nigger", True, True),
+        ("niggers", True, False),
+        # text in other scripts, where letters are part of the word too
+        ("Ça, fuck là", True, True),
+        ("FUCK über alles", True, True),
+        ("fuckü", True, False),
+        ("東京fuck東京", True, False),
+        ("東京 fuck 東京", True, True),
+        ("Привет мир", False, False),
+        ("", False, False),
+    ],
+)
+def testLegacyAndMatcher(matcher, text, legacy, matched):
+    """The matcher agrees with the legacy check on whole words and leaves out the
+    words inside longer words that the legacy check finds"""
+    assert parse.containsVulgarity(text) == legacy
+    assert matcher.contains(text) == matched
+
+
+def testOverlappingWords():
+    """Words that are prefixes, suffixes or inside of other words are all found,
+    and the start and end of each occurrence are those of the word"""
+    matcher = profanityMatcher.ProfanityMatcher(
+        ["he", "she", "his", "hers"], wordBoundaries=False
+    )
+
+    assert list(matcher.matches("ushers")) == [(1, 4), (2, 4), (2, 6)]
+    assert list(matcher.matches("ahishe")) == [(1, 4), (3, 6), (4, 6)]
+
+
+def testNonAsciiWordlist():
+    """Words outside of ASCII match case insensitively"""
+    matcher = profanityMatcher.ProfanityMatcher(["Scheiße", "блядь"])
+
+    assert matcher.contains("So eine SCHEIßE!")
+    assert matcher.contains("БЛЯДЬ.")
+    assert not matcher.contains("scheißegal")
+
+
+def testRandomTextsAgainstLegacy(matcher):
+    """Without word boundaries the matcher finds exactly what the legacy check
+    finds, and with them exactly the words that a regular expression with \\b finds
+    as whole words, on random texts made of parts of profane and clean words"""
+    rng = random.Random(0)
+    words = profanity.get_words()
+    fragments = words + [word[:3] for word in words] + [word[2:] for word in words]
+    fragments += ["the", "Essex", "ANAL", "Ünïcödé", "東京", "_", "2", "'", "(", "é"]
+    separators = ["", "", " ", " ", ".", "\n", "-", "_"]
+
+    substrings = profanityMatcher.ProfanityMatcher(words, wordBoundaries=False)
+    wholeWords = re.compile(
+        r"(?<!\w)(%s)(?!\w)" % "|".join(map(re.escape, words)), re.IGNORECASE
+    )
+
+    for _ in range(2000):
+        text = "".join(
+            rng.choice(fragments) + rng.choice(separators)
+            for _ in range(rng.randint(1, 8))
+        )
+
+        legacy = parse.containsVulgarity(text)
+        assert substrings.contains(text) == legacy, text
+        assert matcher.contains(text) == bool(wholeWords.search(text.lower())), text
+        assert legacy or not matcher.contains(text), text
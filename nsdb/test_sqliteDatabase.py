@@ -0,0 +1,56 @@
+"""
+Tests of the SQLite database of sqliteDatabase.py, run with pytest from nsdb/.
+"""
+import Database
+import parse
+
+dump = """<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.10/" version="0.10">
+  <siteinfo>
+    <namespaces><namespace key="1" case="first-letter">Talk</namespace></namespaces>
+  </siteinfo>
+  <page>
+    <title>Talk:Blanked</title>
+    <ns>1</ns>
+    <id>1</id>
+%s
+  </page>
+</mediawiki>
+"""
+
+revision = """    <revision>
+      <id>%d</id>
+      <timestamp>2010-01-0%dT00:00:00Z</timestamp>
+      <contributor><username>Editor%d</username><id>%d</id></contributor>
+      <comment>reply</comment>
+      <text xml:space="preserve">%s</text>
+    </revision>"""
+
+
+def testStdOfBlankingEdit(tmp_path, monkeypatch):
+    """The features of a blanking edit are the text "NULL", which STD treats as 0
+    as MySQL does"""
+    monkeypatch.setenv("NSDB_DATABASE", "sqlite:" + str(tmp_path / "nsdb.sqlite"))
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(Database, "idleConnections", [])
+
+    texts = ["Hello there. ~~~~", "", "Hello there. ~~~~"]
+    revisions = [revision % (i, i, i, i, text) for i, text in enumerate(texts, 1)]
+    (tmp_path / "blanked.xml").write_text(dump % "\n".join(revisions))
+
+    database, cursor = Database.connect()
+    cursor.execute("INSERT INTO partition (file_name) VALUES (%s);", ("blanked.xml",))
+
+    parse.parse(partitionsDir=str(tmp_path) + "/", parallel="test")
+
+    cursor.execute("SELECT ins_capitalization FROM edit WHERE blanking = 1;")
+    assert cursor.fetchall() == [("NULL",)]
+
+    cursor.execute("SELECT STD(ins_capitalization), STD(added_length) FROM edit;")
+    capitalization, addedLength = cursor.fetchone()
+    assert capitalization is not None
+    assert addedLength is not None
+
+    cursor.execute("SELECT status FROM partition;")
+    assert cursor.fetchone() == ("done",)
+
+    database.close()
@@ -0,0 +1,112 @@
+"""
+Tests of the word diff of wordDiff.py, run with pytest from nsdb/.
+"""
+import os
+import random
+import time
+from collections import Counter
+
+import diffBenchmark
+import wordDiff
+
+signature = (
+    "[[User:Editor|Editor]] ([[User talk:Editor|talk]]) 12:00, 1 January 2020 (UTC)"
+)
+reply = "I agree that the source is reliable and that the article should say so. "
+
+
+def signedThread(comments: int) -> str:
+    """Returns a thread of the same signed reply at increasing indentation"""
+    return "".join(
+        ":" * (i % 4 + 1) + reply + signature + "\n" for i in range(comments)
+    )
+
+
+def testRepeatedWordsAreMatched():
+    """Words that every comment repeats are matched in windows of over 200 words,
+    which difflib treats as junk by default"""
+    old = signedThread(30)
+    new = old.replace(
+        "say so. " + signature + "\n::", "say so. " + signature + "\n::Yes, ", 1
+    )
+    new = new.replace("that the article", "that the the article", 1)
+
+    diff = wordDiff.diffRevisions(old, new, fastPath=False, hunkThreshold=0)
+
+    assert Counter(diff.addedWords) == Counter(["the", "::Yes,", "I"])
+    assert diff.deletedWords == ["::I"]
+
+
+def testWindowMatchesWholeDiff():
+    """Diffing the window between the common prefix and suffix gives the same words
+    as diffing the whole of both revisions"""
+    old = signedThread(30)
+    new = old.replace(reply, "I disagree. ", 1)
+    new = new[: -len(signature) - 1] + "Thanks. " + signature + "\n"
+
+    window = wordDiff.diffRevisions(old, new, hunkThreshold=0)
+    whole = wordDiff.diffRevisions(old, new, fastPath=False, hunkThreshold=0)
+
+    assert Counter(window.addedWords) == Counter(whole.addedWords)
+    assert Counter(window.deletedWords) == Counter(whole.deletedWords)
+    assert Counter(whole.addedWords) == Counter(["disagree.", "Thanks."])
+
+
+def testLongLineWithoutUniqueWordsIsFast():
+    """A window too long to match every word, on one line so that it isn't split
+    into hunks, is diffed in well under a second"""
+    rng = random.Random(0)
+    vocabulary = ["the", "a", "of", "and", "to", "(UTC)", "talk", "is"]
+    words = [rng.choice(vocabulary) for _ in range(40000)]
+    old = " ".join(words)
+    for _ in range(20):
+        words[rng.randrange(len(words))] = rng.choice(vocabulary)
+    new = " ".join(words)
+
+    start = time.perf_counter()
+    diff = wordDiff.diffRevisions(old, new)
+
+    assert time.perf_counter() - start < 2
+    assert len(diff.addedWords) <= len(words)
+
+
+def testFixturesMatchStoredReference():
+    """The diffs of the fixtures match the reference stored by diffBenchmark.py,
+    within the tolerances of its comparison"""
+    fixturesDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+    fixtures = diffBenchmark.loadFixtures(fixturesDir)
+    _, stored = diffBenchmark.loadReference(os.path.join(fixturesDir, "reference.json"))
+    reference = [stored[title] for title, _ in fixtures]
+
+    results, _, _, _ = diffBenchmark.runBackend(wordDiff.diffRevisions, fixtures)
+
+    assert [len(diffs) for diffs in results] == [len(diffs) for diffs in reference]
+    assert (
+        diffBenchmark.compare("python", results, reference, fixtures, 0.05, 0.05) == 0
+    )
+
+
+def testDiffCacheEvictsLeastRecentlyUsed():
+    """A full cache evicts the entry that was used least recently, and counts
+    hits and misses"""
+    cache = wordDiff.DiffCache(2)
+    cache.put(("a", "b"), 1)
+    cache.put(("b", "a"), 2)
+
+    assert cache.get(("a", "b")) == 1
+    cache.put(("b", "c"), 3)
+
+    assert cache.get(("b", "a")) is None
+    assert cache.get(("a", "b")) == 1
+    assert cache.get(("b", "c")) == 3
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def testDisabledDiffCache():
+    """A cache of size 0 keeps nothing and counts nothing"""
+    cache = wordDiff.DiffCache(0)
+    cache.put(("a", "b"), 1)
+
+    assert cache.get(("a", "b")) is None
+    assert not cache.entries
+    assert (cache.hits, cache.misses) == (0, 0)
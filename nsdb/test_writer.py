@@ -0,0 +1,261 @@
+"""
+Tests of the edit buffer and writer thread of writer.py, run with pytest from nsdb/.
+
+The edits are written to a SQLite database, and the rows and counts that reach it are
+checked through a second connection, which only sees committed transactions.
+"""
+import pytest
+
+import sqliteDatabase
+import writer
+
+columns = ("edit_id", "edit_date", "page_id", "user_table_id", "added")
+
+
+class DatabaseError(Exception):
+    """Error with the errno of a MySQL error"""
+
+    def __init__(self, errno: int):
+        super().__init__("Error %d" % errno)
+        self.errno = errno
+
+
+class FailingCursor:
+    """Cursor that raises an error instead of inserting edits the first failures
+    times, after the statements before them have run"""
+
+    def __init__(self, cursor, failures: int, errno: int):
+        self.cursor = cursor
+        self.failures = failures
+        self.errno = errno
+
+    def executemany(self, query, rows):
+        if query.startswith("INSERT INTO edit") and self.failures:
+            self.failures -= 1
+            raise DatabaseError(self.errno)
+
+        return self.cursor.executemany(query, rows)
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+
+def connect(tmp_path, autocommit: bool = True) -> sqliteDatabase.Connection:
+    """Returns a connection to the test database, created the first time"""
+    return sqliteDatabase.connect(str(tmp_path / "nsdb.sqlite"), autocommit)
+
+
+def addEdit(buffer: writer.EditBuffer, editId: int, name: str, added: str = "Hello"):
+    """Adds an edit of name to page 1 of the buffer, which addPage has added"""
+    key = buffer.users.addEdit(editId, name, "1")
+    buffer.add(columns, (editId, "2020-01-01 00:00:00", 1, key, added), "Talk:Test")
+
+
+def addPage(buffer: writer.EditBuffer, pageId: int, editIds: list):
+    """Adds a page with an edit of Editor for each of editIds and sets its edits"""
+    title = "Talk:Page %d" % pageId
+    buffer.addPage(pageId, 1, title, "test.xml")
+    for editId in editIds:
+        key = buffer.users.addEdit(1, "Editor", "1")
+        buffer.add(columns, (editId, "2020-01-01 00:00:00", pageId, key, "Hi"), title)
+    buffer.setPageEdits(len(editIds), title, "1")
+
+
+def selectAll(tmp_path, query: str) -> list:
+    """Returns the rows of a query as another connection sees them"""
+    database = connect(tmp_path)
+    cursor = database.cursor()
+    cursor.execute(query)
+    rows = cursor.fetchall()
+    database.close()
+
+    return rows
+
+
+def testFlushAtRowLimit(tmp_path):
+    """Edits are inserted once maxRows are held, and the rest when finished"""
+    database = connect(tmp_path)
+    buffer = writer.EditBuffer(database.cursor(), maxRows=3)
+    buffer.addPage(1, 1, "Talk:Test", "test.xml")
+
+    for editId in range(1, 8):
+        addEdit(buffer, editId, "Editor%d" % (editId % 2))
+
+    assert selectAll(tmp_path, "SELECT COUNT(*) FROM edit;") == [(6,)]
+    assert buffer.flushes == 2
+
+    buffer.finish()
+
+    assert selectAll(tmp_path, "SELECT edit_id FROM edit ORDER BY id;") == [
+        (editId,) for editId in range(1, 8)
+    ]
+    assert selectAll(
+        tmp_path, "SELECT username, talkpage_number_of_edits FROM user ORDER BY id;"
+    ) == [("Editor0", 3), ("Editor1", 4)]
+    assert (buffer.flushes, buffer.flushedRows) == (3, 7)
+
+
+def testFlushAtByteLimitCountsUtf8(tmp_path):
+    """The size of an edit is counted in bytes of UTF-8, so two edits of 60
+    two-byte characters reach a limit that 120 characters of ASCII don't"""
+    database = connect(tmp_path)
+    buffer = writer.EditBuffer(database.cursor(), maxBytes=300)
+    buffer.addPage(1, 1, "Talk:Test", "test.xml")
+
+    addEdit(buffer, 1, "Editor", "a" * 60)
+    addEdit(buffer, 2, "Editor", "a" * 60)
+    assert buffer.flushes == 0
+
+    addEdit(buffer, 3, "Editor", "é" * 60)
+    assert buffer.flushes == 1
+    addEdit(buffer, 4, "Editor", "é" * 60)
+    addEdit(buffer, 5, "Editor", "é" * 60)
+    assert buffer.flushes == 2
+
+    assert selectAll(tmp_path, "SELECT COUNT(*) FROM edit;") == [(5,)]
+
+
+def testRevertsInMemoryAndByUpdate(tmp_path):
+    """An edit reverted while it is held is inserted as reverted, one that has
+    already been inserted is updated"""
+    database = connect(tmp_path)
+    buffer = writer.EditBuffer(database.cursor(), maxRows=2)
+    buffer.addPage(1, 1, "Talk:Test", "test.xml")
+
+    addEdit(buffer, 1, "Editor")
+    addEdit(buffer, 2, "Vandal")
+    addEdit(buffer, 3, "Vandal")
+
+    buffer.markReverted(1)
+    buffer.markReverted(3)
+    buffer.finish()
+
+    assert selectAll(tmp_path, "SELECT edit_id, reverted FROM edit ORDER BY id;") == [
+        (1, 1),
+        (2, 0),
+        (3, 1),
+    ]
+    assert (buffer.revertedInMemory, buffer.revertedUpdates) == (1, 1)
+
+
+def testReplayAfterDeadlock(tmp_path, monkeypatch):
+    """A transaction rolled back by a deadlock is replayed from its first write, so
+    the users it upserted before the deadlock aren't counted twice"""
+    monkeypatch.setattr(writer.time, "sleep", lambda seconds: None)
+    database = connect(tmp_path, autocommit=False)
+    cursor = FailingCursor(database.cursor(), failures=1, errno=1213)
+    buffer = writer.EditBuffer(cursor, database=database, policy="page")
+
+    addPage(buffer, 1, [1, 2, 3])
+
+    assert buffer.replays == 1
+    assert buffer.commits == 1
+    assert selectAll(tmp_path, "SELECT COUNT(*) FROM edit;") == [(3,)]
+    assert selectAll(tmp_path, "SELECT number_of_edits FROM page;") == [(3,)]
+    assert selectAll(tmp_path, "SELECT talkpage_number_of_edits FROM user;") == [(3,)]
+
+
+def testReplayGivesUp(tmp_path, monkeypatch):
+    """Deadlocks that outlast the retries, and other errors, are raised and the
+    transaction isn't committed"""
+    monkeypatch.setattr(writer.time, "sleep", lambda seconds: None)
+    database = connect(tmp_path, autocommit=False)
+
+    cursor = FailingCursor(database.cursor(), failures=10, errno=1205)
+    buffer = writer.EditBuffer(cursor, database=database, policy="page", retries=2)
+    with pytest.raises(writer.FlushError):
+        addPage(buffer, 1, [1])
+    assert buffer.replays == 2
+    buffer.rollback()
+
+    cursor = FailingCursor(database.cursor(), failures=1, errno=1062)
+    buffer = writer.EditBuffer(cursor, database=database, policy="page")
+    with pytest.raises(writer.FlushError):
+        addPage(buffer, 1, [1])
+    assert buffer.replays == 0
+    buffer.rollback()
+
+    assert selectAll(tmp_path, "SELECT COUNT(*) FROM page;") == [(0,)]
+    assert selectAll(tmp_path, "SELECT COUNT(*) FROM user;") == [(0,)]
+
+
+@pytest.mark.parametrize(
+    "policy, visible",
+    [("statement", [2, 4, 6]), ("page", [2, 4, 6]), ("3", [0, 4, 4])],
+)
+def testCommitPoints(tmp_path, policy, visible):
+    """Pages are committed as a whole, each page or once at least a number of edits
+    have been written, and the rest when the buffer is finished"""
+    database = connect(tmp_path, autocommit=policy == "statement")
+    buffer = writer.EditBuffer(database.cursor(), database=database, policy=policy)
+
+    seen = []
+    for pageId in range(1, 4):
+        addPage(buffer, pageId, [pageId * 10, pageId * 10 + 1])
+        seen.append(selectAll(tmp_path, "SELECT COUNT(*) FROM edit;")[0][0])
+    buffer.finish()
+
+    assert seen == visible
+    assert selectAll(tmp_path, "SELECT COUNT(*) FROM edit;") == [(6,)]
+    assert buffer.uncommittedRows == 0
+
+
+def testAsyncWriterSkipsWritesAfterError():
+    """Writes after a failed one are skipped, its error is raised by the next wait
+    and drain forgets it"""
+    asyncWriter = writer.AsyncWriter(maxSize=2)
+    written = []
+
+    def fail():
+        raise ValueError("failed")
+
+    asyncWriter.submit(fail)
+    for i in range(5):
+        try:
+            asyncWriter.submit(lambda i=i: written.append(i))
+        except ValueError:
+            break
+    with pytest.raises(ValueError):
+        asyncWriter.wait()
+    assert written == []
+
+    asyncWriter.drain()
+    asyncWriter.submit(lambda: written.append("after"))
+    asyncWriter.wait()
+    asyncWriter.close()
+
+    assert written == ["after"]
+
+
+def testAsyncWriterRollbackDrainsFailedPage(tmp_path):
+    """A page whose edits can't be inserted by the writer thread is rolled back
+    as a whole, and the pages committed before it are kept"""
+    database = connect(tmp_path, autocommit=False)
+    cursor = FailingCursor(database.cursor(), failures=0, errno=1062)
+    asyncWriter = writer.AsyncWriter()
+    buffer = writer.EditBuffer(
+        cursor, database=database, policy="page", asyncWriter=asyncWriter
+    )
+
+    addPage(buffer, 1, [10, 11])
+    asyncWriter.wait()
+    cursor.failures = 1
+    with pytest.raises(writer.FlushError):
+        addPage(buffer, 2, [20, 21])
+        buffer.finish()
+    buffer.rollback()
+
+    addPage(buffer, 3, [30])
+    buffer.finish()
+    asyncWriter.close()
+
+    assert selectAll(tmp_path, "SELECT edit_id FROM edit ORDER BY id;") == [
+        (10,),
+        (11,),
+        (30,),
+    ]
+    assert selectAll(tmp_path, "SELECT page_id FROM page ORDER BY page_id;") == [
+        (1,),
+        (3,),
+    ]
+    assert selectAll(tmp_path, "SELECT talkpage_number_of_edits FROM user;") == [(3,)]
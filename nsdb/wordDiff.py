@@ -0,0 +1,481 @@
+"""
+This module computes the words added and deleted between two revisions of a page.
+
+It replaces the wdiff subprocess previously used by parse.py. Both sides of the diff
+are computed in a single pass over the revisions and nothing is written to disk.
+"""
+import re
+from bisect import bisect_left
+from collections import Counter, OrderedDict
+from difflib import SequenceMatcher
+from typing import List, NamedTuple, Tuple
+
+word = re.compile(r"\S+")
+
+# number of words on either side of a diff above which difflib may treat frequent
+# words as junk, matching every word is quadratic in a window without unique words
+autojunkWords = 2000
+
+# wdiff separates non-adjacent changes with a line of "=", parse.py strips those
+# lines which leaves a blank line between each change
+separator = "\n\n"
+
+
+class Tokens(NamedTuple):
+    """The words of a revision along with where each word starts and ends"""
+
+    words: List[str]
+    starts: List[int]
+    ends: List[int]
+
+
+def tokenize(text: str, start: int = 0, end: int = None) -> Tokens:
+    """Splits text, or the part of it between start and end, into whitespace
+    separated words, keeping their offsets in text"""
+    if end is None:
+        end = len(text)
+
+    matches = list(word.finditer(text, start, end))
+
+    return Tokens(
+        [match.group() for match in matches],
+        [match.start() for match in matches],
+        [match.end() for match in matches],
+    )
+
+
+class Diff(NamedTuple):
+    """The text exclusively in each revision along with the words it is made of"""
+
+    added: str
+    deleted: str
+    addedWords: List[str]
+    deletedWords: List[str]
+
+
+def collectChanges(
+    oldText: str,
+    oldTokens: Tokens,
+    newText: str,
+    newTokens: Tokens,
+    added: List[str],
+    deleted: List[str],
+    addedWords: List[str],
+    deletedWords: List[str],
+):
+    """Diffs the tokens of two revisions word by word and appends each change to the
+    lists of added and deleted text and words"""
+    if not oldTokens.words:
+        if newTokens.words:
+            added.append(newText[newTokens.starts[0] : newTokens.ends[-1]])
+            addedWords.extend(newTokens.words)
+        return
+    elif not newTokens.words:
+        deleted.append(oldText[oldTokens.starts[0] : oldTokens.ends[-1]])
+        deletedWords.extend(oldTokens.words)
+        return
+
+    # autojunk stops matching words that are frequent in a long window, such as "the"
+    # and the parts of signatures that every comment of a talk page repeats, but
+    # keeps windows that are too long to be split into hunks of lines fast
+    autojunk = max(len(oldTokens.words), len(newTokens.words)) > autojunkWords
+    matcher = SequenceMatcher(None, oldTokens.words, newTokens.words, autojunk=autojunk)
+
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+
+        if j2 > j1:
+            added.append(newText[newTokens.starts[j1] : newTokens.ends[j2 - 1]])
+            addedWords.extend(newTokens.words[j1:j2])
+        if i2 > i1:
+            deleted.append(oldText[oldTokens.starts[i1] : oldTokens.ends[i2 - 1]])
+            deletedWords.extend(oldTokens.words[i1:i2])
+
+
+def diffTokens(
+    oldText: str, oldTokens: Tokens, newText: str, newTokens: Tokens
+) -> Diff:
+    """Returns the text exclusively in the new and old revisions given their tokens
+
+    Each change is taken from the original text so whitespace within a change is
+    kept, and changes are joined in the same way as the output of wdiff.
+    """
+    added = []
+    deleted = []
+    addedWords = []
+    deletedWords = []
+
+    collectChanges(
+        oldText, oldTokens, newText, newTokens, added, deleted, addedWords, deletedWords
+    )
+
+    return Diff(
+        separator.join(added), separator.join(deleted), addedWords, deletedWords
+    )
+
+
+def splitLines(text: str, start: int, end: int) -> Tuple[List[str], List[int]]:
+    """Splits the part of text between start and end into lines, returning the lines
+    and the offset in text where each one starts, with a final offset of end"""
+    lines = text[start:end].splitlines(True)
+    offsets = [start]
+
+    for line in lines:
+        offsets.append(offsets[-1] + len(line))
+
+    return lines, offsets
+
+
+def uniqueAnchors(
+    a: List[str], b: List[str], alo: int, ahi: int, blo: int, bhi: int
+) -> List[Tuple[int, int]]:
+    """Returns the lines that occur exactly once in both a[alo:ahi] and b[blo:bhi],
+    keeping the longest run of them that is in the same order in both"""
+    positionsA = {}
+    positionsB = {}
+
+    # the position of lines that occur more than once is -1
+    for i in range(alo, ahi):
+        positionsA[a[i]] = -1 if a[i] in positionsA else i
+
+    for j in range(blo, bhi):
+        positionsB[b[j]] = -1 if b[j] in positionsB else j
+
+    pairs = sorted(
+        (i, positionsB[line])
+        for line, i in positionsA.items()
+        if i != -1 and positionsB.get(line, -1) != -1
+    )
+
+    # patience sort the positions in b to find their longest increasing subsequence
+    tops = []
+    topIndices = []
+    previous = [-1] * len(pairs)
+
+    for index, (_, j) in enumerate(pairs):
+        pile = bisect_left(tops, j)
+
+        if pile > 0:
+            previous[index] = topIndices[pile - 1]
+
+        if pile == len(tops):
+            tops.append(j)
+            topIndices.append(index)
+        else:
+            tops[pile] = j
+            topIndices[pile] = index
+
+    anchors = []
+    index = topIndices[-1] if topIndices else -1
+
+    while index != -1:
+        anchors.append(pairs[index])
+        index = previous[index]
+
+    anchors.reverse()
+
+    return anchors
+
+
+def patienceMatches(a: List[str], b: List[str]) -> List[Tuple[int, int]]:
+    """Returns the pairs of lines that are matched between a and b by patience diff
+
+    Equal lines at the start and end of a region are matched, then lines unique to
+    both sides anchor the region, which is split between the anchors and matched
+    again. Regions without unique lines are left unmatched."""
+    matches = []
+    regions = [(0, len(a), 0, len(b))]
+
+    while regions:
+        alo, ahi, blo, bhi = regions.pop()
+
+        while alo < ahi and blo < bhi and a[alo] == b[blo]:
+            matches.append((alo, blo))
+            alo += 1
+            blo += 1
+
+        while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+            ahi -= 1
+            bhi -= 1
+            matches.append((ahi, bhi))
+
+        if alo == ahi or blo == bhi:
+            continue
+
+        anchors = uniqueAnchors(a, b, alo, ahi, blo, bhi)
+
+        if not anchors:
+            continue
+
+        for i, j in anchors:
+            matches.append((i, j))
+            regions.append((alo, i, blo, j))
+            alo = i + 1
+            blo = j + 1
+
+        regions.append((alo, ahi, blo, bhi))
+
+    matches.sort()
+
+    return matches
+
+
+def diffHunks(
+    old: str, oldStart: int, oldEnd: int, new: str, newStart: int, newEnd: int
+) -> Diff:
+    """Returns the diff between the parts of two revisions by first matching their
+    lines with patience diff and then diffing word by word inside each hunk of
+    lines that didn't match
+
+    A word diff over a whole page is superlinear in its length, while the hunks of
+    a large talk page are usually a few lines long."""
+    oldLines, oldOffsets = splitLines(old, oldStart, oldEnd)
+    newLines, newOffsets = splitLines(new, newStart, newEnd)
+
+    added = []
+    deleted = []
+    addedWords = []
+    deletedWords = []
+
+    previousA = 0
+    previousB = 0
+
+    # a final match past the end of both revisions closes the last hunk
+    for i, j in patienceMatches(oldLines, newLines) + [(len(oldLines), len(newLines))]:
+        if i > previousA or j > previousB:
+            collectChanges(
+                old,
+                tokenize(old, oldOffsets[previousA], oldOffsets[i]),
+                new,
+                tokenize(new, newOffsets[previousB], newOffsets[j]),
+                added,
+                deleted,
+                addedWords,
+                deletedWords,
+            )
+
+        previousA = i + 1
+        previousB = j + 1
+
+    return Diff(
+        separator.join(added), separator.join(deleted), addedWords, deletedWords
+    )
+
+
+def commonPrefixLength(a: str, b: str) -> int:
+    """Returns the number of characters at the start of a and b that are the same
+
+    Compares halves of the remaining text at a time so the comparison runs in C
+    rather than a character at a time."""
+    low = 0
+    high = min(len(a), len(b))
+
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[low:middle] == b[low:middle]:
+            low = middle
+        else:
+            high = middle - 1
+
+    return low
+
+
+def commonSuffixLength(a: str, b: str, limit: int) -> int:
+    """Returns the number of characters at the end of a and b that are the same,
+    up to limit"""
+    low = 0
+    high = limit
+
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[len(a) - middle : len(a) - low] == b[len(b) - middle : len(b) - low]:
+            low = middle
+        else:
+            high = middle - 1
+
+    return low
+
+
+def isBoundary(text: str, index: int) -> bool:
+    """Returns whether no word of text spans across index"""
+    return (
+        index <= 0
+        or index >= len(text)
+        or text[index - 1].isspace()
+        or text[index].isspace()
+    )
+
+
+def changedWindow(old: str, new: str) -> Tuple[int, int]:
+    """Returns the length of the common prefix and suffix of two revisions, both
+    shortened so that they end on the boundary of a word in each revision"""
+    prefix = commonPrefixLength(old, new)
+
+    while not (isBoundary(old, prefix) and isBoundary(new, prefix)):
+        prefix -= 1
+
+    suffix = commonSuffixLength(old, new, min(len(old), len(new)) - prefix)
+
+    while suffix > 0 and not (
+        isBoundary(old, len(old) - suffix) and isBoundary(new, len(new) - suffix)
+    ):
+        suffix -= 1
+
+    return prefix, suffix
+
+
+def diffRevisions(
+    old: str,
+    new: str,
+    stats: Counter = None,
+    fastPath: bool = True,
+    hunkThreshold: int = 10000,
+) -> Diff:
+    """Returns the diff between two revisions
+
+    Most talk page edits add or remove text in one place and leave the rest of the
+    page alone. The common prefix and suffix of the revisions are found in linear
+    time and only the window between them is tokenized. If one side of the window
+    has no words the other side is the whole change, otherwise the window is
+    diffed word by word. Windows longer than hunkThreshold characters are split
+    into hunks by a line diff first.
+
+    Parameters
+    ----------
+    old : str - old revision
+    new : str - new revision
+    stats: Counter - counts how each diff was computed: "unchanged", "fastPath",
+      "window", "full" or "hunks"
+    fastPath: bool - whether to look for the common prefix and suffix, disable to
+      diff the whole of both revisions
+    hunkThreshold: int - number of characters in the window above which it is split
+      into hunks, 0 to always diff the window word by word
+    """
+    if stats is None:
+        stats = Counter()
+
+    if fastPath:
+        prefix, suffix = changedWindow(old, new)
+    else:
+        prefix, suffix = 0, 0
+
+    oldEnd = len(old) - suffix
+    newEnd = len(new) - suffix
+
+    oldChanged = word.search(old, prefix, oldEnd) is not None
+    newChanged = word.search(new, prefix, newEnd) is not None
+
+    if not oldChanged and not newChanged:
+        stats["unchanged"] += 1
+
+        return Diff("", "", [], [])
+    elif not oldChanged:
+        stats["fastPath"] += 1
+
+        newTokens = tokenize(new, prefix, newEnd)
+        added = new[newTokens.starts[0] : newTokens.ends[-1]]
+        return Diff(added, "", newTokens.words, [])
+    elif not newChanged:
+        stats["fastPath"] += 1
+
+        oldTokens = tokenize(old, prefix, oldEnd)
+        deleted = old[oldTokens.starts[0] : oldTokens.ends[-1]]
+        return Diff("", deleted, [], oldTokens.words)
+    elif hunkThreshold and (oldEnd - prefix) + (newEnd - prefix) > hunkThreshold:
+        stats["hunks"] += 1
+
+        return diffHunks(old, prefix, oldEnd, new, prefix, newEnd)
+    elif prefix or suffix:
+        stats["window"] += 1
+    else:
+        stats["full"] += 1
+
+    oldTokens = tokenize(old, prefix, oldEnd)
+    newTokens = tokenize(new, prefix, newEnd)
+
+    return diffTokens(old, oldTokens, new, newTokens)
+
+
+class DiffState:
+    """Holds the previous revision of a page so that each revision is diffed
+    against the one before it.
+
+    Create one per page and call diff() with each revision in order. Only the
+    words between the common prefix and suffix of two revisions are tokenized, so
+    the tokens of the previous revision are not kept."""
+
+    def __init__(self, stats: Counter = None):
+        self.text = ""
+        self.stats = Counter() if stats is None else stats
+
+    def advance(self, text: str):
+        """Makes text the previous revision without diffing it"""
+        self.text = text
+
+    def diff(self, text: str) -> Diff:
+        """Returns the diff between the previous revision and text, then makes text
+        the previous revision"""
+        result = diffRevisions(self.text, text, self.stats)
+
+        self.text = text
+
+        return result
+
+
+class DiffCache:
+    """Least recently used cache of results derived from a diff, keyed by the sha1
+    of the old and new revisions.
+
+    Counts hits and misses so the work saved on a partition can be reported."""
+
+    def __init__(self, maxSize: int = 256):
+        self.maxSize = maxSize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple[str, str]):
+        """Returns the cached value for key, or None if it isn't cached"""
+        if self.maxSize <= 0:
+            # a disabled cache doesn't count misses
+            return None
+
+        value = self.entries.get(key)
+
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+
+        return value
+
+    def put(self, key: Tuple[str, str], value):
+        """Caches value for key, evicting the least recently used entry if full"""
+        if self.maxSize <= 0:
+            return
+
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+
+        if len(self.entries) > self.maxSize:
+            self.entries.popitem(last=False)
+
+
+def wordDiff(old: str, new: str) -> Tuple[str, str]:
+    """Returns the diff between two revisions
+
+    Parameters
+    ----------
+    old : str - old revision
+    new : str - new revision
+
+    Returns
+    -------
+    added: str - all the text that is exclusively in the new revision
+    deleted: str - all the text that is exclusively in the old revision
+    """
+    diff = diffRevisions(old, new)
+
+    return diff.added, diff.deleted
@@ -0,0 +1,877 @@
+"""
+This module buffers the edits parse.py extracts and inserts them into the edit table
+many rows at a time, or writes them to files that loader.py loads in bulk.
+
+Each insert is a round trip to the database, and with autocommit a transaction of
+its own, so edits are inserted with executemany, which sends a single multi-row
+INSERT. The buffer is flushed at the end of each page and when it holds a
+configured number of rows or bytes.
+
+Reverts almost always undo recent revisions of the same page, so an edit that is
+reverted while it is still in the buffer is inserted as reverted, rather than
+inserted and then updated through the non-unique index on edit_id. Only edits that
+have already been written are updated.
+
+With autocommit every statement is a transaction of its own. Under the page policy
+the writes of each page are committed together instead, and under a number of
+edits the pages are committed once at least that many edits have been written, so
+a page is never committed in part. A transaction that InnoDB rolls back after a
+deadlock or a lock wait timeout is replayed from the writes of the buffer.
+
+Writes can be run by an AsyncWriter thread, so that the database works while the
+next edits are parsed.
+
+The users of the edits are counted in memory as well and upserted just before the
+edits are inserted, with one query for all of the users of a flush rather than one
+for each revision, which locks the rows of prolific users and bots far less often.
+The ids of their rows are kept in a cache of the process, so only users that haven't
+been seen recently are selected.
+
+A StagingBuffer writes the pages, edits, user counts and reverted edits of a
+partition to tab separated files instead, in the format of LOAD DATA, without a
+database connection. A DryRunBuffer writes the same rows to one file of JSON lines
+for --dryrun.
+"""
+import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# queries inserting edits, by their columns
+editQueries = {}
+
+# errors after which InnoDB has rolled back a transaction that can be replayed,
+# ER_LOCK_WAIT_TIMEOUT and ER_LOCK_DEADLOCK
+retryErrors = {1205, 1213}
+
+
+class FlushError(Exception):
+    """Raised when the edits of a page can't be inserted"""
+
+    def __init__(self, page: str, rows: int, error: Exception):
+        super().__init__(
+            "Failed to insert %d edits of page %s: %s" % (rows, page, error)
+        )
+        self.page = page
+        self.rows = rows
+        self.errno = getattr(error, "errno", None)
+
+
+def getEditQuery(columns: Tuple[str, ...]) -> str:
+    """Returns the query inserting an edit with the given columns"""
+    query = editQueries.get(columns)
+    if query is None:
+        query = "INSERT INTO edit (%s) VALUES (%s);" % (
+            ", ".join(columns),
+            ", ".join(["%s"] * len(columns)),
+        )
+        editQueries[columns] = query
+
+    return query
+
+
+def stringSize(value: str) -> int:
+    """Returns the number of bytes of a string in UTF-8, without encoding it when it
+    is ASCII, which str.isascii knows without reading the string"""
+    return len(value) if value.isascii() else len(value.encode("utf-8"))
+
+
+def rowSize(row: tuple) -> int:
+    """Returns roughly how many bytes a row adds to an INSERT"""
+    return sum(stringSize(value) if isinstance(value, str) else 8 for value in row)
+
+
+class EditBuffer:
+    """Edits waiting to be inserted into the edit table
+
+    Parameters
+    ----------
+    cursor: MySQLCursor - cursor the edits are inserted with
+    maxRows: int - number of edits at which the buffer is flushed, 1 to insert each
+      edit when it is added
+    maxBytes: int - size of the edits at which the buffer is flushed, which must be
+      below max_allowed_packet of the server
+    users: UserCounts - users of the edits, whose user_table_id is the key of the
+      user until they are flushed
+    database: MySQLConnection - connection that transactions are committed on, which
+      must not autocommit unless policy is "statement"
+    policy: str - "statement" to commit each statement, "page" to commit each page
+      or a number of edits after which the page they are on is committed
+    retries: int - times a transaction is replayed after a deadlock or a lock wait
+      timeout
+    asyncWriter: AsyncWriter - thread that runs the writes while parsing goes on,
+      they are run as they are made if None
+    """
+
+    def __init__(
+        self,
+        cursor,
+        maxRows: int = 1000,
+        maxBytes: int = 1 << 20,
+        users: "UserCounts" = None,
+        database=None,
+        policy: str = "statement",
+        retries: int = 3,
+        asyncWriter: "AsyncWriter" = None,
+    ):
+        self.cursor = cursor
+        self.maxRows = maxRows
+        self.maxBytes = maxBytes
+        self.users = users if users is not None else UserCounts(cursor)
+        self.database = database
+        self.policy = policy
+        self.retries = retries
+        self.asyncWriter = asyncWriter
+
+        self.columns = None
+        self.rows = []
+        self.size = 0
+        self.page = None
+
+        # ids of the edits in the buffer and of those of them that were reverted
+        self.editIds = set()
+        self.reverted = set()
+
+        # writes of the transaction that hasn't been committed yet, and its edits
+        # as counted when they are submitted, on the thread that decides to commit
+        self.writes = []
+        self.uncommittedRows = 0
+
+        self.flushes = 0
+        self.flushedRows = 0
+        self.revertedInMemory = 0
+        self.revertedUpdates = 0
+        self.commits = 0
+        self.replays = 0
+
+    def add(self, columns: Tuple[str, ...], row: tuple, page: str):
+        """Adds an edit of a page, flushing the buffer if it is full
+
+        Parameters
+        ----------
+        columns: Tuple[str, ...] - columns of the edit table the row fills
+        row: tuple - value of each column
+        page: str - title of the page of the edit, reported if it can't be inserted
+        """
+        if self.rows and columns != self.columns:
+            self.flush()
+        self.columns = columns
+
+        self.rows.append(row)
+        self.editIds.add(row[columns.index("edit_id")])
+        self.size += rowSize(row)
+        self.page = page
+
+        if len(self.rows) >= self.maxRows or self.size >= self.maxBytes:
+            self.flush()
+
+    def flush(self):
+        """Inserts the buffered edits"""
+        counts = self.users.takeCounts()
+
+        if not self.rows:
+            if counts:
+                self.run(lambda: self.users.upsert(counts))
+            return
+
+        columns = self.columns + ("reverted",)
+        rows = [row + (self.isReverted(row),) for row in self.rows]
+        page = self.page
+
+        def write():
+            try:
+                self.writeEdits(columns, rows, counts)
+            except Exception as e:
+                raise FlushError(page, len(rows), e) from e
+
+        self.run(write, len(rows))
+
+        self.flushes += 1
+        self.flushedRows += len(self.rows)
+
+        self.clear()
+
+    def writeEdits(self, columns: Tuple[str, ...], rows: List[tuple], counts: list):
+        """Upserts the counts of users and inserts edits with the ids of their users"""
+        self.users.upsert(counts)
+
+        index = columns.index("user_table_id")
+        userIds = self.users.resolve(row[index] for row in rows)
+
+        missing = {row[index] for row in rows} - set(userIds)
+        if missing:
+            raise LookupError(
+                "No id in the user table for %s"
+                % ", ".join("%s %s" % key for key in sorted(missing))
+            )
+
+        rows = [row[:index] + (userIds[row[index]],) + row[index + 1 :] for row in rows]
+
+        self.cursor.executemany(getEditQuery(columns), rows)
+
+    def clear(self):
+        self.rows = []
+        self.size = 0
+        self.editIds = set()
+        self.reverted = set()
+
+    def isReverted(self, row: tuple) -> bool:
+        return row[self.columns.index("edit_id")] in self.reverted
+
+    def addPage(self, pageId: int, namespace: int, title: str, fileName: str):
+        """Inserts a page if it isn't in the page table"""
+        query = """INSERT IGNORE INTO page (page_id, namespace, title, file_name)
+                VALUES (%s, %s, %s, %s)"""
+        self.run(
+            lambda: self.cursor.execute(query, (pageId, namespace, title, fileName))
+        )
+
+    def setPageEdits(self, edits: int, title: str, namespace: str):
+        """Flushes the edits of a page, sets its number of edits and commits the
+        page if the policy says so"""
+        self.flush()
+
+        query = """UPDATE page
+                SET number_of_edits = %s 
+                WHERE title=%s
+                AND namespace = %s;"""
+        self.run(lambda: self.cursor.execute(query, (edits, title, namespace)))
+
+        if self.policy == "page" or (
+            self.policy.isdigit() and self.uncommittedRows >= int(self.policy)
+        ):
+            self.commit()
+
+    def markReverted(self, editId: int):
+        """Marks an edit as reverted, in the buffer if it hasn't been written yet"""
+        if editId in self.editIds:
+            self.reverted.add(editId)
+            self.revertedInMemory += 1
+        else:
+            self.updateReverted(editId)
+            self.revertedUpdates += 1
+
+    def updateReverted(self, editId: int):
+        """Marks an edit that has already been written as reverted"""
+        query = """UPDATE edit
+                SET reverted = True
+                WHERE edit_id = %s;"""
+        self.run(lambda: self.cursor.execute(query, (editId,)))
+
+    def run(self, write: Callable[[], None], rows: int = 0):
+        """Runs a write of rows edits, on the thread of asyncWriter if there is one"""
+        self.uncommittedRows += rows
+
+        if self.asyncWriter is None:
+            self.runNow(write)
+        else:
+            self.asyncWriter.submit(lambda: self.runNow(write))
+
+    def runNow(self, write: Callable[[], None]):
+        """Runs a write, which is replayed with the rest of its transaction if the
+        transaction is rolled back by a deadlock or a lock wait timeout
+
+        Each statement is its own transaction under the statement policy, and a
+        write may be several statements, so those are never replayed.
+        """
+        if self.policy == "statement":
+            write()
+            return
+
+        self.writes.append(write)
+
+        try:
+            write()
+        except Exception as e:
+            if getattr(e, "errno", None) not in retryErrors:
+                raise
+
+            self.replay()
+
+    def replay(self):
+        """Rolls back the transaction and runs its writes again"""
+        for attempt in range(1, self.retries + 1):
+            self.database.rollback()
+            self.users.rollback()
+            self.replays += 1
+
+            time.sleep(0.1 * 2**attempt)
+
+            try:
+                for write in self.writes:
+                    write()
+
+                return
+            except Exception as e:
+                if getattr(e, "errno", None) not in retryErrors:
+                    raise
+                if attempt == self.retries:
+                    raise
+
+    def commit(self):
+        """Commits the writes since the last commit, once they have been run"""
+        self.uncommittedRows = 0
+
+        if self.asyncWriter is None:
+            self.commitNow()
+        else:
+            self.asyncWriter.submit(self.commitNow)
+
+    def commitNow(self):
+        """Commits on this thread, which asyncWriter must not be running writes
+        on"""
+        if self.database is not None and self.policy != "statement":
+            self.database.commit()
+
+        if self.writes:
+            self.commits += 1
+
+        self.writes = []
+        self.users.commit()
+
+    def rollback(self):
+        """Discards the held edits and the writes since the last commit, so that a
+        failed partition doesn't leave part of a page in the database"""
+        if self.asyncWriter is not None:
+            self.asyncWriter.drain()
+
+        if self.database is not None and self.policy != "statement":
+            self.database.rollback()
+
+        self.writes = []
+        self.uncommittedRows = 0
+        self.users.rollback()
+        self.users.users = {}
+        self.clear()
+
+    def finish(self):
+        """Flushes the buffer and commits at the end of a partition, waiting for
+        the writes to be run"""
+        self.flush()
+        self.commit()
+
+        if self.asyncWriter is not None:
+            self.asyncWriter.wait()
+
+
+class AsyncWriter(threading.Thread):
+    """Thread that runs the writes of a parse process, so that the next edits are
+    parsed and diffed while the database writes the last ones
+
+    Writes are queued in the order they are made and run one at a time. The queue is
+    bounded, so parsing waits for the database when it falls behind. Once a write
+    fails the rest are skipped and the error is raised in the parse thread by the
+    next submit or wait.
+
+    Parameters
+    ----------
+    maxSize: int - number of writes that can wait in the queue
+    """
+
+    def __init__(self, maxSize: int = 16):
+        super().__init__(daemon=True)
+        self.queue = queue.Queue(maxSize)
+        self.error = None
+
+        self.writes = 0
+        self.maxDepth = 0
+        self.blockedSeconds = 0
+        self.writeSeconds = 0
+        self.maxWriteSeconds = 0
+
+        self.start()
+
+    def submit(self, write: Callable[[], None]):
+        """Queues a write, waiting while the queue is full"""
+        self.raiseError()
+
+        if self.queue.full():
+            start = time.perf_counter()
+            self.queue.put(write)
+            self.blockedSeconds += time.perf_counter() - start
+        else:
+            self.queue.put(write)
+
+        self.maxDepth = max(self.maxDepth, self.queue.qsize())
+
+    def run(self):
+        while True:
+            write = self.queue.get()
+            if write is None:
+                self.queue.task_done()
+                return
+
+            if self.error is None:
+                start = time.perf_counter()
+                try:
+                    write()
+                except Exception as e:
+                    self.error = e
+
+                elapsed = time.perf_counter() - start
+                self.writes += 1
+                self.writeSeconds += elapsed
+                self.maxWriteSeconds = max(self.maxWriteSeconds, elapsed)
+
+            self.queue.task_done()
+
+    def raiseError(self):
+        if self.error is not None:
+            raise self.error
+
+    def drain(self):
+        """Waits until the queued writes have been run or skipped, ignoring errors"""
+        self.queue.join()
+        self.error = None
+
+    def wait(self):
+        """Waits until the queued writes have been run and raises their error"""
+        self.queue.join()
+        self.raiseError()
+
+    def close(self):
+        """Stops the thread once the queued writes have been run or skipped"""
+        self.queue.put(None)
+        self.join()
+
+
+def decode(value) -> str:
+    """Returns a string read from a binary column as text"""
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode("utf-8")
+
+    return value
+
+
+class UserIdCache:
+    """Least recently used cache of the ids of rows of the user table, keyed by the
+    unique column of a user and the name in it.
+
+    Counts hits and misses so the queries saved on a partition can be reported."""
+
+    def __init__(self, maxSize: int = 100000):
+        self.maxSize = maxSize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple[str, str]) -> int:
+        """Returns the id of the user with key, or None if it isn't cached"""
+        value = self.entries.get(key)
+
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+
+        return value
+
+    def put(self, key: Tuple[str, str], value: int):
+        """Caches the id of a user, evicting the least recently used one if full"""
+        if self.maxSize <= 0:
+            return
+
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+
+        if len(self.entries) > self.maxSize:
+            self.entries.popitem(last=False)
+
+    def remove(self, key: Tuple[str, str]):
+        self.entries.pop(key, None)
+
+
+# the user ids of this process, kept between the partitions it parses
+userIdCache = None
+
+
+def getUserIdCache(maxSize: int) -> UserIdCache:
+    """Returns the user id cache of this process with at most maxSize users"""
+    global userIdCache
+
+    if userIdCache is None:
+        userIdCache = UserIdCache(maxSize)
+    elif userIdCache.maxSize != maxSize:
+        userIdCache.maxSize = maxSize
+        while len(userIdCache.entries) > max(maxSize, 0):
+            userIdCache.entries.popitem(last=False)
+
+    return userIdCache
+
+
+class UserCounts:
+    """Edits and reverted edits of users waiting to be added to the user table,
+    which are upserted together instead of once for each revision
+
+    Users are keyed by the unique column they are found by, their username or the IP
+    address of anonymous users, and the name in it.
+
+    Parameters
+    ----------
+    cursor: MySQLCursor - cursor the users are upserted with
+    cache: UserIdCache - ids of users that are already known, none are kept if None
+    """
+
+    # the columns of a row of counts, as returned by takeCounts
+    columns = (
+        "user_id",
+        "username",
+        "ip_address",
+        "namespaces",
+        "number_of_edits",
+        "reverted_edits",
+        "talkpage_number_of_edits",
+        "talkpage_reverted_edits",
+    )
+
+    counters = """
+        ON DUPLICATE KEY
+        UPDATE
+            namespaces = CONCAT_WS(',', namespaces, NULLIF(VALUES(namespaces), '')),
+            number_of_edits = number_of_edits + VALUES(number_of_edits),
+            reverted_edits = reverted_edits + VALUES(reverted_edits),
+            talkpage_number_of_edits =
+                talkpage_number_of_edits + VALUES(talkpage_number_of_edits),
+            talkpage_reverted_edits =
+                talkpage_reverted_edits + VALUES(talkpage_reverted_edits);"""
+
+    registeredQuery = """INSERT INTO user
+        (user_id, username, namespaces, number_of_edits, reverted_edits,
+            talkpage_number_of_edits, talkpage_reverted_edits)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)""" + counters
+
+    anonymousQuery = """INSERT INTO user
+        (ip_address, namespaces, number_of_edits, reverted_edits,
+            talkpage_number_of_edits, talkpage_reverted_edits)
+        VALUES (%s, %s, %s, %s, %s, %s)""" + counters
+
+    def __init__(self, cursor, cache: UserIdCache = None):
+        self.cursor = cursor
+        self.cache = cache if cache is not None else UserIdCache(0)
+
+        # user id, edits, reverted edits, talk page edits, reverted talk page edits
+        # and namespaces by key
+        self.users = {}
+
+        # keys of the ids cached since the last commit
+        self.uncommitted = set()
+
+        self.flushes = 0
+        self.flushedUsers = 0
+
+    def getUser(self, userId: int, name: str) -> Tuple[Tuple[str, str], list]:
+        """Returns the key and counts of a user, where userId is None or -1 for
+        anonymous users"""
+        if userId is None or userId == -1:
+            key = ("ip_address", name)
+        else:
+            key = ("username", name)
+
+        user = self.users.get(key)
+        if user is None:
+            user = [userId, 0, 0, 0, 0, set()]
+            self.users[key] = user
+
+        return key, user
+
+    def addEdit(self, userId: int, name: str, namespace: str) -> Tuple[str, str]:
+        """Counts a talk page edit of a user in a namespace and returns the key of
+        the user, which flush maps to the id of their row"""
+        key, user = self.getUser(userId, name)
+        user[3] += 1
+        user[5].add(namespace)
+
+        return key
+
+    def addReverted(self, userId: int, name: str):
+        """Counts a reverted talk page edit of a user"""
+        _, user = self.getUser(userId, name)
+        user[4] += 1
+
+    def addCounts(
+        self, userId: int, name: str, namespace: str, edits: int, reverted: int
+    ):
+        """Counts the edits and reverted edits of a user on a page of a namespace
+        that isn't parsed in detail"""
+        _, user = self.getUser(userId, name)
+        user[1] += edits
+        user[2] += reverted
+        user[5].add(namespace)
+
+    def takeCounts(self) -> List[tuple]:
+        """Returns the counts of the users as rows of columns, sorted by their key,
+        and starts counting again
+
+        Rows are locked in the order of the unique keys when they are upserted, so
+        partitions parsed in parallel lock the users they share in the same order.
+        """
+        rows = []
+        for (column, name), user in sorted(self.users.items()):
+            userId, edits, reverted, talkpageEdits, talkpageReverted, namespaces = user
+            row = (
+                ",".join(sorted(namespaces)),
+                edits,
+                reverted,
+                talkpageEdits,
+                talkpageReverted,
+            )
+
+            if column == "username":
+                rows.append((userId, name, None) + row)
+            else:
+                rows.append((None, None, name) + row)
+
+        if rows:
+            self.flushes += 1
+            self.flushedUsers += len(rows)
+
+        self.users = {}
+
+        return rows
+
+    def flush(self, keys: Iterable[Tuple[str, str]] = ()) -> Dict[Tuple[str, str], int]:
+        """Upserts the counted users and returns the ids of the rows of the users
+        with keys by their key"""
+        self.upsert(self.takeCounts())
+
+        return self.resolve(keys)
+
+    def upsert(self, rows: List[tuple]):
+        """Adds rows of counts from takeCounts to the user table"""
+        registered = [(row[0], row[1]) + row[3:] for row in rows if row[1] is not None]
+        anonymous = [row[2:] for row in rows if row[1] is None]
+
+        if registered:
+            self.cursor.executemany(self.registeredQuery, registered)
+        if anonymous:
+            self.cursor.executemany(self.anonymousQuery, anonymous)
+
+    def resolve(self, keys: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], int]:
+        """Returns the ids of the rows of the users with keys by their key, which
+        must have been upserted"""
+        userIds = {}
+        missing = []
+        for key in set(keys):
+            userTableId = self.cache.get(key)
+            if userTableId is None:
+                missing.append(key)
+            else:
+                userIds[key] = userTableId
+
+        for key, userTableId in self.selectIds(missing).items():
+            userIds[key] = userTableId
+            self.cache.put(key, userTableId)
+            self.uncommitted.add(key)
+
+        return userIds
+
+    def commit(self):
+        self.uncommitted = set()
+
+    def rollback(self):
+        """Forgets the ids cached since the last commit, as users inserted since
+        then get new ids when they are inserted again"""
+        for key in self.uncommitted:
+            self.cache.remove(key)
+
+        self.uncommitted = set()
+
+    def selectIds(self, keys: List[Tuple[str, str]]) -> Dict[Tuple[str, str], int]:
+        """Returns the ids of the rows of users by their key, with one query for
+        each unique column"""
+        userIds = {}
+        for column in ("username", "ip_address"):
+            names = [name for keyColumn, name in keys if keyColumn == column]
+            if not names:
+                continue
+
+            query = "SELECT id, %s FROM user WHERE %s IN (%s);" % (
+                column,
+                column,
+                ", ".join(["%s"] * len(names)),
+            )
+            self.cursor.execute(query, names)
+
+            for userTableId, name in self.cursor.fetchall():
+                userIds[(column, decode(name))] = userTableId
+
+        return userIds
+
+
+# MySQL's escapes of LOAD DATA, NULL is written as \\N
+tsvEscapes = str.maketrans(
+    {"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r", "\0": "\\0", "\x1a": "\\Z"}
+)
+
+
+def tsvValue(value) -> str:
+    """Returns a value as a field of a tab separated file for LOAD DATA"""
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, float):
+        return repr(value)
+
+    return str(value).translate(tsvEscapes)
+
+
+class StagingBuffer(EditBuffer):
+    """Writes the rows of a partition to tab separated files in stagingDir/partition
+    for loader.py instead of inserting them
+
+    Each file starts with a line of its columns. Edits have the username or IP
+    address of their user instead of user_table_id, which loader.py looks up once
+    the users are merged, and edits that were reverted once they had been written
+    are listed in reverted.tsv. A file named done is written once the partition has been
+    parsed, so loader.py never loads a partition that is still being written.
+
+    Parameters
+    ----------
+    stagingDir: str - directory of the staging files of every partition
+    partitionName: str - file name of the partition
+    maxRows: int - number of edits held before they are written
+    maxBytes: int - size of the edits held before they are written
+    """
+
+    pageColumns = ("page_id", "namespace", "title", "file_name", "number_of_edits")
+
+    def __init__(
+        self,
+        stagingDir: str,
+        partitionName: str,
+        maxRows: int = 1000,
+        maxBytes: int = 1 << 20,
+    ):
+        super().__init__(None, maxRows, maxBytes)
+
+        self.directory = os.path.join(stagingDir, partitionName)
+        if os.path.exists(os.path.join(self.directory, "loaded")):
+            raise FileExistsError(
+                "Partition %s has already been loaded from %s"
+                % (partitionName, self.directory)
+            )
+
+        os.makedirs(self.directory, exist_ok=True)
+        if os.path.exists(os.path.join(self.directory, "done")):
+            os.remove(os.path.join(self.directory, "done"))
+
+        self.files = {}
+        for table in ("edit", "page", "user", "reverted"):
+            path = os.path.join(self.directory, table + ".tsv")
+            self.files[table] = open(path, "w", encoding="utf-8", newline="")
+
+        self.writeRow("page", self.pageColumns)
+        self.writeRow("user", UserCounts.columns)
+        self.writeRow("reverted", ("edit_id",))
+
+        self.editColumns = None
+
+        # pages waiting for their number of edits, by title and namespace
+        self.pages = {}
+
+    def writeRow(self, table: str, row: tuple):
+        self.files[table].write("\t".join(map(tsvValue, row)) + "\n")
+
+    def flush(self):
+        """Writes the held edits and the counts of users"""
+        for row in self.users.takeCounts():
+            self.writeRow("user", row)
+
+        if not self.rows:
+            return
+
+        index = self.columns.index("user_table_id")
+        columns = self.columns[:index] + self.columns[index + 1 :]
+        if self.editColumns is None:
+            self.editColumns = columns
+            self.writeRow("edit", columns + ("reverted", "username", "ip_address"))
+        elif columns != self.editColumns:
+            raise ValueError(
+                "The columns of the edits of page %s differ from the earlier edits"
+                % self.page
+            )
+
+        for row in self.rows:
+            column, name = row[index]
+            user = (name, None) if column == "username" else (None, name)
+            reverted = (self.isReverted(row),)
+            self.writeRow("edit", row[:index] + row[index + 1 :] + reverted + user)
+
+        self.flushes += 1
+        self.flushedRows += len(self.rows)
+
+        self.clear()
+
+    def addPage(self, pageId: int, namespace: int, title: str, fileName: str):
+        self.pages[(title, str(namespace))] = (pageId, namespace, title, fileName)
+
+    def setPageEdits(self, edits: int, title: str, namespace: str):
+        self.flush()
+
+        page = self.pages.pop((title, str(namespace)))
+        self.writeRow("page", page + (edits,))
+
+    def updateReverted(self, editId: int):
+        self.writeRow("reverted", (editId,))
+
+    def finish(self):
+        """Writes the held rows and marks the partition as ready to be loaded"""
+        self.flush()
+
+        for file in self.files.values():
+            file.close()
+
+        open(os.path.join(self.directory, "done"), "w").close()
+
+
+class DryRunBuffer(StagingBuffer):
+    """Writes the rows that a partition would have written to the database to a file
+    of JSON lines, for dry runs
+
+    Each line is a row of a table, such as {"table": "edit", "row": {...}}, with the
+    same rows as the files of a StagingBuffer. The file is opened once and written
+    through a large buffer, so that dry runs measure the time spent parsing.
+
+    Parameters
+    ----------
+    path: str - file the rows are written to
+    maxRows: int - number of edits held before they are written
+    maxBytes: int - size of the edits held before they are written
+    """
+
+    def __init__(self, path: str, maxRows: int = 1000, maxBytes: int = 1 << 20):
+        EditBuffer.__init__(self, None, maxRows, maxBytes)
+
+        self.path = path
+        self.file = open(path, "w", encoding="utf-8", buffering=1 << 20)
+
+        # columns of each table, the first row StagingBuffer writes to it
+        self.headers = {}
+        self.records = 0
+
+        self.writeRow("page", self.pageColumns)
+        self.writeRow("user", UserCounts.columns)
+        self.writeRow("reverted", ("edit_id",))
+
+        self.editColumns = None
+        self.pages = {}
+
+    def writeRow(self, table: str, row: tuple):
+        columns = self.headers.get(table)
+        if columns is None:
+            self.headers[table] = row
+            return
+
+        record = {"table": table, "row": dict(zip(columns, row))}
+        self.file.write(json.dumps(record, default=str) + "\n")
+        self.records += 1
+
+    def finish(self):
+        """Writes the held rows and closes the file"""
+        self.flush()
+        self.file.close()
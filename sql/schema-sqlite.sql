@@ -0,0 +1,124 @@
+-- The tables of schema.sql for SQLite, see nsdb/sqliteDatabase.py
+-- A new database is created with this schema when it is first opened, delete the
+-- database file to start again.
+-- SQLite stores unsigned and sized integers as INTEGER, decimals as REAL and
+-- datetimes as text. The namespaces SET is text kept by the user_namespaces trigger
+-- and the status enum is text with a CHECK. Timestamps of partitions are NULL until
+-- they are set rather than '0000-00-00 00:00:00'.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS user (
+    id INTEGER PRIMARY KEY,
+    user_id int DEFAULT NULL,
+    username varchar(255) DEFAULT NULL UNIQUE,
+    ip_address varbinary(255) DEFAULT NULL UNIQUE,
+    confirmed tinyint(1) DEFAULT NULL,
+    autoconfirmed tinyint(1) DEFAULT NULL,
+    user_special tinyint(1) DEFAULT NULL,
+    bot tinyint(1) DEFAULT NULL,
+    blocked tinyint(1) DEFAULT NULL,
+    paid tinyint(1) DEFAULT NULL,
+    user_page tinyint(1) DEFAULT NULL,
+    user_talkpage tinyint(1) DEFAULT NULL,
+    number_of_edits int unsigned NOT NULL DEFAULT 0,
+    reverted_edits int unsigned DEFAULT 0,
+    talkpage_number_of_edits int unsigned NOT NULL DEFAULT 0,
+    talkpage_reverted_edits int unsigned DEFAULT 0,
+    namespaces varchar(255) NOT NULL DEFAULT ''
+);
+
+CREATE INDEX IF NOT EXISTS userid_idx ON user (user_id);
+
+-- keeps namespaces as a MySQL SET, without duplicates and in the order of its values
+CREATE TRIGGER IF NOT EXISTS user_namespaces
+AFTER UPDATE OF namespaces ON user
+WHEN NEW.namespaces != NAMESPACE_SET(NEW.namespaces)
+BEGIN
+    UPDATE user SET namespaces = NAMESPACE_SET(NEW.namespaces) WHERE id = NEW.id;
+END;
+
+CREATE TABLE IF NOT EXISTS page (
+    page_id INTEGER PRIMARY KEY,
+    namespace smallint NOT NULL,
+    title varchar(255) NOT NULL,
+    file_name varchar(85) NOT NULL,
+    number_of_edits int unsigned NOT NULL DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS title_idx ON page (title);
+
+CREATE TABLE IF NOT EXISTS edit (
+    id INTEGER PRIMARY KEY,
+    edit_id int DEFAULT NULL,
+    edit_date DATETIME NOT NULL,
+    page_id int DEFAULT NULL REFERENCES page (page_id),
+    user_table_id int unsigned NOT NULL REFERENCES user (id),
+    added text,
+    deleted text,
+    added_sentiment REAL DEFAULT NULL,
+    deleted_sentiment REAL DEFAULT NULL,
+    added_length MEDIUMINT,
+    deleted_length MEDIUMINT,
+    blanking tinyint(1) DEFAULT NULL,
+    comment_copyedit tinyint(1) DEFAULT NULL,
+    comment_length tinyint(1) DEFAULT NULL,
+    comment_personal_life tinyint(1) DEFAULT NULL,
+    comment_special_chars REAL DEFAULT NULL,
+    del_words mediumint DEFAULT NULL,
+    del_avg_word_length REAL DEFAULT NULL,
+    ins_avg_word_length REAL DEFAULT NULL,
+    ins_capitalization REAL DEFAULT NULL,
+    ins_digits REAL DEFAULT NULL,
+    ins_external_link smallint DEFAULT NULL,
+    ins_internal_link smallint DEFAULT NULL,
+    ins_longest_character_sequence smallint DEFAULT NULL,
+    ins_longest_inserted_word smallint DEFAULT NULL,
+    ins_pronouns REAL DEFAULT NULL,
+    ins_special_chars REAL DEFAULT NULL,
+    ins_vulgarity tinyint(1) DEFAULT NULL,
+    ins_whitespace REAL DEFAULT NULL,
+    reverted tinyint(1) DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS user_idx ON edit (user_table_id);
+
+CREATE INDEX IF NOT EXISTS page_idx ON edit (page_id);
+
+CREATE INDEX IF NOT EXISTS editid_idx ON edit (edit_id);
+
+CREATE INDEX IF NOT EXISTS editdate_idx ON edit (edit_date);
+
+CREATE TABLE IF NOT EXISTS partition (
+    id INTEGER PRIMARY KEY,
+    file_name varchar(85) NOT NULL,
+    status text NOT NULL DEFAULT 'todo' CHECK (status IN ('todo', 'running',
+        'failed', 'restarted', 'failed again', 'done', 'cleaned')),
+    error text,
+    start_time_1 TIMESTAMP NULL DEFAULT NULL,
+    end_time_1 TIMESTAMP NULL DEFAULT NULL,
+    start_time_2 TIMESTAMP NULL DEFAULT NULL,
+    end_time_2 TIMESTAMP NULL DEFAULT NULL
+);
+
+CREATE TABLE IF NOT EXISTS user_time_stats (
+    id INTEGER PRIMARY KEY,
+    min_time INT UNSIGNED NULL DEFAULT NULL,
+    avg_time INT UNSIGNED NULL DEFAULT NULL,
+    max_time INT UNSIGNED NULL DEFAULT NULL,
+    duration INT UNSIGNED NULL DEFAULT NULL
+);
+
+CREATE TABLE IF NOT EXISTS backfill (
+    job varchar(255) NOT NULL PRIMARY KEY,
+    last_id int unsigned NOT NULL DEFAULT 0,
+    updated TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TRIGGER IF NOT EXISTS backfill_updated
+AFTER UPDATE OF last_id ON backfill
+BEGIN
+    UPDATE backfill SET updated = CURRENT_TIMESTAMP WHERE job = NEW.job;
+END;
+
+COMMIT;
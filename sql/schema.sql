@@ -11,6 +11,8 @@ DROP TABLE IF EXISTS partition;
 
 DROP TABLE IF EXISTS user_time_stats;
 
+DROP TABLE IF EXISTS backfill;
+
 CREATE TABLE user (
     id int unsigned NOT NULL AUTO_INCREMENT,
     user_id int DEFAULT NULL,
@@ -72,7 +74,9 @@ CREATE TABLE edit (
     comment_special_chars decimal(4, 4) DEFAULT NULL,
     -- del_bias mediumint DEFAULT NULL,
     del_words mediumint DEFAULT NULL,
+    del_avg_word_length decimal(7, 2) DEFAULT NULL,
     -- ins_bias decimal(4, 4) DEFAULT NULL,
+    ins_avg_word_length decimal(7, 2) DEFAULT NULL,
     ins_capitalization decimal(4, 4) DEFAULT NULL,
     -- ins_compressibility decimal(4, 4) DEFAULT NULL,
     ins_digits decimal(4, 4) DEFAULT NULL,
@@ -122,3 +126,10 @@ CREATE TABLE user_time_stats (
     duration INT UNSIGNED NULL DEFAULT NULL,
     PRIMARY KEY (id)
 );
+
+CREATE TABLE backfill (
+    job varchar(255) NOT NULL,
+    last_id int unsigned NOT NULL DEFAULT '0',
+    updated timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (job)
+);